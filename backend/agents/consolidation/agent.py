@@ -1,14 +1,24 @@
+from backend.utils.accounting import record_llm_call
 from backend.utils.classes import *
-from backend.utils.llm import LLM
+from backend.utils.chunk_registry import chunk_registries
+from backend.utils.events import event_broker, event_channel
+from backend.utils.llm import LLM, ModelClients, call_deadline, call_with_retries, log_usage, token_usage
+from backend.utils.metrics import observe_first_token, observe_llm_call, timed_node
+from backend.utils.prompt_budget import PromptBuilder, PROMPT_BUDGET_SYNTHESIS_RESULTS, acount_tokens
+from backend.utils.scheduler import llm_scheduler, LLM_OUTPUT_TOKEN_ESTIMATE, PRIORITY_SYNTHESIS
 import backend.agents.consolidation.prompts as prompts
+import asyncio
 import time
 
 class Consolidate():
+    def __init__(self, clients: ModelClients | None = None):
+        self.__clients = clients if clients is not None else LLM.default_clients()
 
+    @timed_node("consolidate_results")
     async def consolidate_results(self,state: MainState) -> MainState:
         """Consolidate results from all research agents"""
         
-        await self.__push_updates(message_source="Consolidation Agent", push_update= "Consolidating results from all the research agents")
+        await self.__push_updates(state, message_source="Consolidation Agent", push_update= "Consolidating results from all the research agents")
         
         # The research_outputs are automatically collected via the Annotated field
         # These will be a list of dictionaries with taxonomy and vetted_results
@@ -19,7 +29,9 @@ class Consolidate():
             "type": "consolidation",
             "details": {
                 "num_taxonomies": len(state["taxonomies"]),
-                "results_per_taxonomy": {result["taxonomy"]: len(result["vetted_results"]) for result in research_outputs}
+                "results_per_taxonomy": {result["taxonomy"]: len(result["vetted_results"]) for result in research_outputs},
+                "research_prompt_tokens": {result["taxonomy"]: result.get("prompt_tokens", 0) for result in research_outputs},
+                "shared_chunks": chunk_registries.get(state["request_id"]).stats()
             }
         })
         
@@ -28,22 +40,29 @@ class Consolidate():
         
         return state
 
+    @timed_node("final_inference")
     async def final_inference(self,state: MainState) -> MainState:
         """Generate final answer by synthesizing all research results"""
         
-        await self.__push_updates(message_source="Consolidation Agent", push_update= "Generating final answer by synthesizing all research results")
+        await self.__push_updates(state, message_source="Consolidation Agent", push_update= "Generating final answer by synthesizing all research results")
         
         final_prompt = prompts.CONSOLIDATION_PROMPT
         
-        # Format research results for the prompt
+        # Format research results for the prompt, sharing the budget between taxonomies;
+        # whatever a taxonomy leaves unused carries over to the ones after it
+        builder = PromptBuilder()
         formatted_results = ""
-        for result in state["research_results"]:
-            formatted_results += f"\n=== Taxonomy: {result['taxonomy']} ===\n"
+        remaining_budget = PROMPT_BUDGET_SYNTHESIS_RESULTS
+        for position, result in enumerate(state["research_results"]):
+            header = f"\n=== Taxonomy: {result['taxonomy']} ===\n"
             if result["vetted_results"]:
-                for i, res in enumerate(result["vetted_results"]):
-                    formatted_results += f"Result {i+1}: {res['content']}\n"
+                section = f"taxonomy: {result['taxonomy']}"
+                taxonomy_budget = remaining_budget // (len(state["research_results"]) - position)
+                formatted_results += builder.add_results(section, result["vetted_results"], taxonomy_budget,
+                                                         lambda i, res: f"Result {i+1}: {res['content']}\n", header=header)
+                remaining_budget -= builder.usage[section]
             else:
-                formatted_results += "No relevant results found for this taxonomy.\n"
+                formatted_results += header + "No relevant results found for this taxonomy.\n"
         
         messages = [
             {"role": "system", "content": final_prompt},
@@ -52,32 +71,84 @@ class Consolidate():
                 research_results=formatted_results
             )}
         ]
+        await builder.ameasure(messages)
         
+        # Forward every chunk as a token frame as soon as it arrives
+        channel_id = event_channel(state)
         response_chunks = []
-        for chunk in LLM._llm_model.stream(messages): #might not be best practice
-            response_chunks.append(chunk.content)
-            print(chunk.content, end="", flush=True)
-        
+        usage = None
+        start = time.perf_counter()
+        deadline = call_deadline()
+
+        async def open_stream():
+            """Start the stream and wait for its first chunk, holding a scheduler slot only until then"""
+            # Synthesis is served ahead of queued research calls
+            async with asyncio.timeout_at(deadline), \
+                    llm_scheduler.slot(PRIORITY_SYNTHESIS, lambda: builder.usage["total"] + LLM_OUTPUT_TOKEN_ESTIMATE) as reservation:
+                stream = aiter(self.__clients.chat.astream(messages))
+                try:
+                    return reservation, stream, await anext(stream, None)
+                except BaseException:
+                    await stream.aclose()
+                    raise
+
+        # Failures before the first token are retried; once tokens were published the answer is committed
+        reservation, stream, chunk = await call_with_retries(open_stream, "final_inference", deadline)
+        try:
+            while chunk is not None:
+                # Usage, when the deployment reports it for streams, arrives on a chunk of its own
+                if chunk.usage_metadata:
+                    usage = token_usage(chunk)
+                if chunk.content:
+                    if not response_chunks:
+                        observe_first_token("final_inference", time.perf_counter() - start)
+                    response_chunks.append(chunk.content)
+                    event_broker.publish(channel_id, {
+                        "message_source": "Final Answer",
+                        "message_type": "token",
+                        "message_content": chunk.content,
+                        "message_timestamp": time.time(),
+                    })
+                chunk = await anext(stream, None)
+        finally:
+            await stream.aclose()
+
         final_answer = "".join(response_chunks)
+        # Without reported usage, charge the tokens counted locally
+        charged = usage or {
+            "input_tokens": builder.usage["total"],
+            "cached_tokens": 0,
+            "output_tokens": await acount_tokens(final_answer, builder.model),
+        }
+        # The slot is already released; this corrects the tokens reserved for the call
+        reservation.settle(charged["input_tokens"] + charged["output_tokens"])
+        
+        observe_llm_call("final_inference", time.perf_counter() - start, usage)
+        if usage is not None:
+            log_usage("final_inference", usage)
+        record_llm_call("final_inference", charged)
+        
         state["final_answer"] = final_answer
         
         # Add to thought process
         state["thought_process"].append({
             "type": "final_answer",
             "details": {
-                "final_answer": final_answer
+                "final_answer": final_answer,
+                "prompt_tokens": builder.usage
             }
         })
         
         return state
     
-    async def __push_updates(self, message_source: str, push_update: str) -> None:
+    async def __push_updates(self, state: MainState, message_source: str, push_update: str) -> None:
         """Push updates to the user"""
-        # Implement a mechanism to send update messages to the user
+        # Published on the request's (or session's) channel only
         current_time = time.time()
 
-        await data_queue.put({
+        event_broker.publish(event_channel(state), {
             "message_source": message_source,
+            "message_type": "update",
             "message_content": push_update,
             "message_timestamp": current_time,
         })
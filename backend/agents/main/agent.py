@@ -17,12 +17,16 @@ aoai_key = os.getenv("AZURE_OPENAI_API_KEY")
 aoai_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
 
 
-def build_main_graph():
-    """Build the main workflow graph"""
+def build_main_graph(consolidate_agent: Consolidate = None, review_agent: ReviewLLM = None, taxonomy_agent: TaxonomyLLM = None):
+    """Build the main workflow graph.
 
-    consolidate_agent = Consolidate()
-    review_agent = ReviewLLM()
-    taxonomy_agent = TaxonomyLLM()
+    Agents can be passed in so a caller (see ``registry.GraphRegistry``) can keep and
+    reuse them; any agent left out is created here.
+    """
+
+    consolidate_agent = consolidate_agent or Consolidate()
+    review_agent = review_agent or ReviewLLM()
+    taxonomy_agent = taxonomy_agent or TaxonomyLLM()
 
     # Initialize graph with MainState which has the Annotated field for research_outputs
     builder = StateGraph(MainState)
@@ -0,0 +1,208 @@
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, NamedTuple
+import asyncio
+import hashlib
+import os
+import threading
+
+from dotenv import load_dotenv
+
+ENV_FILE = "example.env"
+
+# Settings that are baked into the agents and their clients when the graph is built
+CONFIG_KEYS = (
+    "AZURE_SEARCH_ENDPOINT",
+    "AZURE_SEARCH_INDEX",
+    "AZURE_SEARCH_KEY",
+    "K_NEAREST_NEIGHBORS",
+    "NUM_SEARCH_RESULTS",
+    "MAX_ATTEMPTS",
+    "SEARCH_EXCLUSION_MODE",
+    "SEARCH_QUERY_FANOUT",
+    "PRERANK_MODE",
+    "PRERANK_CANDIDATE_FACTOR",
+    "PRERANK_MIN_SCORE",
+    "SEARCH_BACKEND",
+    "LOCAL_SEARCH_PATH",
+    "SEARCH_VECTOR_DIMENSIONS",
+    "OPENAI_API_VERSION",
+    "AZURE_OPENAI_API_KEY",
+    "AZURE_OPENAI_ENDPOINT",
+)
+
+
+class GraphLease(NamedTuple):
+    """A graph and the agents (hence model and search clients) it was built with"""
+    graph: Any
+    agents: Dict[str, Any]
+
+
+class GraphRegistry:
+    """Process-wide holder for the compiled main graph and the agents behind it.
+
+    The graph is compiled once and shared by every request. Compiled LangGraph graphs
+    keep no per-invocation state, and the agents only hold clients, so the same
+    instance can serve concurrent ``ainvoke`` calls. When the configuration changes
+    (environment variables or the env file) the registry rebuilds everything and swaps
+    the new graph in atomically; in-flight requests keep the graph they started with.
+    Each build gets its own model clients, so a reload never touches the clients of a
+    graph that is still running. Requests hold a ``lease`` on the graph they run, and the
+    search clients of a replaced graph are closed as soon as its last lease is released.
+    """
+
+    def __init__(self, env_file: str = ENV_FILE, search_client_factory: Callable[[], Any] | None = None,
+                 model_clients_factory: Callable[[], Any] | None = None):
+        self.__env_file = env_file
+        # Builds the research agent's search client; None lets the agent create one from SEARCH_BACKEND
+        self.search_client_factory = search_client_factory
+        # Builds the chat and embeddings clients of each agent set; None creates Azure OpenAI ones
+        self.model_clients_factory = model_clients_factory
+        self.__lock = threading.Lock()
+        self.__graph = None
+        self.__agents: Dict[str, Any] = {}
+        # Agents replaced by a reload, by graph version, until their in-flight requests finish
+        self.__retired_agents: Dict[int, Dict[str, Any]] = {}
+        self.__retired_lock = threading.Lock()
+        # Requests running on each graph version; only touched from the event loop
+        self.__leases: Dict[int, int] = {}
+        self.__current = (0, GraphLease(None, {}))
+        self.__fingerprint = None
+        self.__env_mtime = None
+        self.version = 0
+
+    def get_graph(self):
+        """Return the compiled main graph, building or reloading it if needed"""
+        if self.__graph is None or self.__config_changed():
+            self.reload()
+        return self.__graph
+
+    async def aget_graph(self):
+        """``get_graph`` for the event loop: a build (or a wait for one in progress) runs in a worker thread"""
+        if self.__graph is not None and not self.__config_changed():
+            return self.__graph
+        graph = await asyncio.to_thread(self.get_graph)
+        await self.__close_retired()
+        return graph
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[GraphLease]:
+        """Hold the current graph and its agents for one request, keeping their clients open until it ends"""
+        await self.aget_graph()
+        # Published in one assignment, so the graph, its agents and its version always match
+        version, lease = self.__current
+        self.__leases[version] = self.__leases.get(version, 0) + 1
+        try:
+            yield lease
+        finally:
+            self.__leases[version] -= 1
+            if not self.__leases[version]:
+                del self.__leases[version]
+                await self.__close_retired()
+
+    async def areload(self, force: bool = False):
+        """``reload`` for the event loop: the rebuild runs in a worker thread"""
+        graph = await asyncio.to_thread(self.reload, force)
+        await self.__close_retired()
+        return graph
+
+    @property
+    def ready(self) -> bool:
+        return self.__graph is not None
+
+    def get_agent(self, name: str):
+        """Return one of the registered agents ("consolidate", "review" or "taxonomy")"""
+        self.get_graph()
+        return self.__agents[name]
+
+    async def aget_agent(self, name: str):
+        """``get_agent`` for the event loop: a build runs in a worker thread"""
+        await self.aget_graph()
+        return self.__agents[name]
+
+    def reload(self, force: bool = False):
+        """Rebuild the agents and the graph from the current configuration"""
+        # LangGraph, LangChain and the Azure SDKs are only imported once a graph is actually built
+        from backend.agents.consolidation.agent import Consolidate
+        from backend.agents.main.agent import build_main_graph
+        from backend.agents.planner.agent import TaxonomyLLM
+        from backend.agents.research.agent import ReviewLLM
+        from backend.utils.llm import ModelClients
+
+        with self.__lock:
+            env_mtime = self.__read_env_mtime()
+            if env_mtime != self.__env_mtime:
+                load_dotenv(dotenv_path=self.__env_file, override=True)
+            fingerprint = self.__config_fingerprint()
+
+            # Another caller may have rebuilt the graph while we waited for the lock
+            if not force and self.__graph is not None and fingerprint == self.__fingerprint:
+                self.__env_mtime = env_mtime
+                return self.__graph
+
+            # New clients for every build, so new credentials/endpoints apply to the new agents only
+            clients = self.model_clients_factory() if self.model_clients_factory else ModelClients.create()
+            agents = {
+                "consolidate": Consolidate(clients),
+                "review": ReviewLLM(search_client=self.search_client_factory() if self.search_client_factory else None,
+                                    clients=clients),
+                "taxonomy": TaxonomyLLM(clients),
+            }
+            graph = build_main_graph(
+                consolidate_agent=agents["consolidate"],
+                review_agent=agents["review"],
+                taxonomy_agent=agents["taxonomy"],
+            )
+
+            if self.__agents:
+                with self.__retired_lock:
+                    self.__retired_agents[self.version] = self.__agents
+            self.__agents = agents
+            self.__graph = graph
+            self.__fingerprint = fingerprint
+            self.__env_mtime = env_mtime
+            self.version += 1
+            self.__current = (self.version, GraphLease(graph, agents))
+
+            print(f"Main graph built (version {self.version})")
+            return graph
+
+    async def aclose(self) -> None:
+        """Close the async clients held by the current and retired agents"""
+        with self.__retired_lock:
+            retired = list(self.__retired_agents.values())
+            self.__retired_agents = {}
+        for agents in retired + [self.__agents]:
+            if "review" in agents:
+                await agents["review"].aclose()
+        self.__agents = {}
+        self.__graph = None
+        self.__current = (self.version, GraphLease(None, {}))
+
+    async def __close_retired(self) -> None:
+        """Close the clients of replaced graphs that no request runs on anymore"""
+        with self.__retired_lock:
+            idle = [version for version in self.__retired_agents if version not in self.__leases]
+            retired = [self.__retired_agents.pop(version) for version in idle]
+        for agents in retired:
+            await agents["review"].aclose()
+
+    def __config_changed(self) -> bool:
+        if self.__read_env_mtime() != self.__env_mtime:
+            return True
+        return self.__config_fingerprint() != self.__fingerprint
+
+    def __read_env_mtime(self) -> float | None:
+        try:
+            return os.path.getmtime(self.__env_file)
+        except OSError:
+            return None
+
+    def __config_fingerprint(self) -> str:
+        # Hash the values so secrets are never kept around in plain text
+        digest = hashlib.sha256()
+        for key in CONFIG_KEYS:
+            digest.update(f"{key}={os.environ.get(key, '')}\n".encode())
+        return digest.hexdigest()
+
+
+graph_registry = GraphRegistry()
@@ -1,19 +1,24 @@
-from backend.utils.llm import LLM
+from backend.utils.llm import LLM, ModelClients
 from backend.utils.classes import *
+from backend.utils.events import event_broker, event_channel
+from backend.utils.metrics import timed_node
+from backend.utils.scheduler import PRIORITY_PLANNING
+from backend.utils.taxonomy_cache import taxonomy_cache
 import backend.agents.planner.prompts as prompts
 import time
 
 from langgraph.constants import Send
 
 class TaxonomyLLM(LLM):
-    def __init__(self):
-        super().__init__()
-        self.__model = LLM._llm_model.with_structured_output(TaxonomyExtraction)
+    def __init__(self, clients: ModelClients | None = None):
+        super().__init__(clients)
+        self.__model = self.clients.chat.with_structured_output(TaxonomyExtraction, include_raw=True)
     
+    @timed_node("identify_taxonomies")
     async def identify_taxonomies(self,state: MainState) -> MainState:
         """Extract taxonomies from the user's question"""
         
-        await self.__push_updates(message_source="Planner Agent", push_update="Extracting taxonomies from the user question")
+        await self.__push_updates(state, message_source="Planner Agent", push_update="Extracting taxonomies from the user question")
         
         taxonomy_prompt = prompts.TAXONOMY_PROMPT
         
@@ -22,7 +27,7 @@ class TaxonomyLLM(LLM):
            {"role": "user", "content": f"Extract taxonomies from this question: {state['user_input']}. Make sure to take into consideration this chat history:{state['user_history']}"}
         ]
         
-        taxonomy_response = self.__model.invoke(messages)
+        taxonomy_response, cache_tier = await self.__extract_taxonomies(state, messages)
         state["taxonomies"] = taxonomy_response.taxonomies
         
         # Add to thought process
@@ -30,43 +35,57 @@ class TaxonomyLLM(LLM):
             "type": "taxonomy_extraction",
             "details": {
                 "taxonomies": taxonomy_response.taxonomies,
-                "reasoning": taxonomy_response.reasoning
+                "reasoning": taxonomy_response.reasoning,
+                "cache": cache_tier
             }
         })
         
-        await self.__push_updates(message_source="Planner Agent", push_update=f"Identified taxonomies from the user question: {state['taxonomies']}")
+        await self.__push_updates(state, message_source="Planner Agent", push_update=f"Identified taxonomies from the user question: {state['taxonomies']}")
         
         return state
     
+    async def __extract_taxonomies(self, state: MainState, messages: list) -> tuple[TaxonomyExtraction, str | None]:
+        """Return the extraction for the question and which cache tier served it ("exact", "semantic" or None)"""
+        if not taxonomy_cache.enabled:
+            taxonomy_response, _ = await self.ainvoke_structured(self.__model, messages, "taxonomy_extraction")
+            return taxonomy_response, None
+
+        cached = await taxonomy_cache.lookup_exact(state["user_input"], state["user_history"])
+        if cached is not None:
+            return TaxonomyExtraction(**cached), "exact"
+
+        query_vector = await self.aembed_cached_query(state["user_input"], PRIORITY_PLANNING)
+        cached, _ = await taxonomy_cache.lookup_similar(state["user_history"], query_vector)
+        if cached is not None:
+            return TaxonomyExtraction(**cached), "semantic"
+
+        taxonomy_response, _ = await self.ainvoke_structured(self.__model, messages, "taxonomy_extraction")
+        await taxonomy_cache.store(state["user_input"], state["user_history"], query_vector, taxonomy_response.model_dump())
+        return taxonomy_response, None
+
     async def distribute_research_tasks(self,state: MainState) -> list:
         """Distribute research tasks to individual research agents based on taxonomies"""
         
-        await self.__push_updates(message_source="Planner Agent", push_update="Initiating research agents for each extracted taxonomy")
+        await self.__push_updates(state, message_source="Planner Agent", push_update="Initiating research agents for each extracted taxonomy")
         
         return [
-            Send("research_agent", {
-                "taxonomy": taxonomy,
-                "user_input": state["user_input"],
-                "user_history": state["user_history"],
-                "current_results": [],
-                "vetted_results": [],
-                "discarded_results": [],
-                "processed_ids": set(),
-                "reviews": [],
-                "decisions": [],
-                "attempts": 0,
-                "search_history": [],
-                "thought_process": []
-            }) for taxonomy in state["taxonomies"]
+            Send("research_agent", new_research_state(
+                request_id=state["request_id"],
+                session_id=state["session_id"],
+                taxonomy=taxonomy,
+                user_input=state["user_input"],
+                user_history=state["user_history"]
+            )) for taxonomy in state["taxonomies"]
         ]
     
-    async def __push_updates(self, message_source: str, push_update: str) -> None:
+    async def __push_updates(self, state: MainState, message_source: str, push_update: str) -> None:
         """Push updates to the user"""
-        # Implement a mechanism to send update messages to the user
+        # Published on the request's (or session's) channel only
         current_time = time.time()
 
-        await data_queue.put({
+        event_broker.publish(event_channel(state), {
             "message_source": message_source,
+            "message_type": "update",
             "message_content": push_update,
             "message_timestamp": current_time,
         })
@@ -1,92 +1,313 @@
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
-from azure.search.documents.models import VectorizedQuery
-
 from langsmith import traceable
 from langgraph.graph import StateGraph, START, END
 
-from backend.utils.llm import LLM
+from backend.utils.accounting import attribute_to_taxonomy, record_search, request_budget_exhausted
+from backend.utils.llm import LLM, ModelClients
 from backend.utils.classes import *
+from backend.utils.caching import digest
+from backend.utils.chunk_registry import chunk_registries, pick_reviewed
+from backend.utils.embeddings import rescore_full_dimensions, search_vector_dimensions, truncate_embedding, SHORT_VECTOR_FIELD, VECTOR_RESCORE_FACTOR
+from backend.utils.events import event_broker, event_channel
+from backend.utils.local_search import AsyncLocalSearchClient, get_local_index, LOCAL_SEARCH_PATH
+from backend.utils.metrics import observe_search, timed_node
+from backend.utils.ranking import reciprocal_rank_fusion
+from backend.utils.search_cache import chunk_vectors, search_cache, SEARCH_OVERFETCH
+from backend.utils.singleflight import search_flights
+from backend.utils.prerank import get_preranker
+from backend.utils.prompt_budget import PromptBuilder, PROMPT_BUDGET_CURRENT_RESULTS, PROMPT_BUDGET_VETTED_RESULTS, PROMPT_BUDGET_SEARCH_HISTORY
 import backend.agents.research.prompts as prompts
 
 from typing import List, Set
-from dotenv import load_dotenv
+import asyncio
 import os
 import time
+import uuid
+
+
+SEARCH_EXCLUSION_MODES = ("overfetch", "paged", "filter")
 
+def build_search_filter(category_filter: str | None, processed_ids: Set[str] | None = None) -> str | None:
+    """OData filter for a search; processed IDs are only included for the "filter" exclusion mode"""
+    filter_parts = []
+    if processed_ids:
+        ids_string = ','.join(processed_ids)
+        filter_parts.append(f"not search.in(id, '{ids_string}')")
+    if category_filter:
+        filter_parts.append(f"({category_filter})")
+    return " and ".join(filter_parts) if filter_parts else None
 
-load_dotenv(dotenv_path="example.env")
+def exclude_processed(results: List[SearchResult], processed_ids: Set[str], count: int) -> List[SearchResult]:
+    """First ``count`` results whose IDs have not been processed yet"""
+    return [result for result in results if result["id"] not in processed_ids][:max(count, 0)]
 
-AI_SEARCH_ENDPOINT = os.environ["AZURE_SEARCH_ENDPOINT"]
-AI_SEARCH_INDEX = os.environ["AZURE_SEARCH_INDEX"]
-AI_SEARCH_KEY = os.environ["AZURE_SEARCH_KEY"]
+def create_async_search_client():
+    """Async search client for SEARCH_BACKEND: the Azure AI Search index (default) or the in-process local index"""
+    if os.environ.get("SEARCH_BACKEND", "azure") == "local":
+        return AsyncLocalSearchClient(get_local_index(os.environ.get("LOCAL_SEARCH_PATH", LOCAL_SEARCH_PATH)))
+    # The Azure SDK is only imported when the Azure index is actually used
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents.aio import SearchClient as AsyncSearchClient
 
-K_NEAREST_NEIGHBORS = int(os.environ["K_NEAREST_NEIGHBORS"])
-NUM_SEARCH_RESULTS = int(os.environ["NUM_SEARCH_RESULTS"])
-MAX_ATTEMPTS = int(os.environ["MAX_ATTEMPTS"])
+    return AsyncSearchClient(os.environ["AZURE_SEARCH_ENDPOINT"], os.environ["AZURE_SEARCH_INDEX"], AzureKeyCredential(os.environ["AZURE_SEARCH_KEY"]))
 
 class ReviewLLM(LLM):
-    _SEARCH_RESULT = SearchClient(AI_SEARCH_ENDPOINT, AI_SEARCH_INDEX, AzureKeyCredential(AI_SEARCH_KEY))
+    _SEARCH_RESULT = SearchResult
     
-    def __init__(self):
-        super().__init__()
-        self.__model = LLM._llm_model.with_structured_output(ReviewDecision)
-        self.__search_client = SearchClient(AI_SEARCH_ENDPOINT, AI_SEARCH_INDEX, AzureKeyCredential(AI_SEARCH_KEY))
+    def __init__(self, search_client=None, clients: ModelClients | None = None):
+        super().__init__(clients)
+        # Review models by the number of results in the prompt, so the schema only admits their indices
+        self.__review_models: Dict[int, Any] = {}
+        # Number of diverse searches generated and run per attempt; 1 keeps a single query
+        self.__query_fanout = int(os.environ.get("SEARCH_QUERY_FANOUT", "1"))
+        if self.__query_fanout > 1:
+            self.__query_model = self.clients.chat.with_structured_output(MultiSearchPromptResponse, include_raw=True)
+            self.__query_system_prompt = prompts.QUERY_SYSTEM_PROMPT + prompts.QUERY_FANOUT_PROMPT.format(fanout=self.__query_fanout)
+        else:
+            self.__query_model = self.clients.chat.with_structured_output(SearchPromptResponse, include_raw=True)
+            self.__query_system_prompt = prompts.QUERY_SYSTEM_PROMPT
+        # Read the settings per instance so a rebuilt agent picks up configuration changes
+        self.__search_client = search_client if search_client is not None else create_async_search_client()
+        # Label of the search latency metrics
+        self.__search_backend = os.environ.get("SEARCH_BACKEND", "azure") if search_client is None else "custom"
+        self.__k_nearest_neighbors = int(os.environ["K_NEAREST_NEIGHBORS"])
+        self.__num_search_results = int(os.environ["NUM_SEARCH_RESULTS"])
+        self.__max_attempts = int(os.environ["MAX_ATTEMPTS"])
+        # How already-processed chunks are kept out of new results: overfetch | paged | filter
+        self.__exclusion_mode = os.environ.get("SEARCH_EXCLUSION_MODE", "overfetch")
+        if self.__exclusion_mode not in SEARCH_EXCLUSION_MODES:
+            raise ValueError(f"Unknown search exclusion mode '{self.__exclusion_mode}', expected one of {SEARCH_EXCLUSION_MODES}")
+        # Optional CPU-only pre-ranking (off | bm25 | cosine) that picks the reviewed results from a larger candidate pool
+        min_score = os.environ.get("PRERANK_MIN_SCORE")
+        self.__preranker = get_preranker(os.environ.get("PRERANK_MODE", "off"), float(min_score) if min_score else None)
+        self.__num_candidates = self.__num_search_results
+        if self.__preranker is not None:
+            self.__num_candidates *= int(os.environ.get("PRERANK_CANDIDATE_FACTOR", "3"))
+        self.__select_fields = ["id", "content", "source_file"]
+        # Cosine pre-ranking needs the hits' vectors: the local index hands out its stored ones,
+        # the service returns them with the hits, which are then kept in chunk_vectors
+        self.__local_index = self.__search_client.index if isinstance(self.__search_client, AsyncLocalSearchClient) else None
+        if self.__preranker is not None and self.__preranker.needs_vectors and self.__local_index is None:
+            self.__select_fields.append("content_vector")
+        # Leading embedding dimensions searched first (in content_vector_short), with the shortlist
+        # rescored on the full vectors; 0 searches content_vector directly
+        self.__vector_dimensions = search_vector_dimensions()
+        # Identical searches in flight at once share one query, but only against the same client
+        self.__flight_scope = uuid.uuid4().hex
         self.__research_graph = self.__build_research_graph()
     
-    def __format_search_results(self,results: List[_SEARCH_RESULT]) -> str:
-        """Format search results into a nicely formatted string."""
-        output_parts = ["\n=== Search Results ==="]
-        for i, result in enumerate(results, 0):
-            result_parts = [
-                f"\nResult #{i}",
-                "=" * 80,
-                f"ID: {result['id']}",
-                f"Source File: {result['source_file']}",
-                #f"Source Pages: {result['source_pages']}",
-                "\n<Start Content>",
-                "-" * 80,
-                result['content'],
-                "-" * 80,
-                "<End Content>"
-            ]
-            output_parts.extend(result_parts)
-        formatted_output = "\n".join(output_parts)
-        return formatted_output
-    
+    def __review_model(self, num_results: int):
+        """Structured-output model for reviewing ``num_results`` results"""
+        model = self.__review_models.get(num_results)
+        if model is None:
+            model = self.__review_models[num_results] = self.clients.chat.with_structured_output(
+                review_decision_schema(num_results), include_raw=True)
+        return model
+
+    def __format_search_result(self, index: int, result: _SEARCH_RESULT) -> str:
+        """Format a single search result, labelled with its index in the result list."""
+        result_parts = [
+            f"\nResult #{index}",
+            "=" * 80,
+            f"ID: {result['id']}",
+            f"Source File: {result['source_file']}",
+            #f"Source Pages: {result['source_pages']}",
+            "\n<Start Content>",
+            "-" * 80,
+            result['content'],
+            "-" * 80,
+            "<End Content>"
+        ]
+        return "\n".join(result_parts)
+
+    def __format_search_results(self, builder: PromptBuilder, section: str, results: List[_SEARCH_RESULT], budget: int) -> str:
+        """Format search results into a nicely formatted string, within the section's token budget."""
+        return builder.add_results(section, results, budget, self.__format_search_result, header="\n=== Search Results ===")
+
+    def __add_vetted_result(self, state: ResearchState, result: _SEARCH_RESULT) -> None:
+        """Add a result to the vetted results, formatting its prompt segment once"""
+        state["vetted_segments"].append(PromptBuilder().segment(
+            self.__format_search_result(len(state["vetted_results"]), result), result["score"]))
+        state["vetted_results"].append(result)
+
+    def __format_search_attempt(self, attempt: int, search: Dict[str, Any], review: str) -> str:
+        """Format one search attempt and its review for the search history."""
+        attempt_parts = [f"<Attempt {attempt}>"]
+        for query in search["queries"]:
+            attempt_parts.append(f"   Query: {query['query']}")
+            attempt_parts.append(f"   Filter: {query['filter']}")
+        attempt_parts.append(f"   Review: {review}")
+        return "\n".join(attempt_parts) + "\n"
+
     @traceable(run_type="retriever", name="run_search")
-    def __run_search(self,search_query: str, processed_ids: Set[str], category_filter: str | None = None) -> List[_SEARCH_RESULT]:
+    async def __run_search(self,search_query: str, processed_ids: Set[str], category_filter: str | None = None) -> List[_SEARCH_RESULT]:
         """
         Perform a search using Azure Cognitive Search with both semantic and vector queries.
         """
-        # Generate vector embedding for the query
-        query_vector = self._embeddings_model.embed_query(search_query)
-        vector_query = VectorizedQuery(
-            vector=query_vector,
-            k_nearest_neighbors=K_NEAREST_NEIGHBORS,
-            fields="content_vector"
-        )
-        
-        # Create filter combining processed_ids and category filter
-        filter_parts = []
-        if processed_ids:
-            ids_string = ','.join(processed_ids)
-            filter_parts.append(f"not search.in(id, '{ids_string}')")
-        if category_filter:
-            filter_parts.append(f"({category_filter})")
-        filter_str = " and ".join(filter_parts) if filter_parts else None
+        search_results = self.__cached_search(search_query, processed_ids, category_filter)
+        if search_results is not None:
+            return search_results
+        return await self.__search_index(search_query, processed_ids, category_filter)
+
+    async def __run_searches(self, searches: List[SearchPromptResponse], processed_ids: Set[str]) -> List[_SEARCH_RESULT]:
+        """Run several searches concurrently and fuse their rankings with reciprocal rank fusion"""
+        if len(searches) == 1:
+            return await self.__run_search(searches[0].search_query, processed_ids, searches[0].filter)
+
+        # Searches served from the result cache need no query vector, so only the misses are embedded
+        cached = [self.__cached_search(search.search_query, processed_ids, search.filter) for search in searches]
+        misses = [search for search, search_results in zip(searches, cached) if search_results is None]
+        if len(misses) > 1:
+            # One embeddings request for every miss; the searches then find their vectors in the cache
+            await self.aembed_cached_queries([search.search_query for search in misses])
+
+        async def ranking(search: SearchPromptResponse, search_results: List[_SEARCH_RESULT] | None) -> List[_SEARCH_RESULT]:
+            if search_results is not None:
+                return search_results
+            return await self.__search_index(search.search_query, processed_ids, search.filter)
+
+        rankings = await asyncio.gather(*(ranking(search, search_results) for search, search_results in zip(searches, cached)))
+        return reciprocal_rank_fusion(rankings, self.__num_candidates)
+
+    def __cached_search(self, search_query: str, processed_ids: Set[str], category_filter: str | None) -> List[_SEARCH_RESULT] | None:
+        """Results for the search from the shared result cache, or None if they must come from the index"""
+        # With the filter mode the results differ per caller, so they are never cached
+        if not search_cache.enabled or self.__exclusion_mode == "filter":
+            return None
+        return search_cache.get(self.__search_cache_key(search_query, category_filter), processed_ids, self.__num_candidates)
+
+    def __search_cache_key(self, search_query: str, category_filter: str | None) -> str:
+        return search_cache.key(search_query, category_filter, self.__k_nearest_neighbors, self.__num_candidates, self.__vector_dimensions)
+
+    async def __search_index(self, search_query: str, processed_ids: Set[str], category_filter: str | None) -> List[_SEARCH_RESULT]:
+        """Run the search against the index, excluding processed IDs as set by SEARCH_EXCLUSION_MODE"""
+        if self.__exclusion_mode == "filter":
+            # Let the service exclude processed IDs; the filter grows with every attempt
+            filter_str = build_search_filter(category_filter, processed_ids)
+            return await self.__fetch_ranked(search_query, filter_str, self.__num_candidates)
+
+        if search_cache.enabled:
+            return await self.__fill_search_cache(search_query, processed_ids, category_filter)
+
+        filter_str = build_search_filter(category_filter)
+        if self.__exclusion_mode == "paged":
+            ranked, _ = await self.__fetch_paged(search_query, filter_str, processed_ids)
+        else:
+            # Over-fetch by the number of processed IDs, which guarantees a full page after excluding them
+            ranked = await self.__fetch_ranked(search_query, filter_str, self.__num_candidates + len(processed_ids))
+        return exclude_processed(ranked, processed_ids, self.__num_candidates)
+
+    async def __prerank(self, state: ResearchState, searches: List[SearchPromptResponse],
+                        candidates: List[_SEARCH_RESULT]) -> tuple[List[_SEARCH_RESULT], List[_SEARCH_RESULT]]:
+        """Pick the results to review from the candidates, and the ones to drop unreviewed"""
+        if self.__preranker is None:
+            return candidates[:self.__num_search_results], []
+
+        query_text = " ".join([state["taxonomy"], state["user_input"]] + [search.search_query for search in searches])
+        # Usually an embeddings cache hit: the primary query was embedded for its search, unless
+        # that search was served from the search cache
+        query_vector = None
+        if self.__preranker.needs_vectors:
+            query_vector = await self.aembed_cached_query(searches[0].search_query)
+            vectors = await self.__candidate_vectors([candidate["id"] for candidate in candidates])
+            candidates = [{**candidate, "content_vector": vectors.get(candidate["id"])} for candidate in candidates]
+        return self.__preranker.rank(query_text, query_vector, candidates, self.__num_search_results)
+
+    async def __candidate_vectors(self, chunk_ids: List[str]) -> Dict[str, Any]:
+        """Content vectors of the candidates: stored in the local index, or cached from earlier
+        searches, with any missing ones fetched in a single lookup"""
+        if self.__local_index is not None:
+            return await asyncio.to_thread(self.__local_index.get_vectors, chunk_ids)
+
+        vectors = chunk_vectors.get_many(chunk_ids)
+        missing = [chunk_id for chunk_id in chunk_ids if chunk_id not in vectors]
+        if missing:
+            start = time.perf_counter()
+            results = await self.__search_client.search(
+                search_text="*",
+                filter=f"search.in(id, '{','.join(missing)}')",
+                select=["id", "content_vector"],
+                top=len(missing)
+            )
+            found = 0
+            async for result in results:
+                if result.get("content_vector") is not None:
+                    vectors[result["id"]] = chunk_vectors.put(result["id"], result["content_vector"])
+                    found += 1
+            observe_search(self.__search_backend, time.perf_counter() - start, found)
+            record_search()
+        return vectors
+
+    async def __fetch_paged(self, search_query: str, filter_str: str | None,
+                            processed_ids: Set[str]) -> tuple[List[_SEARCH_RESULT], int]:
+        """Page through the ranking until it holds a full page of unprocessed results.
+
+        Returns every result fetched, processed or not, and the depth requested (``top`` of all pages).
+        """
+        page_size = self.__num_candidates + SEARCH_OVERFETCH
+        ranked = []
+        depth = 0
+        while True:
+            page = await self.__fetch_ranked(search_query, filter_str, page_size, skip=depth)
+            ranked.extend(page)
+            depth += page_size
+            if len(exclude_processed(ranked, processed_ids, self.__num_candidates)) >= self.__num_candidates or len(page) < page_size:
+                return ranked, depth
+
+    async def __fill_search_cache(self, search_query: str, processed_ids: Set[str], category_filter: str | None) -> List[_SEARCH_RESULT]:
+        """Fetch a ranked list deep enough for the shared result cache, excluding processed IDs client-side"""
+        filter_str = build_search_filter(category_filter)
+        if self.__exclusion_mode == "paged":
+            ranked, depth = await self.__fetch_paged(search_query, filter_str, processed_ids)
+        else:
+            # Over-fetch deep enough that the results left after exclusions still fill the page
+            depth = self.__num_candidates + max(SEARCH_OVERFETCH, len(processed_ids))
+            ranked = await self.__fetch_ranked(search_query, filter_str, depth)
+        search_cache.set(self.__search_cache_key(search_query, category_filter), ranked, depth)
+        return [dict(result) for result in exclude_processed(ranked, processed_ids, self.__num_candidates)]
+
+    async def __fetch_ranked(self, search_query: str, filter_str: str | None, top: int, skip: int = 0) -> List[_SEARCH_RESULT]:
+        """Run one hybrid (keyword + vector) query and return the ranked results"""
+        key = digest(self.__flight_scope, search_query, filter_str or "", str(top), str(skip))
+        return await search_flights.do(key, lambda: self.__query_index(search_query, filter_str, top, skip),
+                                       copy=lambda results: [dict(result) for result in results])
+
+    async def __query_index(self, search_query: str, filter_str: str | None, top: int, skip: int) -> List[_SEARCH_RESULT]:
+        from azure.search.documents.models import VectorizedQuery
+
+        # Generate vector embedding for the query, reusing it if the same query was embedded before
+        query_vector = await self.aembed_cached_query(search_query)
+        select_fields = self.__select_fields
+        page = (skip, top)
+        if self.__vector_dimensions:
+            # Fetch a shortlist VECTOR_RESCORE_FACTOR times deeper than the page, from the top of the
+            # ranking so every page is cut from the same rescored order, with the full vectors to rescore it
+            top, skip = (skip + top) * VECTOR_RESCORE_FACTOR, 0
+            vector_query = VectorizedQuery(
+                vector=truncate_embedding(query_vector, self.__vector_dimensions),
+                k_nearest_neighbors=max(self.__k_nearest_neighbors * VECTOR_RESCORE_FACTOR, top),
+                fields=SHORT_VECTOR_FIELD
+            )
+            select_fields = list(dict.fromkeys(select_fields + ["content_vector"]))
+        else:
+            vector_query = VectorizedQuery(
+                vector=query_vector,
+                k_nearest_neighbors=self.__k_nearest_neighbors,
+                fields="content_vector"
+            )
 
         # Perform the search
-        results = self.__search_client.search(
+        start = time.perf_counter()
+        results = await self.__search_client.search(
             search_text=search_query,
             vector_queries=[vector_query],
             filter=filter_str,
-            select=["id", "content", "source_file"], #, "source_pages"
-            top=NUM_SEARCH_RESULTS
+            select=select_fields, #, "source_pages"
+            top=top,
+            skip=skip or None
         )
         
         search_results = []
-        for result in results:
+        async for result in results:
             search_result = SearchResult(
                 id=result["id"],
                 content=result["content"],
@@ -94,33 +315,43 @@ class ReviewLLM(LLM):
                 #source_pages=result["source_pages"],
                 score=result["@search.score"]
             )
+            if result.get("content_vector") is not None:
+                search_result["content_vector"] = result["content_vector"]
             search_results.append(search_result)
+        observe_search(self.__search_backend, time.perf_counter() - start, len(search_results))
+        record_search()
+
+        if self.__vector_dimensions:
+            search_results = rescore_full_dimensions(search_results, query_vector)[page[0]:page[0] + page[1]]
+
+        # Results travel (and are cached) without their vectors; the pre-ranker finds them in chunk_vectors
+        keep_vectors = self.__preranker is not None and self.__preranker.needs_vectors
+        for search_result in search_results:
+            vector = search_result.pop("content_vector", None)
+            if vector is not None and keep_vectors:
+                chunk_vectors.put(search_result["id"], vector)
         
         return search_results
 
+    @timed_node("review_results")
+    @attribute_to_taxonomy
     async def __review_results(self, state: ResearchState) -> ResearchState | ResearchOutputState:
         """Review current results and categorize them as valid or invalid.
         When review decision is 'finalize', return the final output directly."""
         
-        await self.__push_updates(message_source="Research Agent", push_update= f"Evaluating search attempt {state['attempts']} for taxonomy: {state['taxonomy']}")
+        await self.__push_updates(state, message_source="Research Agent", push_update= f"Evaluating search attempt {state['attempts']} for taxonomy: {state['taxonomy']}")
 
         review_prompt = prompts.REVIEW_PROMPT
 
-        current_results_formatted = self.__format_search_results(state["current_results"]) if state["current_results"] else "No current results."
-        vetted_results_formatted = self.__format_search_results(state["vetted_results"]) if state["vetted_results"] else "No previously vetted results."
-        
-        search_history_formatted = ""
-        if state["search_history"]:
-            search_history_formatted = "\n### Search History ###\n"
-            for i, (search, review) in enumerate(zip(state["search_history"], state["reviews"]), 1):
-                search_history_formatted += f"<Attempt {i}>\n"
-                search_history_formatted += f"   Query: {search['query']}\n"
-                search_history_formatted += f"   Filter: {search['filter']}\n"
-                search_history_formatted += f"   Review: {review}\n"
+        builder = PromptBuilder()
+        # History and vetted results were formatted when they were produced; only the current results are new
+        search_history_formatted = builder.add_segments("search_history", state["history_segments"], PROMPT_BUDGET_SEARCH_HISTORY)
+        vetted_results_formatted = builder.add_segments("vetted_results", state["vetted_segments"], PROMPT_BUDGET_VETTED_RESULTS,
+                                                        header="\n=== Search Results ===", keep="score") or "No previously vetted results."
+        current_results_formatted = self.__format_search_results(builder, "current_results", state["current_results"], PROMPT_BUDGET_CURRENT_RESULTS) if state["current_results"] else "No current results."
         
         llm_input = review_prompt.format(
             question=state["user_input"],
-            history=state["user_history"],
             taxonomy=state["taxonomy"],
             current_results=current_results_formatted,
             vetted_results=vetted_results_formatted,
@@ -128,12 +359,21 @@ class ReviewLLM(LLM):
         )
         
         messages = [
-            {"role": "system", "content": "You are an expert at evaluating search results."},
+            {"role": "system", "content": prompts.REVIEW_SYSTEM_PROMPT},
             {"role": "user", "content": llm_input}
         ]
+        state["prompt_tokens"] += await builder.ameasure(messages)
         
-        review = self.__model.invoke(messages)
+        review, _ = await self.ainvoke_structured(self.__review_model(len(state["current_results"])), messages, "review_results")
         
+        # Only indices of results that were in the prompt count; triage, pre-ranking and the
+        # prompt budget can leave fewer than NUM_SEARCH_RESULTS of them
+        shown = {index for index, result in enumerate(state["current_results"]) if result["id"] in builder.result_tokens}
+        valid_results, ignored = pick_reviewed(state["current_results"], review.valid_results, shown)
+        invalid_results, ignored_invalid = pick_reviewed(state["current_results"], review.invalid_results, shown)
+        if ignored or ignored_invalid:
+            print(f"Review for taxonomy {state['taxonomy']} referred to results it was not shown: {sorted(ignored + ignored_invalid)}")
+
         # Add to thought process
         state["thought_process"].append({
             "type": "review",
@@ -141,34 +381,46 @@ class ReviewLLM(LLM):
                 "taxonomy": state["taxonomy"],
                 "thought_process": review.thought_process,
                 "decision": review.decision,
-                "valid_results": len(review.valid_results),
-                "invalid_results": len(review.invalid_results)
+                "valid_results": len(valid_results),
+                "invalid_results": len(invalid_results),
+                "prompt_tokens": builder.usage
             }
         })
         
+        # Once the request has spent its token budget, no branch starts another attempt
+        decision = review.decision
+        if decision == "retry" and request_budget_exhausted():
+            await self.__push_updates(state, message_source="Research Agent", push_update= f"Request token budget spent; finalizing research for taxonomy: {state['taxonomy']}")
+            decision = "finalize"
+        
         state["reviews"].append(review.thought_process)
-        state["decisions"].append(review.decision)
+        state["decisions"].append(decision)
+        state["history_segments"].append(builder.segment(
+            self.__format_search_attempt(state["attempts"], state["search_history"][-1], review.thought_process)))
         
-        for idx in review.valid_results:
-            result = state["current_results"][idx]
-            state["vetted_results"].append(result)
+        registry = chunk_registries.get(state["request_id"])
+        for result in valid_results:
+            self.__add_vetted_result(state, result)
             state["processed_ids"].add(result["id"])
+            registry.record_verdict(result["id"], state["taxonomy"], True, builder.result_tokens.get(result["id"], 0))
         
-        for idx in review.invalid_results:
-            result = state["current_results"][idx]
+        for result in invalid_results:
             state["discarded_results"].append(result)
             state["processed_ids"].add(result["id"])
+            registry.record_verdict(result["id"], state["taxonomy"], False, builder.result_tokens.get(result["id"], 0))
         
         state["current_results"] = []
         
         # If maximum attempts reached or decision is finalize, return the final output
-        if review.decision == "finalize" or state["attempts"] >= MAX_ATTEMPTS:
-            await self.__push_updates(message_source="Research Agent", push_update= f"Finalizing research for taxonomy: {state['taxonomy']}")
+        if decision == "finalize" or state["attempts"] >= self.__max_attempts:
+            await self.__push_updates(state, message_source="Research Agent", push_update= f"Finalizing research for taxonomy: {state['taxonomy']}")
             
             # Create a result dictionary for this taxonomy
             taxonomy_result = {
                 "taxonomy": state["taxonomy"],
-                "vetted_results": state["vetted_results"]
+                "vetted_results": state["vetted_results"],
+                "attempts": state["attempts"],
+                "prompt_tokens": state["prompt_tokens"]
             }
             
             # Return a ResearchOutputState with research_outputs that can be merged with the main state
@@ -206,22 +458,34 @@ class ReviewLLM(LLM):
     
     def get_research_graph(self):
         return self.__research_graph
+
+    async def get_index_version(self) -> str | None:
+        """Return the newest document's created_date, which changes whenever documents are indexed"""
+        results = await self.__search_client.search(
+            search_text="*",
+            order_by=["created_date desc"],
+            select=["created_date"],
+            top=1
+        )
+        async for result in results:
+            return str(result["created_date"])
+        return None
+
+    async def aclose(self) -> None:
+        """Close the async search client and its underlying HTTP session"""
+        await self.__search_client.close()
     
+    @timed_node("generate_search_query")
+    @attribute_to_taxonomy
     async def __generate_search_query(self, state: ResearchState) -> ResearchState:
         """Generate an optimized search query based on the current state"""
-        await self.__push_updates(message_source="Research Agent", push_update= f"Generating search query for taxonomy: {state['taxonomy']}")
+        await self.__push_updates(state, message_source="Research Agent", push_update= f"Generating search query for taxonomy: {state['taxonomy']}")
         state["attempts"] += 1
         
         query_prompt = prompts.QUERY_PROMPT
         
-        search_history_formatted = ""
-        if state["search_history"]:
-            search_history_formatted = "\n### Previous Search Attempts ###\n"
-            for i, (search, review) in enumerate(zip(state["search_history"], state["reviews"]), 1):
-                search_history_formatted += f"<Attempt {i}>\n"
-                search_history_formatted += f"   Query: {search['query']}\n"
-                search_history_formatted += f"   Filter: {search['filter']}\n"
-                search_history_formatted += f"   Review: {review}\n"
+        builder = PromptBuilder()
+        search_history_formatted = builder.add_segments("search_history", state["history_segments"], PROMPT_BUDGET_SEARCH_HISTORY)
         
         llm_input = query_prompt.format(
             question=state["user_input"],
@@ -230,25 +494,39 @@ class ReviewLLM(LLM):
         )
         
         messages = [
-            {"role": "system", "content": "You are an expert search query generator."},
+            {"role": "system", "content": self.__query_system_prompt},
             {"role": "user", "content": llm_input}
         ]
+        state["prompt_tokens"] += await builder.ameasure(messages)
         
-        llm_with_search_prompt = self._llm_model.with_structured_output(SearchPromptResponse)
-        search_response = llm_with_search_prompt.invoke(messages)
+        search_response, _ = await self.ainvoke_structured(self.__query_model, messages, "generate_search_query")
+        searches = search_response.searches[:self.__query_fanout] if self.__query_fanout > 1 else [search_response]
+        queries = [{"query": search.search_query, "filter": search.filter} for search in searches]
         
         # Record this search query in history
         state["search_history"].append({
-            "query": search_response.search_query,
-            "filter": search_response.filter
+            "query": searches[0].search_query,
+            "filter": searches[0].filter,
+            "queries": queries
         })
         
         # Run the search
-        current_results = self.__run_search(
-            search_query=search_response.search_query,
-            processed_ids=state["processed_ids"],
-            category_filter=search_response.filter
-        )
+        current_results = await self.__run_searches(searches, state["processed_ids"])
+
+        # Settle chunks other branches of this request already reviewed, and only review the rest
+        registry = chunk_registries.get(state["request_id"])
+        registry.record_retrieved([result["id"] for result in current_results], state["taxonomy"])
+        triaged = registry.triage(current_results, state["taxonomy"])
+        for result in triaged["valid"]:
+            self.__add_vetted_result(state, result)
+        for result in triaged["invalid"]:
+            state["discarded_results"].append(result)
+        for result in triaged["valid"] + triaged["invalid"] + triaged["skipped"]:
+            state["processed_ids"].add(result["id"])
+
+        # Keep the best candidates for the review. Dropped ones are not marked processed: they were
+        # never reviewed, and a later query may rank them higher
+        current_results, dropped = await self.__prerank(state, searches, triaged["review"])
         state["current_results"] = current_results
         
         # Add to thought process
@@ -256,9 +534,14 @@ class ReviewLLM(LLM):
             "type": "search_query",
             "details": {
                 "taxonomy": state["taxonomy"],
-                "query": search_response.search_query,
-                "filter": search_response.filter,
-                "num_results": len(current_results)
+                "query": searches[0].search_query,
+                "filter": searches[0].filter,
+                "queries": queries,
+                "num_results": len(current_results),
+                "num_candidates": len(triaged["review"]),
+                "reused_verdicts": len(triaged["valid"]) + len(triaged["invalid"]),
+                "skipped_results": len(triaged["skipped"]),
+                "prerank_dropped": len(dropped)
             }
         })
         
@@ -266,8 +549,8 @@ class ReviewLLM(LLM):
     
     async def __review_router(self, state: ResearchState) -> str:
         """Route to either retry search or go to END (finalize happens in review_results now)"""
-        if state["attempts"] >= MAX_ATTEMPTS:
-            await self.__push_updates(message_source="Research Agent", push_update= f"\nReached maximum attempts ({MAX_ATTEMPTS}) for taxonomy {state['taxonomy']}. Proceeding to finalize.")
+        if state["attempts"] >= self.__max_attempts:
+            await self.__push_updates(state, message_source="Research Agent", push_update= f"\nReached maximum attempts ({self.__max_attempts}) for taxonomy {state['taxonomy']}. Proceeding to finalize.")
             return "finalize"
         
         latest_decision = state["decisions"][-1]
@@ -276,13 +559,14 @@ class ReviewLLM(LLM):
         
         return "retry"
     
-    async def __push_updates(self, message_source: str, push_update: str) -> None:
+    async def __push_updates(self, state: ResearchState, message_source: str, push_update: str) -> None:
         """Push updates to the user"""
-        # Implement a mechanism to send update messages to the user
+        # Published on the request's (or session's) channel only
         current_time = time.time()
 
-        await data_queue.put({
+        event_broker.publish(event_channel(state), {
             "message_source": message_source,
+            "message_type": "update",
             "message_content": push_update,
             "message_timestamp": current_time,
         })
@@ -1,7 +1,9 @@
-QUERY_PROMPT = """Generate an effective search query for retrieving information on a specific taxonomy related to the user's question.
+# The system prompts are static and the user prompts put the parts that grow between
+# attempts last, so consecutive calls share a long prefix the provider can cache.
 
-User Question: {question}
-Taxonomy: {taxonomy}
+QUERY_SYSTEM_PROMPT = """You are an expert search query generator.
+
+Generate an effective search query for retrieving information on a specific taxonomy related to the user's question.
 
 Your task is to create a targeted search query and optional filter that will retrieve documents specifically relevant to this taxonomy.
 
@@ -13,9 +15,6 @@ Search queries should:
 
 If there have been previous search attempts, review them and adjust your strategy accordingly.
 
-Previous Search Attempts:
-{search_history}
-
 Return:
 1. search_query: Your optimized search query
 2. filter: An optional filter to narrow results (can be None)
@@ -23,11 +22,21 @@ Return:
 DEV MODE: You are in dev mode. Filter is always an empty string.
 """
 
-REVIEW_PROMPT = """Review these search results and determine which contain relevant information for answering the user's question within the specific taxonomy.
-
-User Question: {question}
+QUERY_PROMPT = """User Question: {question}
 Taxonomy: {taxonomy}
 
+Previous Search Attempts:
+{search_history}
+"""
+
+QUERY_FANOUT_PROMPT = """
+Instead of a single query, return {fanout} searches. Make them diverse: vary the wording, the angle on the taxonomy and the key terms, so that together they cover the taxonomy better than any one of them would.
+"""
+
+REVIEW_SYSTEM_PROMPT = """You are an expert at evaluating search results.
+
+Review these search results and determine which contain relevant information for answering the user's question within the specific taxonomy.
+
 Your task is to evaluate each search result and determine if it contains information that helps address this taxonomy of the user's question.
 
 Consider:
@@ -37,16 +46,20 @@ Consider:
 
 Respond with:
 1. thought_process: Your analysis of each result
-2. valid_results: List of indices (0-N) for useful results
-3. invalid_results: List of indices (0-N) for irrelevant results
+2. valid_results: List of indices (the number after "Result #") of the current search results that are useful
+3. invalid_results: List of indices (the number after "Result #") of the current search results that are irrelevant
 4. decision: Either "retry" if we need more info or "finalize" if we have sufficient information
+"""
 
-Current Search Results:
-{current_results}
+REVIEW_PROMPT = """User Question: {question}
+Taxonomy: {taxonomy}
+
+Search History:
+{search_history}
 
 Previously Vetted Results:
 {vetted_results}
 
-Search History:
-{search_history}
+Current Search Results:
+{current_results}
 """
@@ -0,0 +1,283 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+# The app's utilities read their settings from the environment at import time; variables
+# already set (e.g. by a script's own .env) take precedence over example.env
+load_dotenv(dotenv_path="example.env")
+
+from fastapi import FastAPI, BackgroundTasks, Header, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.websockets import WebSocketState
+from backend.utils.accounting import request_log, request_scope
+from backend.utils.classes import MainState,ChatState, QuestionRequest
+from backend.utils.events import event_broker
+from backend.utils.embedding_cache import embedding_cache
+from backend.utils.answer_cache import answer_cache
+from backend.utils.taxonomy_cache import taxonomy_cache
+from backend.utils.search_cache import chunk_vectors, search_cache
+from backend.utils.chunk_registry import chunk_registries
+from backend.utils.metrics import metrics
+from backend.utils.scheduler import PRIORITY_PLANNING
+from backend.utils.singleflight import embedding_flights, llm_flights, search_flights
+from backend.agents.main.registry import graph_registry
+import os
+import secrets
+import time
+import uuid
+
+# Subscriber buffer for /process/stream; large enough to hold a whole answer's token frames
+STREAM_BUFFER_SIZE = int(os.environ.get("STREAM_BUFFER_SIZE", "4096"))
+# When the graph (and the SDKs and clients behind it) is built: "eager" before the app accepts
+# requests, "background" in a warm-up task while it already accepts them, "lazy" on the first request
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "eager")
+# Shared secret for the /admin endpoints (X-Admin-Token header); they are disabled when unset
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Compile the graph once per process instead of on every request
+    warm_up = None
+    if STARTUP_MODE == "eager":
+        graph_registry.get_graph()
+    elif STARTUP_MODE == "background":
+        # Requests arriving before it finishes wait for the same build in aget_graph
+        warm_up = asyncio.create_task(graph_registry.aget_graph())
+    yield
+    if warm_up is not None and not warm_up.done():
+        await asyncio.wait([warm_up])
+    await graph_registry.aclose()
+
+app = FastAPI(lifespan=lifespan)
+
+async def index_version() -> str | None:
+    return await (await graph_registry.aget_agent("review")).get_index_version()
+
+# Cached answers are dropped whenever the newest document in the index changes
+answer_cache.index_version_source = index_version
+
+@app.post("/admin/reload")
+async def reload_graph(x_admin_token: str | None = Header(default=None)):
+    """Rebuild the agents and the graph, e.g. after rotating keys or changing search settings.
+
+    Requires the ``X-Admin-Token`` header to match ``ADMIN_TOKEN``; without ``ADMIN_TOKEN`` the endpoint is disabled.
+    """
+    if not ADMIN_TOKEN or not secrets.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    await graph_registry.areload(force=True)
+    return JSONResponse({"graph_version": graph_registry.version})
+
+async def run_question(request: QuestionRequest, request_id: str) -> MainState:
+    """Run the main graph for one question, publishing updates on its event channel"""
+    # The lease keeps this graph's clients open until the request ends, even across a reload
+    async with graph_registry.lease() as lease:
+        initial_state = MainState(
+            request_id=request_id,
+            session_id=request.session_id,
+            user_input=request.user_input,
+            user_history=request.history,
+            taxonomies=[],
+            research_results=[],
+            research_outputs=[],
+            final_answer=None,
+            thought_process=[],
+        )
+
+        # LLM, embedding and search calls anywhere in the graph are charged to this request
+        with request_scope(request_id) as ledger:
+            try:
+                final_state = None
+                if answer_cache.enabled:
+                    query_vector = await lease.agents["taxonomy"].aembed_cached_query(request.user_input, PRIORITY_PLANNING)
+                    cached = await answer_cache.lookup(request.history, query_vector)
+                    # After the lookup, which may have started a new generation on an index change
+                    generation = answer_cache.generation
+                    if cached is not None:
+                        final_state = {**initial_state, **cached}
+
+                if final_state is None:
+                    final_state = await lease.graph.ainvoke(initial_state)
+                    if answer_cache.enabled and final_state["final_answer"]:
+                        await answer_cache.store(request.user_input, request.history, query_vector, final_state, generation)
+
+                if final_state["final_answer"]:
+                    current_time = time.time()
+
+                    event_broker.publish(
+                        request.session_id or request_id,
+                        {
+                            "message_source": "Final Answer",
+                            "message_type": "final_answer",
+                            "message_content": final_state["final_answer"],
+                            "message_timestamp": current_time,
+                        }
+                    )
+            finally:
+                chunk_registries.release(request_id)
+                # Session channels outlive a single request; request channels end with it
+                if request.session_id is None:
+                    event_broker.close_channel(request_id)
+                ledger.finish()
+                if request_log.path:
+                    await asyncio.to_thread(request_log.append, {**ledger.summary(), "question": request.user_input})
+
+    final_state["usage"] = ledger.summary()
+    return final_state
+
+def format_response(final_state: MainState) -> dict:
+    return {
+        "request_id": final_state["request_id"],
+        "final_answer": final_state["final_answer"],
+        "taxonomies": final_state["taxonomies"],
+        "research_results": final_state["research_results"],
+        "thought_process": final_state["thought_process"],
+        "cached": "cache_similarity" in final_state,
+        "usage": final_state.get("usage"),
+    }
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return JSONResponse({
+        "embeddings": embedding_cache.stats(),
+        "answers": answer_cache.stats(),
+        "taxonomies": taxonomy_cache.stats(),
+        "search": search_cache.stats(),
+        "chunk_vectors": chunk_vectors.stats(),
+        "shared_chunks": chunk_registries.stats(),
+        "coalesced": {
+            "llm": llm_flights.stats(),
+            "embeddings": embedding_flights.stats(),
+            "search": search_flights.stats(),
+        },
+    })
+
+@app.get("/health")
+async def health():
+    """Liveness, and whether the graph has been built yet (it may not be with STARTUP_MODE lazy or background)"""
+    return JSONResponse({"status": "ok", "graph_ready": graph_registry.ready, "startup_mode": STARTUP_MODE})
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Node, LLM and search latency histograms and token counts in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/cache/answers/invalidate")
+async def invalidate_answers():
+    """Drop all cached answers, search results and chunk vectors, e.g. right after re-indexing documents"""
+    answer_cache.invalidate()
+    search_cache.clear()
+    chunk_vectors.clear()
+    return JSONResponse({"generation": answer_cache.generation})
+
+@app.post("/process")
+async def process_question(request: QuestionRequest):
+    final_state = await run_question(request, uuid.uuid4().hex)
+
+    if final_state["final_answer"]:
+        return JSONResponse(format_response(final_state))
+    else:
+        return JSONResponse(
+            {"error": "Unable to find a satisfactory answer."}, status_code=400
+        )
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/process/stream")
+async def process_question_stream(request: QuestionRequest):
+    """Server-sent events version of /process.
+
+    Emits ``update`` events for agent progress and ``token`` events for each chunk
+    of the final answer as it is generated, then a ``result`` event with the same
+    payload /process returns (or an ``error`` event).
+    """
+    request_id = uuid.uuid4().hex
+    # Subscribe before starting so no early update is missed; tokens must not be dropped
+    subscription = event_broker.subscribe(request.session_id or request_id, maxsize=STREAM_BUFFER_SIZE, policy="drop_oldest")
+    task = asyncio.create_task(run_question(request, request_id))
+    task.add_done_callback(lambda _: subscription.close())
+
+    async def event_stream():
+        try:
+            async for item in subscription:
+                if item.get("message_type") == "final_answer":
+                    continue  # Sent in full with the result event
+                yield format_sse(item.get("message_type", "update"), item)
+
+            final_state = await task
+            if final_state["final_answer"]:
+                yield format_sse("result", format_response(final_state))
+            else:
+                yield format_sse("error", {"error": "Unable to find a satisfactory answer."})
+        except Exception as e:
+            yield format_sse("error", {"error": str(e)})
+        finally:
+            event_broker.unsubscribe(subscription)
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/ws/results")
+async def stream_results(user_updates: WebSocket, session_id: str | None = None):
+    """Updates and final answers of the /process requests sent with ``session_id`` (``?session_id=``)"""
+    await user_updates.accept()  # Accept the WebSocket connection
+    if not session_id:
+        # Accepted first, so the client gets a reason rather than a bare handshake rejection
+        await user_updates.close(code=1008, reason="Missing ?session_id=, the session_id sent with /process")
+        return
+    subscription = event_broker.subscribe(session_id)
+
+    async def watch_disconnect():
+        # Drop the subscription as soon as the client goes away, even if the channel is idle
+        try:
+            while True:
+                await user_updates.receive_text()
+        except Exception:
+            event_broker.unsubscribe(subscription)
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        async for item in subscription:
+            await user_updates.send_json(item)
+
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"Error streaming results for session {session_id}: {str(e)}")
+    finally:
+        watcher.cancel()
+        event_broker.unsubscribe(subscription)
+        if user_updates.client_state == WebSocketState.CONNECTED:
+            await user_updates.close()
+
+# from fastapi import FastAPI
+# from fastapi.responses import PlainTextResponse
+# import sys
+
+# app = FastAPI()
+
+
+# @app.get("/")
+# async def index():
+#     version = sys.version_info
+#     return PlainTextResponse(
+#         content=f"Hello World, I am Python {version.major}.{version.minor}"
+#     )
+
+
+# if __name__ == "__main__":
+#     #import uvicorn
+#     #uvicorn.run(app, port=8000)
+#     import asyncio
+    
+#     asyncio.run(process_question(QuestionRequest(
+#         user_input="What are the tax implications for a small business owner when they receive a grant from the government?",
+#         history=""
+#     )))
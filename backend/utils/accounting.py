@@ -0,0 +1,162 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List
+import json
+import os
+import threading
+import time
+
+from backend.utils.prompt_budget import count_tokens
+
+# Prompt plus completion tokens a request may spend before its research branches stop
+# retrying and finalize with what they have; 0 leaves requests unlimited
+REQUEST_TOKEN_BUDGET = int(os.environ.get("REQUEST_TOKEN_BUDGET", "0"))
+# JSON lines file receiving one usage summary per request; no log is kept unless set
+REQUEST_LOG_PATH = os.environ.get("REQUEST_LOG_PATH")
+
+USAGE_FIELDS = ("llm_calls", "input_tokens", "cached_tokens", "output_tokens",
+                "embedding_calls", "embedding_tokens", "search_calls")
+
+
+class RequestLedger:
+    """What one request spent, attributed to the research branch (taxonomy) that spent it.
+
+    Calls made outside the research branches (taxonomy extraction, the final
+    answer, answer-cache lookups) are attributed to no taxonomy and reported under
+    ``other``. Only calls that reached a service are counted: cache hits are free.
+    """
+
+    def __init__(self, request_id: str, token_budget: int = REQUEST_TOKEN_BUDGET):
+        self.request_id = request_id
+        self.token_budget = token_budget
+        self.started = time.time()
+        self.finished = None
+        self.__usage: Dict[str | None, Dict[str, int]] = {}
+        self.__calls: Dict[str, int] = {}
+        self.__lock = threading.Lock()
+
+    def record_llm(self, call_name: str, usage: Dict[str, int], taxonomy: str | None = None) -> None:
+        with self.__lock:
+            self.__calls[call_name] = self.__calls.get(call_name, 0) + 1
+            self.__add(taxonomy, llm_calls=1, input_tokens=usage["input_tokens"],
+                       cached_tokens=usage["cached_tokens"], output_tokens=usage["output_tokens"])
+
+    def record_embeddings(self, texts: List[str], model: str, taxonomy: str | None = None) -> None:
+        tokens = sum(count_tokens(text, model) for text in texts)
+        with self.__lock:
+            self.__add(taxonomy, embedding_calls=1, embedding_tokens=tokens)
+
+    def record_search(self, taxonomy: str | None = None) -> None:
+        with self.__lock:
+            self.__add(taxonomy, search_calls=1)
+
+    def totals(self) -> Dict[str, int]:
+        with self.__lock:
+            return {field: sum(usage[field] for usage in self.__usage.values()) for field in USAGE_FIELDS}
+
+    def budget_exhausted(self) -> bool:
+        if self.token_budget <= 0:
+            return False
+        totals = self.totals()
+        return totals["input_tokens"] + totals["output_tokens"] >= self.token_budget
+
+    def finish(self) -> None:
+        if self.finished is None:
+            self.finished = time.time()
+
+    def summary(self) -> Dict[str, Any]:
+        with self.__lock:
+            by_taxonomy = {taxonomy: dict(usage) for taxonomy, usage in self.__usage.items() if taxonomy is not None}
+            other = dict(self.__usage.get(None) or self.__empty())
+            calls = dict(self.__calls)
+        return {
+            "request_id": self.request_id,
+            "wall_seconds": round((self.finished or time.time()) - self.started, 3),
+            "totals": self.totals(),
+            "by_taxonomy": by_taxonomy,
+            "other": other,
+            "llm_calls_by_name": calls,
+            "token_budget": self.token_budget,
+            "budget_exhausted": self.budget_exhausted(),
+        }
+
+    def __add(self, taxonomy: str | None, **amounts: int) -> None:
+        usage = self.__usage.setdefault(taxonomy, self.__empty())
+        for field, amount in amounts.items():
+            usage[field] += amount
+
+    @staticmethod
+    def __empty() -> Dict[str, int]:
+        return {field: 0 for field in USAGE_FIELDS}
+
+
+class RequestLog:
+    """Appends one compact JSON line per request summary"""
+
+    def __init__(self, path: str | None = REQUEST_LOG_PATH):
+        self.path = path
+        self.__lock = threading.Lock()
+
+    def append(self, summary: Dict[str, Any]) -> None:
+        if not self.path:
+            return
+        line = json.dumps({"timestamp": time.time(), **summary}, separators=(",", ":"))
+        with self.__lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
+
+
+# The ledger of the request being served and the research branch being run. Graph nodes
+# run in tasks that copy the context, so both follow a request through the whole graph.
+current_ledger: ContextVar[RequestLedger | None] = ContextVar("current_ledger", default=None)
+current_taxonomy: ContextVar[str | None] = ContextVar("current_taxonomy", default=None)
+
+request_log = RequestLog()
+
+
+@contextmanager
+def request_scope(request_id: str) -> Iterator[RequestLedger]:
+    """Charge every call made inside the block to a new ledger for the request"""
+    ledger = RequestLedger(request_id)
+    token = current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        ledger.finish()
+        current_ledger.reset(token)
+
+
+def attribute_to_taxonomy(function: Callable) -> Callable:
+    """Decorator for research nodes: calls made while the node runs are charged to ``state["taxonomy"]``"""
+    @wraps(function)
+    async def wrapper(self, state, *args, **kwargs):
+        token = current_taxonomy.set(state.get("taxonomy"))
+        try:
+            return await function(self, state, *args, **kwargs)
+        finally:
+            current_taxonomy.reset(token)
+    return wrapper
+
+
+def record_llm_call(call_name: str, usage: Dict[str, int]) -> None:
+    ledger = current_ledger.get()
+    if ledger is not None:
+        ledger.record_llm(call_name, usage, current_taxonomy.get())
+
+
+def record_embeddings(texts: List[str], model: str) -> None:
+    ledger = current_ledger.get()
+    if ledger is not None:
+        ledger.record_embeddings(texts, model, current_taxonomy.get())
+
+
+def record_search() -> None:
+    ledger = current_ledger.get()
+    if ledger is not None:
+        ledger.record_search(current_taxonomy.get())
+
+
+def request_budget_exhausted() -> bool:
+    """Whether the current request has spent its token budget"""
+    ledger = current_ledger.get()
+    return ledger is not None and ledger.budget_exhausted()
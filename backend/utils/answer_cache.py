@@ -0,0 +1,125 @@
+from typing import Any, Awaitable, Callable, Dict, List
+import copy
+import os
+import time
+
+import numpy as np
+
+from backend.utils.caching import LRUCache, digest, normalize_text, unit_vector
+
+# Off by default: it adds an embeddings call in front of every question and serves stored
+# answers to paraphrases, which operators should opt into
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", "0.95"))
+# How often (seconds) to ask the index whether it changed since the answers were cached
+ANSWER_CACHE_INDEX_CHECK_INTERVAL = float(os.environ.get("ANSWER_CACHE_INDEX_CHECK_INTERVAL", "60"))
+
+# Fields of the final state that are cached and served back unchanged
+CACHED_FIELDS = ("final_answer", "taxonomies", "research_results", "thought_process")
+
+
+class AnswerCache:
+    """Semantic cache of complete answers, placed in front of the multi-agent graph.
+
+    An entry matches when the chat history is identical (compared by digest) and the
+    question embedding is at least ``threshold`` cosine-similar to the cached one, so
+    paraphrases of an earlier question are answered without running the graph.
+    Every entry belongs to a generation; when the index reports a newer document
+    (latest ``created_date``) or ``invalidate`` is called, the generation moves on and
+    all older answers are dropped.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl: float | None = ANSWER_CACHE_TTL,
+                 threshold: float = ANSWER_CACHE_THRESHOLD, index_check_interval: float = ANSWER_CACHE_INDEX_CHECK_INTERVAL,
+                 enabled: bool = ANSWER_CACHE_ENABLED):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.index_check_interval = index_check_interval
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Async callable returning an opaque marker that changes whenever the index does
+        self.index_version_source: Callable[[], Awaitable[str | None]] | None = None
+        self.__entries = LRUCache(max_entries, ttl)
+        self.__index_version = None
+        self.__index_checked_at = 0.0
+
+    async def lookup(self, user_history: str, query_vector: List[float]) -> Dict[str, Any] | None:
+        """Return the cached answer payload for a question, or None"""
+        if not self.enabled:
+            return None
+        await self.refresh_generation()
+
+        history_digest = digest(normalize_text(user_history))
+        query = unit_vector(query_vector)
+        best_similarity, best_entry = -1.0, None
+        for _, entry in self.__entries.items():
+            if entry["history_digest"] != history_digest or entry["generation"] != self.generation:
+                continue
+            similarity = float(np.dot(query, entry["vector"]))
+            if similarity > best_similarity:
+                best_similarity, best_entry = similarity, entry
+
+        if best_entry is None or best_similarity < self.threshold:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.__entries.get(best_entry["key"])  # Refresh its LRU position
+        return {**best_entry["payload"], "cache_similarity": best_similarity}
+
+    async def store(self, user_input: str, user_history: str, query_vector: List[float], final_state: Dict[str, Any],
+                    generation: int | None = None) -> None:
+        """Cache a final state; ``generation`` is the one current when the run started"""
+        if not self.enabled:
+            return
+        if generation is not None and generation != self.generation:
+            return  # The index changed while the answer was being generated
+        key = digest(normalize_text(user_input), normalize_text(user_history))
+        self.__entries.set(key, {
+            "key": key,
+            "vector": unit_vector(query_vector),
+            "history_digest": digest(normalize_text(user_history)),
+            "generation": self.generation,
+            "payload": copy.deepcopy({field: final_state[field] for field in CACHED_FIELDS}),
+        })
+
+    async def refresh_generation(self) -> None:
+        """Start a new generation if the index changed since the last check"""
+        if self.index_version_source is None:
+            return
+        now = time.time()
+        if now - self.__index_checked_at < self.index_check_interval:
+            return
+        self.__index_checked_at = now
+        try:
+            version = await self.index_version_source()
+        except Exception as e:
+            print(f"Error checking the index version for the answer cache: {str(e)}")
+            return
+        if self.__index_version is not None and version != self.__index_version:
+            self.invalidate()
+        self.__index_version = version
+
+    def invalidate(self) -> None:
+        self.generation += 1
+        self.invalidations += 1
+        self.__entries.clear()
+
+    def stats(self) -> Dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.__entries),
+            "evictions": self.__entries.evictions,
+            "generation": self.generation,
+            "invalidations": self.invalidations,
+        }
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,220 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, Tuple
+import itertools
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from backend.utils.caching import LRUCache
+
+EVICTION_POLICIES = ("lru", "fifo")
+
+# LRU reads are recorded in memory and written in one transaction once this many are pending
+# (or on the next write), instead of an UPDATE and a commit on every read
+TOUCH_FLUSH_INTERVAL = 64
+
+
+class CacheBackend(ABC):
+    """Storage behind a memoization cache.
+
+    A record is a dict with a JSON-serializable ``value``, an optional float32
+    ``vector`` used for nearest-neighbour lookups, and a ``partition`` that limits
+    which records a nearest-neighbour scan has to look at. Implementations must
+    enforce their own TTL and size limits.
+    """
+
+    evictions = 0
+
+    @abstractmethod
+    def get(self, key: str) -> Dict[str, Any] | None:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, record: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def scan(self, partition: str, limit: int | None = None) -> Iterator[Tuple[str, np.ndarray]]:
+        """Keys and vectors of the live records of one partition that have a vector, most
+        recently used first, up to ``limit``. Values are not loaded; ``get`` the ones needed."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+
+class MemoryBackend(CacheBackend):
+    """Per-process backend built on the in-memory LRU"""
+
+    def __init__(self, max_entries: int, ttl: float | None = None, eviction: str = "lru"):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy '{eviction}', expected one of {EVICTION_POLICIES}")
+        self.__entries = LRUCache(max_entries, ttl, touch_on_get=eviction == "lru")
+
+    @property
+    def evictions(self) -> int:
+        return self.__entries.evictions
+
+    def get(self, key: str) -> Dict[str, Any] | None:
+        return self.__entries.get(key)
+
+    def set(self, key: str, record: Dict[str, Any]) -> None:
+        self.__entries.set(key, record)
+
+    def scan(self, partition: str, limit: int | None = None) -> Iterator[Tuple[str, np.ndarray]]:
+        records = ((key, record["vector"]) for key, record in self.__entries.items(newest_first=True)
+                   if record["partition"] == partition and record["vector"] is not None)
+        yield from itertools.islice(records, limit)
+
+    def clear(self) -> None:
+        self.__entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+
+class SQLiteBackend(CacheBackend):
+    """File-backed backend that several worker processes can share.
+
+    Uses WAL journaling and a busy timeout so concurrent readers and a writer in
+    different processes do not block each other for long. Several caches can share
+    one file by using different namespaces. With LRU eviction, reads only mark
+    their records as used in memory; the marks are written in batches, and always
+    before this process evicts anything.
+    """
+
+    def __init__(self, path: str, namespace: str, max_entries: int, ttl: float | None = None, eviction: str = "lru"):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy '{eviction}', expected one of {EVICTION_POLICIES}")
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.eviction = eviction
+        self.evictions = 0
+        self.__lock = threading.Lock()
+        self.__connection = None
+        # Read time of each key read since the last flush
+        self.__touched: Dict[str, float] = {}
+
+    def get(self, key: str) -> Dict[str, Any] | None:
+        with self.__lock:
+            connection = self.__connect()
+            row = connection.execute(
+                "SELECT partition, value, vector FROM cache_entries WHERE namespace = ? AND key = ? AND created_at >= ?",
+                (self.namespace, key, self.__oldest_allowed()),
+            ).fetchone()
+            if row is None:
+                return None
+            if self.eviction == "lru":
+                self.__touched[key] = time.time()
+                if len(self.__touched) >= TOUCH_FLUSH_INTERVAL:
+                    self.__flush_touches(connection)
+                    connection.commit()
+        return self.__to_record(*row)
+
+    def set(self, key: str, record: Dict[str, Any]) -> None:
+        vector = record.get("vector")
+        blob = None if vector is None else np.asarray(vector, dtype=np.float32).tobytes()
+        now = time.time()
+        with self.__lock:
+            connection = self.__connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, partition, value, vector, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, record["partition"], json.dumps(record["value"]), blob, now, now),
+            )
+            self.__touched.pop(key, None)
+            self.__flush_touches(connection)
+            self.__evict(connection)
+            connection.commit()
+
+    def scan(self, partition: str, limit: int | None = None) -> Iterator[Tuple[str, np.ndarray]]:
+        with self.__lock:
+            rows = self.__connect().execute(
+                "SELECT key, vector FROM cache_entries "
+                "WHERE namespace = ? AND partition = ? AND created_at >= ? AND vector IS NOT NULL "
+                "ORDER BY accessed_at DESC LIMIT ?",
+                (self.namespace, partition, self.__oldest_allowed(), -1 if limit is None else limit),
+            ).fetchall()
+        for key, vector in rows:
+            yield key, np.frombuffer(vector, dtype=np.float32)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__touched.clear()
+            connection = self.__connect()
+            connection.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+            connection.commit()
+
+    def close(self) -> None:
+        with self.__lock:
+            if self.__connection is not None:
+                self.__flush_touches(self.__connection)
+                self.__connection.commit()
+                self.__connection.close()
+                self.__connection = None
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return self.__connect().execute(
+                "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+
+    def __flush_touches(self, connection: sqlite3.Connection) -> None:
+        """Write the pending LRU read times; the caller commits"""
+        if self.__touched:
+            connection.executemany(
+                "UPDATE cache_entries SET accessed_at = MAX(accessed_at, ?) WHERE namespace = ? AND key = ?",
+                [(accessed_at, self.namespace, key) for key, accessed_at in self.__touched.items()],
+            )
+            self.__touched.clear()
+
+    def __evict(self, connection: sqlite3.Connection) -> None:
+        evicted = connection.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND created_at < ?",
+            (self.namespace, self.__oldest_allowed()),
+        ).rowcount
+        order_column = "accessed_at" if self.eviction == "lru" else "created_at"
+        evicted += connection.execute(
+            f"DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+            f"SELECT key FROM cache_entries WHERE namespace = ? ORDER BY {order_column} DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_entries),
+        ).rowcount
+        self.evictions += max(evicted, 0)
+
+    def __oldest_allowed(self) -> float:
+        return time.time() - self.ttl if self.ttl is not None else 0.0
+
+    @staticmethod
+    def __to_record(partition: str, value: str, vector: bytes | None) -> Dict[str, Any]:
+        return {
+            "partition": partition,
+            "value": json.loads(value),
+            "vector": None if vector is None else np.frombuffer(vector, dtype=np.float32),
+        }
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__connection is None:
+            self.__connection = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            self.__connection.execute("PRAGMA journal_mode=WAL")
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, partition TEXT NOT NULL, value TEXT NOT NULL, "
+                "vector BLOB, created_at REAL NOT NULL, accessed_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            # Serves the most-recently-used-first partition scans without sorting the partition
+            self.__connection.execute(
+                "CREATE INDEX IF NOT EXISTS cache_entries_partition_recent ON cache_entries (namespace, partition, accessed_at)"
+            )
+            self.__connection.execute("DROP INDEX IF EXISTS cache_entries_partition")
+            self.__connection.commit()
+        return self.__connection
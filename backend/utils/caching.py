@@ -0,0 +1,93 @@
+from collections import OrderedDict
+from typing import Any, Hashable, List
+import hashlib
+import re
+import time
+import unicodedata
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize free text for cache keys: unicode form, case, whitespace and trailing punctuation"""
+    text = unicodedata.normalize("NFKC", text or "")
+    text = _WHITESPACE.sub(" ", text).strip().lower()
+    return text.rstrip("?!.;: ")
+
+
+def digest(*parts: str) -> str:
+    """Stable hex digest of several string parts"""
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update((part or "").encode("utf-8"))
+        hasher.update(b"\x1f")
+    return hasher.hexdigest()
+
+
+def unit_vector(vector: List[float] | np.ndarray) -> np.ndarray:
+    """float32 copy of a vector scaled to unit length, so a dot product is the cosine similarity"""
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class LRUCache:
+    """In-memory LRU cache with an optional time-to-live per entry.
+
+    With ``touch_on_get=False`` reads do not refresh an entry, which turns the
+    eviction order into FIFO. Not thread-safe; it is meant to be used from the
+    event loop.
+    """
+
+    def __init__(self, max_entries: int, ttl: float | None = None, touch_on_get: bool = True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_on_get = touch_on_get
+        self.evictions = 0
+        self.__entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self.__entries.get(key)
+        if entry is None:
+            return default
+        created_at, value = entry
+        if self.ttl is not None and time.time() - created_at > self.ttl:
+            del self.__entries[key]
+            self.evictions += 1
+            return default
+        if self.touch_on_get:
+            self.__entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self.__entries[key] = (time.time(), value)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.max_entries:
+            self.__entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self.__entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        self.__entries.clear()
+
+    def items(self, newest_first: bool = False):
+        """Live (key, value) pairs, oldest first unless ``newest_first``; expired entries are skipped"""
+        now = time.time()
+        entries = list(self.__entries.items())
+        for key, (created_at, value) in reversed(entries) if newest_first else entries:
+            if self.ttl is None or now - created_at <= self.ttl:
+                yield key, value
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+
+_MISSING = object()
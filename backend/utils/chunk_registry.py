@@ -0,0 +1,125 @@
+from typing import Any, Dict, Iterable, List, Set, Tuple
+import os
+
+from backend.utils.caching import normalize_text
+
+# How research branches of one request use each other's work:
+#   off           - every branch reviews everything it retrieves
+#   same_taxonomy - reuse verdicts already given for the same taxonomy (e.g. repeated taxonomies)
+#   skip_vetted   - as same_taxonomy, and also skip chunks another taxonomy already vetted
+CHUNK_REUSE_POLICY = os.environ.get("CHUNK_REUSE_POLICY", "skip_vetted")
+CHUNK_REUSE_POLICIES = ("off", "same_taxonomy", "skip_vetted")
+
+
+class ChunkRegistry:
+    """Chunks seen by the research branches of one request.
+
+    Records which taxonomies retrieved each chunk and the review verdict it got
+    for each taxonomy, together with the tokens the chunk took up in that review
+    prompt, so branches can skip a review and count what that saved.
+    """
+
+    def __init__(self, policy: str = CHUNK_REUSE_POLICY):
+        if policy not in CHUNK_REUSE_POLICIES:
+            raise ValueError(f"Unknown chunk reuse policy '{policy}', expected one of {CHUNK_REUSE_POLICIES}")
+        self.policy = policy
+        self.__retrieved_by: Dict[str, Set[str]] = {}
+        self.__verdicts: Dict[str, Dict[str, bool]] = {}
+        self.__review_tokens: Dict[str, int] = {}
+        self.reused_verdicts = 0
+        self.skipped_chunks = 0
+        self.review_tokens_saved = 0
+
+    def record_retrieved(self, chunk_ids: List[str], taxonomy: str) -> None:
+        for chunk_id in chunk_ids:
+            self.__retrieved_by.setdefault(chunk_id, set()).add(normalize_text(taxonomy))
+
+    def record_verdict(self, chunk_id: str, taxonomy: str, valid: bool, review_tokens: int) -> None:
+        self.__verdicts.setdefault(chunk_id, {})[normalize_text(taxonomy)] = valid
+        self.__review_tokens[chunk_id] = review_tokens
+
+    def triage(self, results: List[Dict[str, Any]], taxonomy: str) -> Dict[str, List[Dict[str, Any]]]:
+        """Split freshly retrieved results into those to review and those settled by earlier reviews.
+
+        Returns a dict with ``review`` (still to be reviewed), ``valid`` and
+        ``invalid`` (verdict reused from the same taxonomy) and ``skipped`` (already
+        vetted for another taxonomy, so it will reach the final answer anyway).
+        """
+        triaged = {"review": [], "valid": [], "invalid": [], "skipped": []}
+        taxonomy_key = normalize_text(taxonomy)
+        for result in results:
+            verdicts = self.__verdicts.get(result["id"], {}) if self.policy != "off" else {}
+            if taxonomy_key in verdicts:
+                triaged["valid" if verdicts[taxonomy_key] else "invalid"].append(result)
+                self.reused_verdicts += 1
+            elif self.policy == "skip_vetted" and any(verdicts.values()):
+                triaged["skipped"].append(result)
+                self.skipped_chunks += 1
+            else:
+                triaged["review"].append(result)
+                continue
+            self.review_tokens_saved += self.__review_tokens.get(result["id"], 0)
+        return triaged
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "chunks_retrieved": len(self.__retrieved_by),
+            "chunks_retrieved_by_several_taxonomies": sum(1 for taxonomies in self.__retrieved_by.values() if len(taxonomies) > 1),
+            "chunks_reviewed": len(self.__verdicts),
+            "reused_verdicts": self.reused_verdicts,
+            "skipped_chunks": self.skipped_chunks,
+            "review_tokens_saved": self.review_tokens_saved,
+        }
+
+
+def pick_reviewed(results: List[Dict[str, Any]], indices: Iterable[int],
+                  shown: Set[int] | None = None) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """Results a review verdict refers to by index, and the indices that match no reviewed result.
+
+    Triage and pre-ranking shorten the batch below NUM_SEARCH_RESULTS, and the prompt
+    budget may leave results out, so an index from the model is only trusted if it
+    points at a result that was in the prompt (``shown``, all of them by default).
+    """
+    picked, ignored = [], []
+    for index in indices:
+        if 0 <= index < len(results) and (shown is None or index in shown):
+            picked.append(results[index])
+        else:
+            ignored.append(index)
+    return picked, ignored
+
+
+class ChunkRegistryStore:
+    """Request-scoped chunk registries, keyed by request ID.
+
+    The parallel research branches of a request run as separate graph nodes with
+    their own state, so they find their shared registry here. Totals of released
+    registries are kept for the process-wide stats.
+    """
+
+    def __init__(self, policy: str = CHUNK_REUSE_POLICY):
+        self.policy = policy
+        self.__registries: Dict[str, ChunkRegistry] = {}
+        self.__totals = {"requests": 0, "reused_verdicts": 0, "skipped_chunks": 0, "review_tokens_saved": 0}
+
+    def get(self, request_id: str) -> ChunkRegistry:
+        registry = self.__registries.get(request_id)
+        if registry is None:
+            registry = self.__registries[request_id] = ChunkRegistry(self.policy)
+        return registry
+
+    def release(self, request_id: str) -> None:
+        """Drop a request's registry once the request is done"""
+        registry = self.__registries.pop(request_id, None)
+        if registry is None:
+            return
+        self.__totals["requests"] += 1
+        self.__totals["reused_verdicts"] += registry.reused_verdicts
+        self.__totals["skipped_chunks"] += registry.skipped_chunks
+        self.__totals["review_tokens_saved"] += registry.review_tokens_saved
+
+    def stats(self) -> Dict[str, int]:
+        return {"policy": self.policy, "active_requests": len(self.__registries), **self.__totals}
+
+
+chunk_registries = ChunkRegistryStore()
@@ -1,9 +1,7 @@
-from pydantic import BaseModel
+from functools import lru_cache
+from pydantic import BaseModel, Field, create_model
 from typing import List, Dict, Any, Literal, Set, TypedDict, Annotated
 import operator
-import asyncio
-
-data_queue = asyncio.Queue()
 
 NUM_SEARCH_RESULTS = 5
 
@@ -21,6 +19,7 @@ class SearchResult(TypedDict):
 class QuestionRequest(BaseModel):
     user_input: str
     history: str
+    session_id: str | None = None  # Updates are published on this channel when given
 
 class ReviewDecision(BaseModel):
     """Schema for review agent decisions"""
@@ -31,6 +30,19 @@ class ReviewDecision(BaseModel):
     decision: Literal["retry", "finalize"]
 
 
+@lru_cache(maxsize=None)
+def review_decision_schema(num_results: int) -> type[ReviewDecision]:
+    """ReviewDecision whose indices only range over the ``num_results`` results in the review prompt"""
+    if num_results == NUM_SEARCH_RESULTS:
+        return ReviewDecision
+    if num_results > 0:
+        indices = (List[Literal[tuple(range(num_results))]], ...)
+    else:
+        indices = (List[int], Field(max_length=0))
+    return create_model("ReviewDecision", __base__=ReviewDecision, __doc__=ReviewDecision.__doc__,
+                        valid_results=indices, invalid_results=indices)
+
+
 class SearchPromptResponse(BaseModel):
     """Schema for search prompt responses"""
 
@@ -38,6 +50,12 @@ class SearchPromptResponse(BaseModel):
     filter: str | None
 
 
+class MultiSearchPromptResponse(BaseModel):
+    """Schema for several diverse search prompts generated in one call"""
+
+    searches: List[SearchPromptResponse] = Field(min_length=1)
+
+
 class TaxonomyExtraction(BaseModel):
     """Schema for taxonomy extraction"""
 
@@ -47,6 +65,8 @@ class TaxonomyExtraction(BaseModel):
 
 # Main state for the overall workflow
 class MainState(TypedDict):
+    request_id: str
+    session_id: str | None
     user_input: str
     user_history: str
     taxonomies: List[str]
@@ -57,6 +77,13 @@ class MainState(TypedDict):
     research_outputs: Annotated[List[Dict[str, Any]], operator.add]
 
 
+# A piece of prompt text formatted once and reused on every later attempt
+class PromptSegment(TypedDict):
+    text: str
+    tokens: int
+    score: float
+
+
 # Output state for research agents
 class ResearchOutputState(TypedDict):
     research_outputs: List[Dict[str, Any]]  # This field needs to match one in MainState
@@ -64,6 +91,8 @@ class ResearchOutputState(TypedDict):
 
 # State for individual research agents
 class ResearchState(TypedDict):
+    request_id: str
+    session_id: str | None
     taxonomy: str
     user_input: str
     user_history: str
@@ -76,6 +105,32 @@ class ResearchState(TypedDict):
     attempts: int  # Track number of search attempts
     search_history: List[Dict[str, Any]]  # Track previous search queries and filters
     thought_process: List[Dict[str, Any]]  # List of thought process steps
+    prompt_tokens: int  # Prompt tokens sent by this branch's LLM calls
+    history_segments: List[PromptSegment]  # Formatted attempts, appended once per review
+    vetted_segments: List[PromptSegment]  # Formatted vetted results, appended as results are vetted
+
+
+def new_research_state(request_id: str, session_id: str | None, taxonomy: str, user_input: str, user_history: str) -> ResearchState:
+    """Initial state of a research branch for one taxonomy"""
+    return ResearchState(
+        request_id=request_id,
+        session_id=session_id,
+        taxonomy=taxonomy,
+        user_input=user_input,
+        user_history=user_history,
+        current_results=[],
+        vetted_results=[],
+        discarded_results=[],
+        processed_ids=set(),
+        reviews=[],
+        decisions=[],
+        attempts=0,
+        search_history=[],
+        thought_process=[],
+        prompt_tokens=0,
+        history_segments=[],
+        vetted_segments=[]
+    )
 
 class ChatState(TypedDict):
     user_input: str
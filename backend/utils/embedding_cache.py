@@ -0,0 +1,201 @@
+from typing import Awaitable, Callable, Dict, List
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from backend.utils.caching import LRUCache, digest, normalize_text
+from backend.utils.vector_store import MmapVectorStore
+
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_TTL = float(os.environ.get("EMBEDDING_CACHE_TTL", "86400"))
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH")  # Disk tier is off unless set
+EMBEDDING_CACHE_DTYPE = os.environ.get("EMBEDDING_CACHE_DTYPE", "float32")
+EMBEDDING_CACHE_DISK_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_DISK_MAX_ENTRIES", "200000"))
+# "sqlite" (one blob per row, with TTL and size eviction) or "mmap" (an MmapVectorStore directory,
+# which also accepts EMBEDDING_CACHE_DTYPE=int8 but never expires or evicts entries)
+EMBEDDING_CACHE_BACKEND = os.environ.get("EMBEDDING_CACHE_BACKEND", "sqlite")
+
+DISK_DTYPES = {"float32": np.float32, "float16": np.float16}
+
+# Enforce the disk size limit every this many writes rather than on each one
+EVICTION_INTERVAL = 100
+
+
+class SQLiteEmbeddingStore:
+    """On-disk embedding store keeping vectors as compact float32 or float16 blobs"""
+
+    def __init__(self, path: str, dtype: str = "float32", ttl: float | None = None, max_entries: int | None = None):
+        if dtype not in DISK_DTYPES:
+            raise ValueError(f"Unsupported embedding dtype '{dtype}', expected one of {list(DISK_DTYPES)}")
+        self.path = path
+        self.dtype = dtype
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evictions = 0
+        self.__puts = 0
+        self.__lock = threading.Lock()
+        self.__connection = None
+
+    def get(self, key: str) -> np.ndarray | None:
+        with self.__lock:
+            row = self.__connect().execute(
+                "SELECT dtype, vector, created_at FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            dtype, blob, created_at = row
+            if self.ttl is not None and time.time() - created_at > self.ttl:
+                self.__connect().execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self.__connect().commit()
+                self.evictions += 1
+                return None
+        return np.frombuffer(blob, dtype=DISK_DTYPES[dtype]).astype(np.float32)
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        blob = np.asarray(vector, dtype=DISK_DTYPES[self.dtype]).tobytes()
+        with self.__lock:
+            connection = self.__connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO embeddings (key, dtype, dim, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, self.dtype, len(vector), blob, time.time()),
+            )
+            self.__puts += 1
+            if self.max_entries is not None and self.__puts % EVICTION_INTERVAL == 0:
+                # Size-based eviction: drop the oldest rows beyond the limit
+                evicted = connection.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                ).rowcount
+                self.evictions += max(evicted, 0)
+            connection.commit()
+
+    def purge_expired(self) -> int:
+        if self.ttl is None:
+            return 0
+        with self.__lock:
+            connection = self.__connect()
+            evicted = connection.execute("DELETE FROM embeddings WHERE created_at < ?", (time.time() - self.ttl,)).rowcount
+            connection.commit()
+        self.evictions += evicted
+        return evicted
+
+    def close(self) -> None:
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.close()
+                self.__connection = None
+
+    def __connect(self) -> sqlite3.Connection:
+        # Opened lazily so importing the module never touches the disk
+        if self.__connection is None:
+            self.__connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, dtype TEXT NOT NULL, dim INTEGER NOT NULL, "
+                "vector BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            self.__connection.execute("CREATE INDEX IF NOT EXISTS embeddings_created_at ON embeddings (created_at)")
+            self.__connection.commit()
+        return self.__connection
+
+
+class EmbeddingCache:
+    """Two-tier cache for query embeddings: an in-memory LRU in front of an optional disk store.
+
+    Keys combine the normalized query text with the embedding model name, so
+    trivially different spellings of a query ("What is CIR?" / "what is cir") share
+    one entry and vectors from different models never mix.
+    """
+
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_SIZE, ttl: float | None = EMBEDDING_CACHE_TTL,
+                 disk_store: SQLiteEmbeddingStore | MmapVectorStore | None = None):
+        self.__memory = LRUCache(max_entries, ttl)
+        self.__disk = disk_store
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingCache":
+        disk_store = None
+        if EMBEDDING_CACHE_PATH and EMBEDDING_CACHE_BACKEND == "mmap":
+            # Embeddings are unit vectors already, so the store's normalization leaves them unchanged
+            disk_store = MmapVectorStore(EMBEDDING_CACHE_PATH, dtype=EMBEDDING_CACHE_DTYPE, rescore=False)
+        elif EMBEDDING_CACHE_PATH:
+            disk_store = SQLiteEmbeddingStore(
+                EMBEDDING_CACHE_PATH,
+                dtype=EMBEDDING_CACHE_DTYPE,
+                ttl=EMBEDDING_CACHE_TTL,
+                max_entries=EMBEDDING_CACHE_DISK_MAX_ENTRIES,
+            )
+        return cls(disk_store=disk_store)
+
+    @staticmethod
+    def key(text: str, model_name: str) -> str:
+        return digest(model_name, normalize_text(text))
+
+    async def aget(self, text: str, model_name: str) -> np.ndarray | None:
+        """Look a query up in memory, then on disk; a disk hit is promoted to memory"""
+        key = self.key(text, model_name)
+        vector = self.__memory.get(key)
+        if vector is not None:
+            self.memory_hits += 1
+            return vector
+        if self.__disk is not None:
+            vector = await asyncio.to_thread(self.__disk.get, key)
+            if vector is not None:
+                self.disk_hits += 1
+                self.__memory.set(key, vector)
+                return vector
+        self.misses += 1
+        return None
+
+    async def aset(self, text: str, model_name: str, vector: List[float] | np.ndarray) -> np.ndarray:
+        key = self.key(text, model_name)
+        vector = np.asarray(vector, dtype=np.float32)
+        self.__memory.set(key, vector)
+        if self.__disk is not None:
+            await asyncio.to_thread(self.__disk.put, key, vector)
+        return vector
+
+    async def aembed_query(self, text: str, model_name: str,
+                           embed: Callable[[str], Awaitable[List[float]]]) -> List[float]:
+        """Return the cached embedding for a query, calling ``embed`` only on a miss"""
+        vector = await self.aget(text, model_name)
+        if vector is None:
+            vector = await self.aset(text, model_name, await embed(text))
+        return vector.tolist()
+
+    async def aembed_queries(self, texts: List[str], model_name: str,
+                             embed_many: Callable[[List[str]], Awaitable[List[List[float]]]]) -> List[List[float]]:
+        """Embed several queries, sending every miss to ``embed_many`` in a single call"""
+        vectors = [await self.aget(text, model_name) for text in texts]
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            embedded = {}
+            for text, vector in zip(missing, await embed_many(missing)):
+                embedded[text] = await self.aset(text, model_name, vector)
+            vectors = [embedded[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return [vector.tolist() for vector in vectors]
+
+    def clear(self) -> None:
+        self.__memory.clear()
+
+    def stats(self) -> Dict[str, int | float]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self.__memory),
+            "memory_evictions": self.__memory.evictions,
+            "disk_evictions": self.__disk.evictions if self.__disk is not None else 0,
+        }
+
+
+embedding_cache = EmbeddingCache.from_env()
@@ -0,0 +1,53 @@
+from typing import Any, Dict, List
+import os
+
+import numpy as np
+
+from backend.utils.caching import unit_vector
+
+# Dimensions of text-embedding-3-large, as stored in content_vector
+EMBEDDING_DIMENSIONS = 3072
+# Index field holding the truncated vectors when SEARCH_VECTOR_DIMENSIONS is set
+SHORT_VECTOR_FIELD = "content_vector_short"
+# Results the truncated pass fetches per result kept, as the shortlist rescored on the full vectors
+VECTOR_RESCORE_FACTOR = int(os.environ.get("SEARCH_VECTOR_RESCORE_FACTOR", "4"))
+
+
+def search_vector_dimensions() -> int:
+    """Leading embedding dimensions searched in the first retrieval pass (``SEARCH_VECTOR_DIMENSIONS``,
+    e.g. 256, 512 or 1024), with the shortlist rescored on the full vectors; 0 searches the full vectors.
+
+    Read on every call, so scripts see the value from the .env they load after importing this module.
+    """
+    return int(os.environ.get("SEARCH_VECTOR_DIMENSIONS", "0"))
+
+
+def truncate_embedding(vector: List[float] | np.ndarray, dimensions: int) -> List[float]:
+    """Leading ``dimensions`` of an embedding, renormalized to unit length.
+
+    text-embedding-3 models are trained so that a prefix of the embedding is an
+    embedding in its own right (Matryoshka representation learning); this gives the
+    same vector as requesting ``dimensions`` from the API, so one full embedding
+    serves both the truncated search and the full-dimension rescoring.
+    """
+    return unit_vector(np.asarray(vector, dtype=np.float32)[:dimensions]).tolist()
+
+
+def rescore_full_dimensions(results: List[Dict[str, Any]], query_vector: List[float],
+                            field: str = "content_vector") -> List[Dict[str, Any]]:
+    """Rerank a shortlist retrieved with truncated vectors by full-dimension cosine similarity.
+
+    The shortlist should be deeper than the results finally kept (``VECTOR_RESCORE_FACTOR``
+    times): rescoring can only recover the documents the truncated pass ranked lower
+    if they are in it. Rescored results carry the similarity in ``score``; results
+    without a vector follow them in their search order.
+    """
+    with_vectors = [result for result in results if result.get(field) is not None]
+    if not with_vectors:
+        return results
+    vectors = np.asarray([result[field] for result in with_vectors], dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarities = vectors @ unit_vector(query_vector)
+    rescored = [{**with_vectors[position], "score": float(similarities[position])}
+                for position in np.argsort(-similarities, kind="stable")]
+    return rescored + [result for result in results if result.get(field) is None]
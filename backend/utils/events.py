@@ -0,0 +1,141 @@
+from collections import deque
+from typing import Any, Deque, Dict, Set
+import asyncio
+import os
+
+EVENT_BUFFER_SIZE = int(os.environ.get("EVENT_BUFFER_SIZE", "100"))
+EVENT_OVERFLOW_POLICY = os.environ.get("EVENT_OVERFLOW_POLICY", "coalesce")
+
+# What a subscriber buffer does with a new message when it is full:
+#   drop_oldest - discard the oldest buffered message
+#   drop_newest - discard the incoming message
+#   coalesce    - replace the oldest buffered message from the same source, falling
+#                 back to drop_oldest when there is none
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "coalesce")
+
+# Token frames are fragments of one answer, so merging them would garble the text
+NON_COALESCABLE_TYPES = {"token"}
+
+
+class Subscription:
+    """Bounded message buffer for a single subscriber of a channel"""
+
+    def __init__(self, channel_id: str, maxsize: int, policy: str):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}', expected one of {OVERFLOW_POLICIES}")
+        self.channel_id = channel_id
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.closed = False
+        self.__buffer: Deque[Dict[str, Any]] = deque()
+        self.__ready = asyncio.Event()
+
+    def offer(self, message: Dict[str, Any]) -> None:
+        """Buffer a message without blocking, applying the overflow policy if full"""
+        if self.closed:
+            return
+        if len(self.__buffer) >= self.maxsize:
+            self.dropped += 1
+            if self.policy == "drop_newest":
+                return
+            if not (self.policy == "coalesce" and self.__coalesce(message)):
+                self.__buffer.popleft()
+        self.__buffer.append(message)
+        self.__ready.set()
+
+    async def get(self) -> Dict[str, Any] | None:
+        """Wait for the next message; returns None once the subscription is closed and drained"""
+        while not self.__buffer:
+            if self.closed:
+                return None
+            self.__ready.clear()
+            await self.__ready.wait()
+        return self.__buffer.popleft()
+
+    def close(self) -> None:
+        self.closed = True
+        self.__ready.set()
+
+    def __len__(self) -> int:
+        return len(self.__buffer)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        message = await self.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    def __coalesce(self, message: Dict[str, Any]) -> bool:
+        if message.get("message_type") in NON_COALESCABLE_TYPES:
+            return False
+        source = message.get("message_source")
+        for i, buffered in enumerate(self.__buffer):
+            if buffered.get("message_type") in NON_COALESCABLE_TYPES:
+                continue
+            if buffered.get("message_source") == source:
+                del self.__buffer[i]
+                return True
+        return False
+
+
+class EventBroker:
+    """Publish/subscribe broker for agent updates, keyed by request or session ID.
+
+    Messages published to a channel are fanned out to the bounded buffer of every
+    current subscriber; a channel without subscribers buffers nothing, so memory
+    stays flat no matter how many requests run without a listening socket.
+    """
+
+    def __init__(self, maxsize: int = EVENT_BUFFER_SIZE, policy: str = EVENT_OVERFLOW_POLICY):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.__channels: Dict[str, Set[Subscription]] = {}
+
+    def subscribe(self, channel_id: str, maxsize: int | None = None, policy: str | None = None) -> Subscription:
+        subscription = Subscription(channel_id, maxsize or self.maxsize, policy or self.policy)
+        self.__channels.setdefault(channel_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscription.close()
+        subscribers = self.__channels.get(subscription.channel_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self.__channels[subscription.channel_id]
+
+    def publish(self, channel_id: str, message: Dict[str, Any]) -> int:
+        """Deliver a message to every subscriber of a channel; returns the number of subscribers"""
+        subscribers = self.__channels.get(channel_id)
+        if not subscribers:
+            return 0
+        for subscription in subscribers:
+            subscription.offer(message)
+        return len(subscribers)
+
+    def close_channel(self, channel_id: str) -> None:
+        """End a channel, e.g. when its request finishes; subscribers drain and then stop"""
+        for subscription in self.__channels.pop(channel_id, set()):
+            subscription.close()
+
+    def stats(self) -> Dict[str, int]:
+        subscriptions = [s for subscribers in self.__channels.values() for s in subscribers]
+        return {
+            "channels": len(self.__channels),
+            "subscribers": len(subscriptions),
+            "buffered_messages": sum(len(s) for s in subscriptions),
+            "dropped_messages": sum(s.dropped for s in subscriptions),
+        }
+
+
+def event_channel(state: Dict[str, Any]) -> str:
+    """Channel that updates for a run go to: the session if the client gave one, else the request"""
+    return state.get("session_id") or state["request_id"]
+
+
+event_broker = EventBroker()
@@ -0,0 +1,96 @@
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict
+import asyncio
+import os
+import random
+import threading
+
+from backend.utils.metrics import observe_llm_cancelled, observe_llm_hedge, observe_llm_hedge_win
+
+# Seconds one LLM or embeddings call may take in total (queueing, retries and hedges included)
+# before it is cancelled; 0 waits indefinitely
+LLM_CALL_TIMEOUT = float(os.environ.get("LLM_CALL_TIMEOUT", "60"))
+# Further attempts after a transient service error, made by the app only (the clients' own retries are off)
+LLM_CALL_RETRIES = int(os.environ.get("LLM_CALL_RETRIES", "2"))
+# Retry n waits a random time between 0 and LLM_RETRY_BACKOFF * 2**n seconds ("full jitter")
+LLM_RETRY_BACKOFF = float(os.environ.get("LLM_RETRY_BACKOFF", "0.5"))
+# Send a duplicate request when the first one is slower than this quantile of recent calls of the same kind
+LLM_HEDGE_ENABLED = os.environ.get("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_QUANTILE = float(os.environ.get("LLM_HEDGE_QUANTILE", "0.9"))
+# Recent latencies kept per call, and how many are needed before hedging starts
+LLM_HEDGE_WINDOW = int(os.environ.get("LLM_HEDGE_WINDOW", "200"))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies per call name"""
+
+    def __init__(self, window: int = LLM_HEDGE_WINDOW, min_samples: int = LLM_HEDGE_MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self.__samples: Dict[str, Deque[float]] = {}
+        self.__lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self.__lock:
+            self.__samples.setdefault(name, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, name: str, q: float) -> float | None:
+        """Latency quantile of ``name``, or None until enough calls have been observed"""
+        with self.__lock:
+            samples = sorted(self.__samples.get(name, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+latency_tracker = LatencyTracker()
+
+
+def retry_delay(attempt: int, backoff: float = LLM_RETRY_BACKOFF) -> float:
+    """Jittered exponential backoff before retry ``attempt`` (0-based)"""
+    return random.uniform(0, backoff * 2 ** attempt)
+
+
+async def hedged(request: Callable[[], Awaitable[Any]], call_name: str,
+                 can_hedge: Callable[[], bool] = lambda: True) -> Any:
+    """
+    Run ``request`` and, if it is slower than usual, race a duplicate against it.
+
+    The duplicate is sent once the first request has run for the ``LLM_HEDGE_QUANTILE``
+    latency of recent ``call_name`` calls, provided ``can_hedge()`` still allows it
+    (it should not when the deployment is already saturated). Whichever request
+    succeeds first wins and the other is cancelled. Only if both fail does the error
+    of the first one propagate.
+    """
+    threshold = latency_tracker.quantile(call_name, LLM_HEDGE_QUANTILE) if LLM_HEDGE_ENABLED else None
+    first = asyncio.ensure_future(request())
+    if threshold is None:
+        return await first
+
+    tasks = {first}
+    # A request still running when this returns lost the race; otherwise the caller gave up
+    reason = "caller"
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=threshold)
+        if done or not can_hedge():
+            return await first
+
+        second = asyncio.ensure_future(request())
+        tasks.add(second)
+        observe_llm_hedge(call_name)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        observe_llm_hedge_win(call_name)
+                    reason = "hedge"
+                    return task.result()
+        return first.result()  # Both failed; raises the first request's error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+                observe_llm_cancelled(call_name, reason)
@@ -1,23 +1,203 @@
-from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Tuple, TypeVar
+import asyncio
+import copy
+import itertools
+import time
 
-class LLM:
-    _llm_model = None
-    _embeddings_model = None
-    def __init__(self):
-        if LLM._llm_model is None:
-            LLM._llm_model = AzureChatOpenAI(
+from backend.utils.accounting import record_embeddings, record_llm_call
+from backend.utils.caching import digest
+from backend.utils.embedding_cache import embedding_cache
+from backend.utils.hedging import hedged, latency_tracker, retry_delay, LLM_CALL_RETRIES, LLM_CALL_TIMEOUT
+from backend.utils.metrics import observe_llm_call, observe_llm_cancelled, observe_llm_retry
+from backend.utils.prompt_budget import count_tokens
+from backend.utils.scheduler import (embedding_scheduler, llm_scheduler, CALL_PRIORITIES, EMBEDDINGS_DEPLOYMENT,
+                                     LLM_DEPLOYMENT, LLM_OUTPUT_TOKEN_ESTIMATE, PRIORITY_RETRIEVAL, PRIORITY_REVIEW)
+from backend.utils.singleflight import embedding_flights, llm_flights, messages_key
+
+# Status codes worth retrying: the request may well succeed a moment later
+TRANSIENT_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+T = TypeVar("T")
+
+class ModelClients(NamedTuple):
+    """Chat and embeddings clients shared by one set of agents.
+
+    A reload builds a new pair for the new agents instead of replacing these, so
+    requests still running on the previous graph keep the clients they started with.
+    """
+    chat: Any
+    embeddings: Any
+
+    @classmethod
+    def create(cls) -> "ModelClients":
+        # Imported on first construction, not at import time, to keep cold starts short
+        from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
+
+        return cls(
+            chat=AzureChatOpenAI(
                 model="gpt-4o",
-                #azure_deployment=aoai_deployment,
+                azure_deployment=LLM_DEPLOYMENT,
                 #api_version=api_version,
-                temperature=0
+                temperature=0,
                 #max_tokens=max_tokens,
                 #timeout=timeout,
-                #max_retries=max_retries,
+                # Retries are made by call_with_retries, under the scheduler and the call's deadline;
+                # the client's own would multiply them behind the scheduler's back
+                max_retries=0
                 #api_key=aoai_key,
                 #azure_endpoint=aoai_endpoint
-            )
-        if LLM._embeddings_model is None:
-            LLM._embeddings_model = AzureOpenAIEmbeddings(
-                azure_deployment="text-embedding-3-large"
-            )
-    
\ No newline at end of file
+            ),
+            embeddings=AzureOpenAIEmbeddings(
+                azure_deployment=EMBEDDINGS_DEPLOYMENT,
+                max_retries=0
+            ),
+        )
+
+
+class LLM:
+    # Clients of agents constructed without their own (benchmarks, a default build_main_graph)
+    _default_clients: ModelClients | None = None
+
+    def __init__(self, clients: ModelClients | None = None):
+        self.clients = clients if clients is not None else LLM.default_clients()
+
+    @classmethod
+    def default_clients(cls) -> ModelClients:
+        """Process-wide clients, created on first use"""
+        if LLM._default_clients is None:
+            LLM._default_clients = ModelClients.create()
+        return LLM._default_clients
+
+    async def aembed_cached_query(self, text: str, priority: int = PRIORITY_RETRIEVAL) -> List[float]:
+        """Embed a query, reusing the vector if the same query was embedded before"""
+        async def embed(text: str) -> List[float]:
+            # Only cache misses reach the service and are charged to the request
+            record_embeddings([text], EMBEDDINGS_DEPLOYMENT)
+            deadline = call_deadline()
+
+            async def request() -> List[float]:
+                async with asyncio.timeout_at(deadline), \
+                        embedding_scheduler.slot(priority, lambda: count_tokens(text, EMBEDDINGS_DEPLOYMENT)):
+                    return await self.clients.embeddings.aembed_query(text)
+            return await call_with_retries(request, "embeddings", deadline)
+        # Concurrent misses for the same text (e.g. a trending question) share one request
+        return await embedding_cache.aembed_query(
+            text, EMBEDDINGS_DEPLOYMENT,
+            lambda text: embedding_flights.do(digest(EMBEDDINGS_DEPLOYMENT, text), lambda: embed(text)))
+
+    async def aembed_cached_queries(self, texts: List[str], priority: int = PRIORITY_RETRIEVAL) -> List[List[float]]:
+        """Embed several queries with one request for all those not embedded before"""
+        async def embed(texts: List[str]) -> List[List[float]]:
+            record_embeddings(texts, EMBEDDINGS_DEPLOYMENT)
+            deadline = call_deadline()
+
+            async def request() -> List[List[float]]:
+                async with asyncio.timeout_at(deadline), \
+                        embedding_scheduler.slot(priority, lambda: sum(count_tokens(text, EMBEDDINGS_DEPLOYMENT) for text in texts)):
+                    return await self.clients.embeddings.aembed_documents(texts)
+            return await call_with_retries(request, "embeddings", deadline)
+        return await embedding_cache.aembed_queries(
+            texts, EMBEDDINGS_DEPLOYMENT,
+            lambda texts: embedding_flights.do(digest(EMBEDDINGS_DEPLOYMENT, *texts), lambda: embed(texts)))
+
+    @staticmethod
+    async def ainvoke_structured(model, messages: list, call_name: str) -> Tuple[Any, Dict[str, int]]:
+        """Invoke a model built with ``with_structured_output(..., include_raw=True)``.
+
+        The whole call, including its time in the scheduler queue, its retries of
+        transient service errors (with jittered backoff) and any hedged duplicate of a
+        slow request (see ``backend.utils.hedging``), is bounded by one ``LLM_CALL_TIMEOUT``
+        deadline. Returns the parsed output and the call's token usage, and logs how many
+        prompt tokens the provider served from its prompt cache.
+        """
+        async def call() -> Tuple[Any, Exception | None, Dict[str, int]]:
+            deadline = call_deadline()
+
+            async def request() -> Tuple[Any, Dict[str, int], float]:
+                try:
+                    # Waits in the slot while the deployment is at its request, token or concurrency limit
+                    async with asyncio.timeout_at(deadline), \
+                            llm_scheduler.slot(CALL_PRIORITIES.get(call_name, PRIORITY_REVIEW),
+                                               lambda: estimate_tokens(messages)) as reservation:
+                        start = time.perf_counter()
+                        response = await model.ainvoke(messages)
+                        seconds = time.perf_counter() - start
+                        usage = token_usage(response["raw"])
+                        reservation.settle(usage["input_tokens"] + usage["output_tokens"])
+                except TimeoutError:
+                    observe_llm_cancelled(call_name, "deadline")
+                    raise
+                latency_tracker.observe(call_name, seconds)
+                return response, usage, seconds
+
+            # No hedging while calls are queued: a duplicate would only add to the backlog
+            response, usage, seconds = await call_with_retries(
+                lambda: hedged(request, call_name, can_hedge=lambda: not llm_scheduler.stats()["queued"]),
+                call_name, deadline)
+
+            observe_llm_call(call_name, seconds, usage)
+            record_llm_call(call_name, usage)
+            return response["parsed"], response["parsing_error"], usage
+
+        # Identical calls in flight at once (the same question asked by several users) share one
+        # request; only the caller that made it is charged for it
+        parsed, parsing_error, usage = await llm_flights.do(messages_key(call_name, messages), call, copy=copy.deepcopy)
+        if parsing_error is not None:
+            raise parsing_error
+        log_usage(call_name, usage)
+        return parsed, usage
+
+def token_usage(message) -> Dict[str, int]:
+    """Input, cached input and output token counts reported for a model response"""
+    usage = getattr(message, "usage_metadata", None) or {}
+    cached_tokens = (usage.get("input_token_details") or {}).get("cache_read")
+    if cached_tokens is None:
+        # Older integrations only expose the raw OpenAI usage block
+        prompt_details = (message.response_metadata.get("token_usage") or {}).get("prompt_tokens_details") or {}
+        cached_tokens = prompt_details.get("cached_tokens", 0)
+    return {
+        "input_tokens": usage.get("input_tokens", 0),
+        "cached_tokens": cached_tokens or 0,
+        "output_tokens": usage.get("output_tokens", 0),
+    }
+
+
+def call_deadline(timeout: float = LLM_CALL_TIMEOUT) -> float | None:
+    """Event loop time by which a call starting now must finish, or None without a timeout"""
+    return asyncio.get_running_loop().time() + timeout if timeout else None
+
+
+async def call_with_retries(request: Callable[[], Awaitable[T]], call_name: str, deadline: float | None = None,
+                            retries: int = LLM_CALL_RETRIES) -> T:
+    """Await ``request()``, retrying transient errors with jittered backoff while the deadline allows"""
+    for attempt in itertools.count():
+        try:
+            return await request()
+        except Exception as e:
+            delay = retry_delay(attempt)
+            out_of_time = deadline is not None and asyncio.get_running_loop().time() + delay >= deadline
+            if attempt >= retries or out_of_time or not is_transient(e):
+                raise
+            reason = "timeout" if isinstance(e, TimeoutError) else "error"
+            observe_llm_retry(call_name, reason)
+            print(f"LLM call {call_name} failed ({type(e).__name__}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+def is_transient(error: Exception) -> bool:
+    """Timeouts, dropped connections and throttling or server errors, as opposed to bad requests"""
+    import openai
+
+    if isinstance(error, (TimeoutError, openai.APIConnectionError)):
+        return True
+    return getattr(error, "status_code", None) in TRANSIENT_STATUS_CODES
+
+
+def estimate_tokens(messages: List[Dict[str, str]], output_tokens: int = LLM_OUTPUT_TOKEN_ESTIMATE) -> int:
+    """Tokens to reserve for a call before it runs: its prompt plus the expected completion"""
+    return sum(count_tokens(message["content"]) for message in messages) + output_tokens
+
+
+def log_usage(call_name: str, usage: Dict[str, int]) -> None:
+    print(f"LLM USAGE - Call: {call_name}, Input Tokens: {usage['input_tokens']}, "
+          f"Cached Tokens: {usage['cached_tokens']}, Output Tokens: {usage['output_tokens']}")
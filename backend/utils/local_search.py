@@ -0,0 +1,542 @@
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple
+import asyncio
+import json
+import math
+import os
+import re
+import threading
+
+import numpy as np
+
+from backend.utils.ranking import RRF_K, tokenize
+from backend.utils.vector_store import MmapVectorStore
+
+LOCAL_SEARCH_PATH = os.environ.get("LOCAL_SEARCH_PATH", "local_search_index")
+# Where the local index keeps its vectors: "memory" (float32 matrix saved as .npy) or "mmap"
+# (a quantized MmapVectorStore under <path>/vectors, for corpora that do not fit in RAM)
+LOCAL_SEARCH_VECTOR_STORE = os.environ.get("LOCAL_SEARCH_VECTOR_STORE", "memory")
+LOCAL_SEARCH_VECTOR_DTYPE = os.environ.get("LOCAL_SEARCH_VECTOR_DTYPE", "int8")
+# Results the keyword side of a hybrid query contributes to the fusion, as in Azure AI Search
+TEXT_CANDIDATES = 50
+
+
+class IndexingResult(NamedTuple):
+    key: str
+    succeeded: bool
+    status_code: int
+
+
+class ODataFilter:
+    """The subset of OData filter syntax this repo uses, compiled to a predicate over documents.
+
+    Supports ``search.in(field, 'a,b'[, 'delimiters'])``, comparisons (``eq``, ``ne``,
+    ``gt``, ``ge``, ``lt``, ``le``) of a field with a string, number, boolean or null
+    literal, ``and``, ``or``, ``not`` and parentheses.
+    """
+
+    TOKEN_PATTERN = re.compile(r"\s*(?:(?P<string>'(?:[^']|'')*')|(?P<number>-?\d+(?:\.\d+)?)|(?P<punct>[(),])|(?P<name>[A-Za-z_][\w./]*))")
+    COMPARISONS = {
+        "eq": lambda a, b: a == b,
+        "ne": lambda a, b: a != b,
+        "gt": lambda a, b: a is not None and a > b,
+        "ge": lambda a, b: a is not None and a >= b,
+        "lt": lambda a, b: a is not None and a < b,
+        "le": lambda a, b: a is not None and a <= b,
+    }
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.__tokens = self.__tokenize(expression)
+        self.__position = 0
+        self.predicate = self.__parse_or()
+        if self.__position != len(self.__tokens):
+            raise ValueError(f"Unsupported filter syntax near '{self.__tokens[self.__position][1]}' in: {expression}")
+
+    def __call__(self, document: Dict[str, Any]) -> bool:
+        return self.predicate(document)
+
+    def __tokenize(self, expression: str) -> List[tuple]:
+        tokens, position = [], 0
+        expression = expression.rstrip()
+        while position < len(expression):
+            match = self.TOKEN_PATTERN.match(expression, position)
+            if match is None or match.end() == position:
+                raise ValueError(f"Unsupported filter syntax at position {position} in: {expression}")
+            tokens.append((match.lastgroup, match.group(match.lastgroup)))
+            position = match.end()
+        return tokens
+
+    def __peek(self) -> tuple | None:
+        return self.__tokens[self.__position] if self.__position < len(self.__tokens) else None
+
+    def __next(self, expected: str | None = None) -> tuple:
+        token = self.__peek()
+        if token is None and expected is None:
+            raise ValueError(f"Unexpected end of filter: {self.expression}")
+        if token is None or (expected is not None and token[1].lower() != expected):
+            raise ValueError(f"Expected '{expected}' in filter: {self.expression}")
+        self.__position += 1
+        return token
+
+    def __parse_or(self) -> Callable[[Dict[str, Any]], bool]:
+        predicates = [self.__parse_and()]
+        while self.__peek() is not None and self.__peek()[1].lower() == "or":
+            self.__next()
+            predicates.append(self.__parse_and())
+        return predicates[0] if len(predicates) == 1 else lambda document: any(p(document) for p in predicates)
+
+    def __parse_and(self) -> Callable[[Dict[str, Any]], bool]:
+        predicates = [self.__parse_factor()]
+        while self.__peek() is not None and self.__peek()[1].lower() == "and":
+            self.__next()
+            predicates.append(self.__parse_factor())
+        return predicates[0] if len(predicates) == 1 else lambda document: all(p(document) for p in predicates)
+
+    def __parse_factor(self) -> Callable[[Dict[str, Any]], bool]:
+        kind, value = self.__next()
+        if kind == "punct" and value == "(":
+            predicate = self.__parse_or()
+            self.__next(")")
+            return predicate
+        if kind == "name" and value.lower() == "not":
+            inner = self.__parse_factor()
+            return lambda document: not inner(document)
+        if kind == "name" and value.lower() == "search.in":
+            self.__next("(")
+            field = self.__next()[1]
+            self.__next(",")
+            values = self.__literal(self.__next())
+            delimiters = ", "
+            if self.__peek() is not None and self.__peek()[1] == ",":
+                self.__next()
+                delimiters = self.__literal(self.__next())
+            self.__next(")")
+            allowed = {item for item in re.split(f"[{re.escape(delimiters)}]", values) if item}
+            return lambda document: document.get(field) in allowed
+        if kind == "name":
+            operator = self.__next()[1].lower()
+            if operator not in self.COMPARISONS:
+                raise ValueError(f"Unsupported filter operator '{operator}' in: {self.expression}")
+            literal = self.__literal(self.__next())
+            compare = self.COMPARISONS[operator]
+            return lambda document: compare(document.get(value), literal)
+        raise ValueError(f"Unsupported filter syntax near '{value}' in: {self.expression}")
+
+    @staticmethod
+    def __literal(token: tuple) -> Any:
+        kind, value = token
+        if kind == "string":
+            return value[1:-1].replace("''", "'")
+        if kind == "number":
+            return float(value) if "." in value else int(value)
+        if kind == "name" and value.lower() in ("true", "false", "null"):
+            return {"true": True, "false": False, "null": None}[value.lower()]
+        raise ValueError(f"Expected a literal, got '{value}'")
+
+
+class LocalSearchIndex:
+    """In-process hybrid search index compatible with the Azure AI Search calls the repo makes.
+
+    Vectors live in one contiguous float32 matrix (normalized rows, so cosine
+    similarity is a single matrix-vector product) and ``content`` is indexed in a
+    BM25 inverted index. Hybrid queries fuse the keyword and vector rankings with
+    reciprocal rank fusion, like the service does. The index can be saved to and
+    loaded from a directory.
+
+    With a ``vector_store``, vectors are kept in that (memory-mapped, quantized)
+    store instead of the in-memory matrix; the store persists itself, so only the
+    documents are written on save.
+    """
+
+    def __init__(self, path: str | None = None, key_field: str = "id", text_field: str = "content",
+                 vector_field: str = "content_vector", k1: float = 1.2, b: float = 0.75,
+                 vector_store: MmapVectorStore | None = None):
+        self.path = path
+        self.key_field = key_field
+        self.text_field = text_field
+        self.vector_field = vector_field
+        self.k1 = k1
+        self.b = b
+        self.__lock = threading.RLock()
+        self.__documents: List[Dict[str, Any] | None] = []
+        self.__rows: Dict[str, int] = {}
+        self.__vectors = np.zeros((0, 0), dtype=np.float32)
+        self.__has_vector: List[bool] = []
+        self.__vector_store = vector_store
+        self.__postings: Dict[str, Dict[int, int]] = {}
+        self.__lengths: List[int] = []
+        if path is not None and os.path.exists(os.path.join(path, "documents.jsonl")):
+            self.load(path)
+
+    def __len__(self) -> int:
+        return len(self.__rows)
+
+    def upload_documents(self, documents: Iterable[Dict[str, Any]]) -> List[IndexingResult]:
+        """Insert or replace documents by key"""
+        return self.__upsert(documents, merge=False)
+
+    def merge_or_upload_documents(self, documents: Iterable[Dict[str, Any]]) -> List[IndexingResult]:
+        """Insert new documents, and update only the given fields of existing ones (their vector too, if given)"""
+        return self.__upsert(documents, merge=True)
+
+    def __upsert(self, documents: Iterable[Dict[str, Any]], merge: bool) -> List[IndexingResult]:
+        results, stored_keys, stored_vectors = [], [], []
+        with self.__lock:
+            for document in documents:
+                document = dict(document)
+                vector = document.pop(self.vector_field, None)
+                key = document[self.key_field]
+                row = self.__rows.get(key)
+                # A merge without a vector keeps the one the document has
+                keep_vector = merge and row is not None and vector is None
+                if row is None:
+                    row = len(self.__documents)
+                    self.__documents.append(None)
+                    self.__lengths.append(0)
+                    self.__has_vector.append(False)
+                    self.__rows[key] = row
+                else:
+                    self.__unindex_text(row)
+                    if merge:
+                        document = {**self.__documents[row], **document}
+                self.__documents[row] = document
+                self.__index_text(row, document.get(self.text_field) or "")
+                if self.__vector_store is None:
+                    if not keep_vector:
+                        self.__set_vector(row, vector)
+                elif vector is not None:
+                    stored_keys.append(key)
+                    stored_vectors.append(vector)
+                else:
+                    # The store outlives the documents file, so a reloaded document finds its vector there
+                    self.__has_vector[row] = key in self.__vector_store
+                results.append(IndexingResult(key, True, 201))
+            if stored_keys:
+                # One batched append per upload rather than one file write per document
+                self.__vector_store.add(stored_keys, stored_vectors)
+                for key in stored_keys:
+                    self.__has_vector[self.__rows[key]] = True
+        return results
+
+    def delete_documents(self, documents: Iterable[Dict[str, Any]]) -> List[IndexingResult]:
+        results = []
+        with self.__lock:
+            for document in documents:
+                key = document[self.key_field]
+                row = self.__rows.pop(key, None)
+                if row is not None:
+                    self.__unindex_text(row)
+                    self.__documents[row] = None
+                    self.__has_vector[row] = False
+                    if self.__vector_store is not None:
+                        self.__vector_store.delete([key])
+                results.append(IndexingResult(key, row is not None, 200 if row is not None else 404))
+        return results
+
+    def search(self, search_text: str | None = None, vector_queries: List[Any] | None = None, filter: str | None = None,
+               select: List[str] | None = None, top: int | None = None, skip: int | None = None,
+               order_by: List[str] | None = None, **kwargs) -> List[Dict[str, Any]]:
+        """Run a keyword, vector or hybrid query and return the selected fields plus ``@search.score``"""
+        top = 50 if top is None else top
+        skip = skip or 0
+        with self.__lock:
+            candidates = self.__filter_mask(filter)
+            rankings = []
+            if search_text and search_text.strip() != "*":
+                rankings.append(self.__text_ranking(search_text, candidates, max(TEXT_CANDIDATES, top + skip)))
+            for vector_query in vector_queries or []:
+                rankings.append(self.__vector_ranking(vector_query, candidates))
+
+            if not rankings:
+                rows = [(row, 1.0) for row in np.flatnonzero(candidates)]
+            elif len(rankings) == 1:
+                rows = rankings[0]
+            else:
+                rows = self.__fuse(rankings)
+
+            if order_by:
+                rows = self.__order(rows, order_by)
+            return [self.__to_result(row, score, select) for row, score in rows[skip:skip + top]]
+
+    def get_document(self, key: str, selected_fields: List[str] | None = None) -> Dict[str, Any]:
+        with self.__lock:
+            return self.__to_result(self.__rows[key], None, selected_fields)
+
+    def get_document_count(self) -> int:
+        return len(self)
+
+    def get_vectors(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Stored (unit) vectors of the given documents, without a round trip through lists"""
+        with self.__lock:
+            vectors = {}
+            for key in keys:
+                row = self.__rows.get(key)
+                if row is None or not self.__has_vector[row]:
+                    continue
+                vectors[key] = self.__vectors[row].copy() if self.__vector_store is None else self.__vector_store.get(key)
+            return vectors
+
+    def save(self, path: str | None = None) -> None:
+        """Write the documents (JSON lines) and, without a vector store, the vector matrix (.npy) to a directory"""
+        path = path or self.path
+        os.makedirs(path, exist_ok=True)
+        with self.__lock:
+            rows = sorted(self.__rows.values())
+            with open(os.path.join(path, "documents.jsonl"), "w", encoding="utf-8") as file:
+                for row in rows:
+                    file.write(json.dumps(self.__documents[row]) + "\n")
+            if self.__vector_store is not None:
+                return
+            # Aligned with documents.jsonl; documents without a vector get a zero row
+            vectors = np.zeros((len(rows), self.__vectors.shape[1]), dtype=np.float32)
+            for position, row in enumerate(rows):
+                if self.__has_vector[row]:
+                    vectors[position] = self.__vectors[row]
+            np.save(os.path.join(path, "vectors.npy"), vectors)
+
+    def load(self, path: str) -> None:
+        with open(os.path.join(path, "documents.jsonl"), encoding="utf-8") as file:
+            documents = [json.loads(line) for line in file if line.strip()]
+        vectors_path = os.path.join(path, "vectors.npy")
+        vectors = np.load(vectors_path) if os.path.exists(vectors_path) else np.zeros((0, 0), dtype=np.float32)
+        with self.__lock:
+            self.__documents, self.__rows, self.__postings, self.__lengths, self.__has_vector = [], {}, {}, [], []
+            self.__vectors = np.zeros((0, 0), dtype=np.float32)
+            has_vectors = vectors.shape[0] == len(documents) and vectors.shape[1] > 0
+            self.upload_documents(
+                {**document, self.vector_field: vectors[row]} if has_vectors and vectors[row].any() else document
+                for row, document in enumerate(documents)
+            )
+
+    def __set_vector(self, row: int, vector: List[float] | np.ndarray | None) -> None:
+        if vector is None:
+            self.__has_vector[row] = False
+            return
+        vector = np.asarray(vector, dtype=np.float32)
+        if self.__vectors.shape[1] == 0:
+            self.__vectors = np.zeros((max(len(self.__documents), 16), len(vector)), dtype=np.float32)
+        elif len(vector) != self.__vectors.shape[1]:
+            raise ValueError(f"Vector has {len(vector)} dimensions, the index stores {self.__vectors.shape[1]}")
+        if row >= self.__vectors.shape[0]:
+            # Grow geometrically so appending stays amortized O(1)
+            grown = np.zeros((max(row + 1, 2 * self.__vectors.shape[0]), self.__vectors.shape[1]), dtype=np.float32)
+            grown[:self.__vectors.shape[0]] = self.__vectors
+            self.__vectors = grown
+        self.__vectors[row] = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        self.__has_vector[row] = True
+
+    def __index_text(self, row: int, text: str) -> None:
+        terms = Counter(tokenize(text))
+        for term, frequency in terms.items():
+            self.__postings.setdefault(term, {})[row] = frequency
+        self.__lengths[row] = sum(terms.values())
+
+    def __unindex_text(self, row: int) -> None:
+        for term in set(tokenize(self.__documents[row].get(self.text_field) or "")):
+            postings = self.__postings.get(term)
+            if postings is not None:
+                postings.pop(row, None)
+                if not postings:
+                    del self.__postings[term]
+        self.__lengths[row] = 0
+
+    def __filter_mask(self, filter: str | None) -> np.ndarray:
+        alive = np.fromiter((document is not None for document in self.__documents), dtype=bool, count=len(self.__documents))
+        if not filter:
+            return alive
+        predicate = compile_filter(filter)
+        return np.fromiter(
+            (document is not None and predicate(document) for document in self.__documents),
+            dtype=bool, count=len(self.__documents),
+        )
+
+    def __text_ranking(self, search_text: str, candidates: np.ndarray, limit: int) -> List[tuple]:
+        """BM25 scores of the candidates matching any query term, best first"""
+        if not candidates.any():
+            return []
+        # Document frequencies span the whole index, so the idf does too (as in Azure AI Search);
+        # counting only the filtered candidates could turn it negative
+        total = len(self.__rows)
+        lengths = np.asarray(self.__lengths, dtype=np.float32)
+        average_length = float(lengths[candidates].mean()) or 1.0
+        scores = np.zeros(len(self.__documents), dtype=np.float32)
+        for term in set(tokenize(search_text)):
+            postings = self.__postings.get(term)
+            if not postings:
+                continue
+            rows = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            frequencies = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            idf = math.log(1 + (total - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += idf * frequencies * (self.k1 + 1) / (
+                frequencies + self.k1 * (1 - self.b + self.b * lengths[rows] / average_length))
+        scores[~candidates] = 0.0
+        return self.__top(scores, scores > 0, limit)
+
+    def __vector_ranking(self, vector_query: Any, candidates: np.ndarray) -> List[tuple]:
+        """Cosine top-k of a vector query (anything with ``vector`` and ``k_nearest_neighbors``).
+
+        Truncated (Matryoshka) query vectors are compared with the leading dimensions of the
+        stored vectors, so the index needs no separate field for them.
+        """
+        k = getattr(vector_query, "k_nearest_neighbors", None) or getattr(vector_query, "k", None) or 50
+        eligible = candidates & np.asarray(self.__has_vector, dtype=bool)
+        if self.__vector_store is not None:
+            return self.__store_ranking(vector_query.vector, eligible, k)
+        if self.__vectors.shape[1] == 0:
+            return []
+        query = np.asarray(vector_query.vector, dtype=np.float32)
+        # Not in place: the caller's vector may be this very array
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        if len(query) > self.__vectors.shape[1]:
+            raise ValueError(f"Query has {len(query)} dimensions, the index stores {self.__vectors.shape[1]}")
+        rows = min(len(self.__documents), self.__vectors.shape[0])
+        vectors = self.__vectors[:rows, :len(query)]
+        scores = np.zeros(len(self.__documents), dtype=np.float32)
+        scores[:rows] = vectors @ query
+        if len(query) < self.__vectors.shape[1]:
+            scores[:rows] /= np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)
+        return self.__top(scores, eligible, k)
+
+    def __store_ranking(self, vector: List[float], eligible: np.ndarray, k: int) -> List[tuple]:
+        """Vector top-k from the vector store, with the filter translated to a mask over store rows"""
+        store = self.__vector_store
+        mask = None
+        if not eligible.all():
+            mask = np.zeros(store.count, dtype=bool)
+            mask[[store.row(self.__documents[row][self.key_field]) for row in np.flatnonzero(eligible)]] = True
+        return [(self.__rows[key], score) for key, score in store.search(vector, k, mask=mask)]
+
+    @staticmethod
+    def __top(scores: np.ndarray, eligible: np.ndarray, limit: int) -> List[tuple]:
+        rows = np.flatnonzero(eligible)
+        if len(rows) > limit:
+            rows = rows[np.argpartition(-scores[rows], limit - 1)[:limit]]
+        rows = rows[np.argsort(-scores[rows], kind="stable")]
+        return [(int(row), float(scores[row])) for row in rows]
+
+    @staticmethod
+    def __fuse(rankings: List[List[tuple]]) -> List[tuple]:
+        fused: Dict[int, float] = {}
+        for ranking in rankings:
+            for rank, (row, _) in enumerate(ranking, 1):
+                fused[row] = fused.get(row, 0.0) + 1.0 / (RRF_K + rank)
+        return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+    def __order(self, rows: List[tuple], order_by: List[str]) -> List[tuple]:
+        for clause in reversed(order_by):
+            field, _, direction = clause.strip().partition(" ")
+            present = [item for item in rows if self.__documents[item[0]].get(field) is not None]
+            missing = [item for item in rows if self.__documents[item[0]].get(field) is None]
+            present.sort(key=lambda item: self.__documents[item[0]][field], reverse=direction.strip().lower() == "desc")
+            rows = present + missing
+        return rows
+
+    def __to_result(self, row: int, score: float | None, select: List[str] | None) -> Dict[str, Any]:
+        document = self.__documents[row]
+        fields = select or list(document)
+        result = {field: document.get(field) for field in fields if field != self.vector_field}
+        if select and self.vector_field in select and self.__has_vector[row]:
+            vector = self.__vectors[row] if self.__vector_store is None else self.__vector_store.get(document[self.key_field])
+            result[self.vector_field] = vector.tolist()
+        if score is not None:
+            result["@search.score"] = score
+        return result
+
+
+@lru_cache(maxsize=256)
+def compile_filter(expression: str) -> ODataFilter:
+    return ODataFilter(expression)
+
+
+@lru_cache(maxsize=None)
+def get_local_index(path: str = LOCAL_SEARCH_PATH) -> LocalSearchIndex:
+    """Process-wide index for a directory, shared by every client that opens it"""
+    if LOCAL_SEARCH_VECTOR_STORE == "mmap":
+        return LocalSearchIndex(path, vector_store=MmapVectorStore(os.path.join(path, "vectors"), dtype=LOCAL_SEARCH_VECTOR_DTYPE))
+    if LOCAL_SEARCH_VECTOR_STORE != "memory":
+        raise ValueError(f"Unknown LOCAL_SEARCH_VECTOR_STORE '{LOCAL_SEARCH_VECTOR_STORE}', expected 'memory' or 'mmap'")
+    return LocalSearchIndex(path)
+
+
+class LocalSearchClient:
+    """Drop-in for ``azure.search.documents.SearchClient`` backed by a ``LocalSearchIndex``"""
+
+    def __init__(self, index: LocalSearchIndex | None = None):
+        self.index = index if index is not None else get_local_index()
+
+    def search(self, search_text: str | None = None, **kwargs) -> List[Dict[str, Any]]:
+        return self.index.search(search_text, **kwargs)
+
+    def upload_documents(self, documents: Iterable[Dict[str, Any]]) -> List[IndexingResult]:
+        return self.index.upload_documents(documents)
+
+    def merge_or_upload_documents(self, documents: Iterable[Dict[str, Any]]) -> List[IndexingResult]:
+        return self.index.merge_or_upload_documents(documents)
+
+    def delete_documents(self, documents: Iterable[Dict[str, Any]]) -> List[IndexingResult]:
+        return self.index.delete_documents(documents)
+
+    def get_document_count(self) -> int:
+        return self.index.get_document_count()
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "LocalSearchClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class AsyncSearchResults:
+    """Async iterable over a finished result list, like ``AsyncSearchItemPaged``"""
+
+    def __init__(self, results: List[Dict[str, Any]]):
+        self.__results = results
+
+    def __aiter__(self) -> "AsyncSearchResults":
+        self.__iterator: Iterator[Dict[str, Any]] = iter(self.__results)
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        try:
+            return next(self.__iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def get_count(self) -> int:
+        return len(self.__results)
+
+
+class AsyncLocalSearchClient:
+    """Drop-in for ``azure.search.documents.aio.SearchClient``; queries run in a worker thread"""
+
+    def __init__(self, index: LocalSearchIndex | None = None):
+        self.index = index if index is not None else get_local_index()
+
+    async def search(self, search_text: str | None = None, **kwargs) -> AsyncSearchResults:
+        return AsyncSearchResults(await asyncio.to_thread(self.index.search, search_text, **kwargs))
+
+    async def upload_documents(self, documents: Iterable[Dict[str, Any]]) -> List[IndexingResult]:
+        return await asyncio.to_thread(self.index.upload_documents, list(documents))
+
+    async def merge_or_upload_documents(self, documents: Iterable[Dict[str, Any]]) -> List[IndexingResult]:
+        return await asyncio.to_thread(self.index.merge_or_upload_documents, list(documents))
+
+    async def delete_documents(self, documents: Iterable[Dict[str, Any]]) -> List[IndexingResult]:
+        return await asyncio.to_thread(self.index.delete_documents, list(documents))
+
+    async def get_document_count(self) -> int:
+        return self.index.get_document_count()
+
+    async def close(self) -> None:
+        pass
+
+    async def __aenter__(self) -> "AsyncLocalSearchClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
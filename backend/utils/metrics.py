@@ -0,0 +1,249 @@
+from abc import ABC, abstractmethod
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+import bisect
+import os
+import threading
+import time
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+
+# Upper bounds of the histogram buckets, Prometheus-style (cumulative, plus +Inf)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metric(ABC):
+    """A named metric with a fixed set of label names, one series per label combination"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"] + self._samples()
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Sample lines in the Prometheus text format"""
+
+
+class Counter(Metric):
+    """Monotonically increasing total; by convention the name ends in ``_total``"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.__values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self.__values[key] = self.__values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self.__values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self.__values)
+        return [f"{self.name}{format_labels(self.labelnames, key)} {value:g}" for key, value in sorted(values.items())]
+
+
+class Gauge(Metric):
+    """Current value that can go up and down, such as a queue depth"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.__values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self.__values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self.__values[key] = self.__values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self.__values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self.__values)
+        return [f"{self.name}{format_labels(self.labelnames, key)} {value:g}" for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    """Distribution of observations in cumulative buckets, with their sum and count"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per series: observations per bucket (the last one is +Inf), sum
+        self.__series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self.__series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def count(self, **labels) -> int:
+        series = self.__series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def _samples(self) -> List[str]:
+        samples = []
+        with self._lock:
+            series = {key: (list(counts), total[0]) for key, (counts, total) in self.__series.items()}
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = format_labels(self.labelnames, key, f'le="{le}"')
+                samples.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            samples.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {total:g}")
+            samples.append(f"{self.name}_count{format_labels(self.labelnames, key)} {cumulative}")
+        return samples
+
+
+class MetricsRegistry:
+    """Process-wide set of metrics, rendered together in the Prometheus text format"""
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self.__metrics: Dict[str, Metric] = {}
+        self.__lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.__register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.__register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.__register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+    def __register(self, metric: Metric) -> Metric:
+        # Registering the same name again returns the existing metric, so modules can be reloaded
+        with self.__lock:
+            return self.__metrics.setdefault(metric.name, metric)
+
+
+metrics = MetricsRegistry()
+
+NODE_SECONDS = metrics.histogram("rag_node_duration_seconds", "Duration of LangGraph node runs", ("node",))
+NODE_ERRORS = metrics.counter("rag_node_errors_total", "LangGraph node runs that raised", ("node",))
+LLM_CALL_SECONDS = metrics.histogram("rag_llm_call_duration_seconds", "Duration of LLM calls", ("call",))
+LLM_FIRST_TOKEN_SECONDS = metrics.histogram("rag_llm_first_token_seconds", "Time to the first streamed token", ("call",))
+LLM_TOKENS = metrics.histogram("rag_llm_tokens", "Tokens per LLM call, by kind (input, cached, output)",
+                               ("call", "kind"), TOKEN_BUCKETS)
+LLM_RETRIES = metrics.counter("rag_llm_retries_total", "LLM calls retried, by reason (timeout, error)", ("call", "reason"))
+LLM_HEDGES = metrics.counter("rag_llm_hedges_total", "LLM calls that sent a duplicate (hedge) request", ("call",))
+LLM_HEDGE_WINS = metrics.counter("rag_llm_hedge_wins_total", "Hedged LLM calls answered by the hedge request", ("call",))
+LLM_CANCELLED = metrics.counter("rag_llm_cancelled_total",
+                                "LLM requests cancelled, by reason (deadline, hedge, caller)", ("call", "reason"))
+SEARCH_SECONDS = metrics.histogram("rag_search_duration_seconds", "Duration of search index queries", ("backend",))
+SEARCH_HITS = metrics.histogram("rag_search_hits", "Results returned per search index query", ("backend",), COUNT_BUCKETS)
+
+
+def observe_llm_call(call_name: str, seconds: float, usage: Dict[str, int] | None) -> None:
+    """Record an LLM call's duration and, when the provider reported it, its token usage"""
+    if not metrics.enabled:
+        return
+    LLM_CALL_SECONDS.observe(seconds, call=call_name)
+    if usage is not None:
+        LLM_TOKENS.observe(usage["input_tokens"], call=call_name, kind="input")
+        LLM_TOKENS.observe(usage["cached_tokens"], call=call_name, kind="cached")
+        LLM_TOKENS.observe(usage["output_tokens"], call=call_name, kind="output")
+
+
+def observe_first_token(call_name: str, seconds: float) -> None:
+    if metrics.enabled:
+        LLM_FIRST_TOKEN_SECONDS.observe(seconds, call=call_name)
+
+
+def observe_llm_retry(call_name: str, reason: str) -> None:
+    if metrics.enabled:
+        LLM_RETRIES.inc(call=call_name, reason=reason)
+
+
+def observe_llm_hedge(call_name: str) -> None:
+    if metrics.enabled:
+        LLM_HEDGES.inc(call=call_name)
+
+
+def observe_llm_hedge_win(call_name: str) -> None:
+    if metrics.enabled:
+        LLM_HEDGE_WINS.inc(call=call_name)
+
+
+def observe_llm_cancelled(call_name: str, reason: str) -> None:
+    if metrics.enabled:
+        LLM_CANCELLED.inc(call=call_name, reason=reason)
+
+
+def observe_search(backend: str, seconds: float, hits: int) -> None:
+    if not metrics.enabled:
+        return
+    SEARCH_SECONDS.observe(seconds, backend=backend)
+    SEARCH_HITS.observe(hits, backend=backend)
+
+
+def timed_node(node: str) -> Callable:
+    """Decorator recording the duration (and failures) of an async graph node under ``node``"""
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        async def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return await function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            except Exception:
+                NODE_ERRORS.inc(node=node)
+                raise
+            finally:
+                NODE_SECONDS.observe(time.perf_counter() - start, node=node)
+        return wrapper
+    return decorator
@@ -0,0 +1,123 @@
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+import math
+import os
+
+import numpy as np
+
+from backend.utils.caching import unit_vector
+from backend.utils.ranking import tokenize
+
+# Share of the BM25 pre-rank score taken from the search service's own relevance score; BM25 alone
+# misses paraphrases and inflections ("grant" vs "grants") that the vector query matched
+PRERANK_SEARCH_WEIGHT = float(os.environ.get("PRERANK_SEARCH_WEIGHT", "0.5"))
+
+
+class PreRanker(ABC):
+    """CPU-only scoring of search candidates against the research context.
+
+    Runs between the search and the LLM review: candidates below ``min_score``
+    are dropped as clearly irrelevant and the rest are reordered, so the review
+    prompt only carries the most promising ones. When no candidate scores above
+    zero the scorer has no signal at all, and none is dropped.
+    """
+
+    needs_vectors = False
+    default_min_score = 0.0
+
+    def __init__(self, min_score: float | None = None):
+        self.min_score = self.default_min_score if min_score is None else min_score
+
+    @abstractmethod
+    def score(self, query_text: str, query_vector: List[float] | None, results: List[Dict[str, Any]]) -> List[float]:
+        """One score per result, higher is more relevant"""
+
+    def rank(self, query_text: str, query_vector: List[float] | None, results: List[Dict[str, Any]],
+             count: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Return the best ``count`` candidates at or above ``min_score`` (best first), and those below it"""
+        scores = self.score(query_text, query_vector, results) if results else []
+        min_score = self.min_score if any(score > 0 for score in scores) else -math.inf
+        kept, dropped = [], []
+        # Stable: ties keep the search order
+        for prerank_score, result in sorted(zip(scores, results), key=lambda item: item[0], reverse=True):
+            # Vectors are only fetched for scoring and should not travel further with the result
+            result.pop("content_vector", None)
+            result["prerank_score"] = prerank_score
+            (kept if prerank_score >= min_score else dropped).append(result)
+        return kept[:max(count, 0)], dropped
+
+
+class BM25PreRanker(PreRanker):
+    """Okapi BM25 over the candidate set, blended with the search score.
+
+    Both scores are normalized so the best candidate scores 1.0, then weighted by
+    ``search_weight``. A candidate with no query term in common with the context
+    is therefore only dropped if the search service also ranked it far below the best.
+    """
+
+    default_min_score = 0.1
+
+    def __init__(self, min_score: float | None = None, k1: float = 1.2, b: float = 0.75,
+                 search_weight: float = PRERANK_SEARCH_WEIGHT):
+        super().__init__(min_score)
+        self.k1 = k1
+        self.b = b
+        self.search_weight = search_weight
+
+    def score(self, query_text: str, query_vector: List[float] | None, results: List[Dict[str, Any]]) -> List[float]:
+        query_terms = set(tokenize(query_text))
+        documents = [Counter(tokenize(result["content"])) for result in results]
+        average_length = sum(sum(document.values()) for document in documents) / len(documents) or 1.0
+        document_frequency = Counter(term for document in documents for term in query_terms & document.keys())
+
+        scores = []
+        for document in documents:
+            length_norm = self.k1 * (1 - self.b + self.b * sum(document.values()) / average_length)
+            score = 0.0
+            for term in query_terms & document.keys():
+                idf = math.log(1 + (len(documents) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                score += idf * document[term] * (self.k1 + 1) / (document[term] + length_norm)
+            scores.append(score)
+
+        best = max(scores)
+        if best <= 0:
+            return [0.0] * len(scores)  # No lexical overlap anywhere: nothing to go on
+        search_scores = [max(float(result.get("score") or 0.0), 0.0) for result in results]
+        best_search = max(search_scores)
+        return [(1 - self.search_weight) * score / best
+                + self.search_weight * (search_score / best_search if best_search > 0 else 0.0)
+                for score, search_score in zip(scores, search_scores)]
+
+
+class CosinePreRanker(PreRanker):
+    """Cosine similarity between the (cached) query embedding and each candidate's content vector.
+
+    Candidates without a vector score 0.0.
+    """
+
+    needs_vectors = True
+    default_min_score = 0.25
+
+    def score(self, query_text: str, query_vector: List[float] | None, results: List[Dict[str, Any]]) -> List[float]:
+        query = unit_vector(query_vector)
+        scores = [0.0] * len(results)
+        present = [position for position, result in enumerate(results) if result.get("content_vector") is not None]
+        if present:
+            vectors = np.asarray([results[position]["content_vector"] for position in present], dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            for position, similarity in zip(present, (vectors @ query).tolist()):
+                scores[position] = similarity
+        return scores
+
+
+PRERANKERS = {"bm25": BM25PreRanker, "cosine": CosinePreRanker}
+
+
+def get_preranker(mode: str, min_score: float | None = None) -> PreRanker | None:
+    """Pre-ranker for a mode ("off", "bm25" or "cosine"), or None when pre-ranking is off"""
+    if mode == "off":
+        return None
+    if mode not in PRERANKERS:
+        raise ValueError(f"Unknown pre-rank mode '{mode}', expected 'off' or one of {tuple(PRERANKERS)}")
+    return PRERANKERS[mode](min_score)
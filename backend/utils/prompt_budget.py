@@ -0,0 +1,167 @@
+from functools import lru_cache
+from typing import Any, Callable, Dict, List
+import asyncio
+import os
+
+import tiktoken
+
+from backend.utils.caching import LRUCache
+
+PROMPT_BUDGET_CURRENT_RESULTS = int(os.environ.get("PROMPT_BUDGET_CURRENT_RESULTS", "6000"))
+PROMPT_BUDGET_VETTED_RESULTS = int(os.environ.get("PROMPT_BUDGET_VETTED_RESULTS", "4000"))
+PROMPT_BUDGET_SEARCH_HISTORY = int(os.environ.get("PROMPT_BUDGET_SEARCH_HISTORY", "1500"))
+PROMPT_BUDGET_SYNTHESIS_RESULTS = int(os.environ.get("PROMPT_BUDGET_SYNTHESIS_RESULTS", "12000"))
+# A result is dropped instead of truncated when less than this many tokens of it would fit
+PROMPT_MIN_RESULT_TOKENS = int(os.environ.get("PROMPT_MIN_RESULT_TOKENS", "100"))
+# Token counts of search result contents, by chunk ID, shared by every prompt the process builds
+CONTENT_TOKEN_CACHE_SIZE = int(os.environ.get("CONTENT_TOKEN_CACHE_SIZE", "8192"))
+# Texts longer than this (in characters) are encoded in a worker thread; tiktoken releases the GIL
+PROMPT_OFFLOAD_CHARS = int(os.environ.get("PROMPT_OFFLOAD_CHARS", "20000"))
+
+TRUNCATION_MARKER = " [...]"
+COUNTERS = ("truncated_results", "dropped_results", "dropped_segments")
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model: str = "gpt-4o") -> tiktoken.Encoding:
+    """tiktoken encoder for a model, loaded once per process"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    return len(get_encoder(model).encode(text))
+
+
+async def acount_tokens(text: str, model: str = "gpt-4o") -> int:
+    """``count_tokens`` for the event loop: long texts are encoded in a worker thread"""
+    if len(text) > PROMPT_OFFLOAD_CHARS:
+        return await asyncio.to_thread(count_tokens, text, model)
+    return count_tokens(text, model)
+
+
+_content_tokens = LRUCache(CONTENT_TOKEN_CACHE_SIZE)
+
+
+def count_content_tokens(result: Dict[str, Any], model: str = "gpt-4o") -> int:
+    """Tokens of a search result's content, encoded once per chunk however many prompts it goes into"""
+    content = result["content"]
+    if result.get("id") is None:
+        return count_tokens(content, model)
+    # The content is part of the key so a re-indexed chunk is counted again
+    key = (model, result["id"], hash(content))
+    tokens = _content_tokens.get(key)
+    if tokens is None:
+        tokens = count_tokens(content, model)
+        _content_tokens.set(key, tokens)
+    return tokens
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4o") -> str:
+    encoder = get_encoder(model)
+    tokens = encoder.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoder.decode(tokens[:max(max_tokens, 0)]) + TRUNCATION_MARKER
+
+
+class PromptBuilder:
+    """Assembles prompt sections under per-section token budgets.
+
+    Search results are admitted in priority order (highest score first): each one
+    goes in whole while it fits, the one that crosses the budget has its content
+    truncated, and the rest are left out. Tokens spent per section, and how many
+    results were truncated or dropped, are collected in ``usage`` so they can be
+    reported in the thought process.
+
+    A result counts as its label and separators plus its content, whose count is
+    cached per chunk, so the same chunk is not re-encoded on every attempt, branch
+    and synthesis. Sections are the sum of their parts, which may differ from
+    encoding the joined text by a token at a boundary; ``ameasure`` counts the
+    whole prompt exactly.
+    """
+
+    def __init__(self, model: str = "gpt-4o"):
+        self.model = model
+        self.usage: Dict[str, Any] = {counter: 0 for counter in COUNTERS}
+        # Tokens each admitted result took up, by result ID
+        self.result_tokens: Dict[str, int] = {}
+
+    def add_results(self, section: str, results: List[Dict[str, Any]], budget: int,
+                    format_result: Callable[[int, Dict[str, Any]], str], header: str = "") -> str:
+        """Format results (labelled with their original index) within ``budget`` tokens"""
+        header_tokens = count_tokens(header, self.model)
+        remaining = budget - header_tokens
+        kept: Dict[int, str] = {}
+        ranked = sorted(enumerate(results), key=lambda item: item[1].get("score", 0.0), reverse=True)
+        for index, result in ranked:
+            overhead = count_tokens(format_result(index, {**result, "content": ""}), self.model)
+            tokens = overhead + count_content_tokens(result, self.model)
+            if tokens > remaining:
+                content_budget = remaining - overhead - count_tokens(TRUNCATION_MARKER, self.model)
+                if content_budget < PROMPT_MIN_RESULT_TOKENS:
+                    self.usage["dropped_results"] += 1
+                    continue
+                formatted = format_result(index, {**result, "content": truncate_to_tokens(result["content"], content_budget, self.model)})
+                tokens = count_tokens(formatted, self.model)
+                self.usage["truncated_results"] += 1
+            else:
+                formatted = format_result(index, result)
+            kept[index] = formatted
+            remaining -= tokens
+            self.result_tokens[result.get("id", str(index))] = tokens
+
+        # Present the admitted results in their original order
+        self.usage[section] = budget - remaining
+        return header + "".join(kept[index] for index in sorted(kept))
+
+    def segment(self, text: str, score: float = 0.0) -> Dict[str, Any]:
+        """Count a piece of prompt text once so it can be re-used on later attempts"""
+        return {"text": text, "tokens": count_tokens(text, self.model), "score": score}
+
+    def add_segments(self, section: str, segments: List[Dict[str, Any]], budget: int, header: str = "",
+                     keep: str = "newest") -> str:
+        """Join pre-counted segments in their original order within ``budget`` tokens.
+
+        While everything fits the section is the plain concatenation, so it only
+        ever grows at the end and keeps the prompt prefix stable between attempts.
+        Over budget, whole segments are kept by priority: the most recent ones
+        (``keep="newest"``) or the highest scoring ones (``keep="score"``).
+        """
+        if not segments:
+            self.usage[section] = 0
+            return ""
+
+        remaining = budget - count_tokens(header, self.model)
+        if sum(segment["tokens"] for segment in segments) <= remaining:
+            kept = list(range(len(segments)))
+        else:
+            if keep == "score":
+                ranked = sorted(range(len(segments)), key=lambda i: segments[i]["score"], reverse=True)
+            else:
+                ranked = list(reversed(range(len(segments))))
+            kept = []
+            for i in ranked:
+                if segments[i]["tokens"] > remaining:
+                    if keep != "score":
+                        break
+                    continue
+                kept.append(i)
+                remaining -= segments[i]["tokens"]
+            self.usage["dropped_results" if keep == "score" else "dropped_segments"] += len(segments) - len(kept)
+
+        kept.sort()
+        self.usage[section] = count_tokens(header, self.model) + sum(segments[i]["tokens"] for i in kept)
+        return header + "".join(segments[i]["text"] for i in kept)
+
+    async def ameasure(self, messages: List[Dict[str, str]]) -> int:
+        """Count the full prompt; whatever the budgeted sections do not account for is instructions"""
+        total = 0
+        for message in messages:
+            total += await acount_tokens(message["content"], self.model)
+        sections = sum(value for key, value in self.usage.items() if key not in COUNTERS)
+        self.usage["instructions"] = total - sections
+        self.usage["total"] = total
+        return total
@@ -0,0 +1,33 @@
+from typing import Any, Dict, List
+import os
+import re
+
+TOKEN_PATTERN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its of on or that the "
+    "their there this to was what when where which who why will with".split()
+)
+
+# Rank offset of reciprocal rank fusion; 60 is the value from the original RRF paper
+RRF_K = int(os.environ.get("SEARCH_RRF_K", "60"))
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], count: int, k: int = RRF_K) -> List[Dict[str, Any]]:
+    """Fuse several rankings into one, scoring each result by the sum of 1 / (k + rank).
+
+    Results are matched on their ``id``; the fused results carry the RRF score in
+    ``score``, since raw scores from different queries are not comparable.
+    """
+    scores: Dict[str, float] = {}
+    results: Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking, 1):
+            scores[result["id"]] = scores.get(result["id"], 0.0) + 1.0 / (k + rank)
+            results.setdefault(result["id"], result)
+    fused = sorted(scores, key=scores.get, reverse=True)[:max(count, 0)]
+    return [{**results[result_id], "score": scores[result_id]} for result_id in fused]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens without common English stopwords, for lexical scoring"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
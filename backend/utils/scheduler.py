@@ -0,0 +1,255 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, List
+import asyncio
+import heapq
+import itertools
+import os
+import time
+
+from backend.utils.metrics import metrics
+
+# Azure OpenAI deployments the chat and embeddings calls go to; their quotas are per deployment
+LLM_DEPLOYMENT = os.environ.get("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4o")
+EMBEDDINGS_DEPLOYMENT = os.environ.get("AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT", "text-embedding-3-large")
+# Quotas of the chat and embeddings deployments for this process (divide the Azure OpenAI
+# quota by the number of workers); 0 leaves a limit off, and with every limit off calls
+# go straight through
+LLM_RPM_LIMIT = int(os.environ.get("LLM_RPM_LIMIT", "0"))
+LLM_TPM_LIMIT = int(os.environ.get("LLM_TPM_LIMIT", "0"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "0"))
+EMBEDDING_RPM_LIMIT = int(os.environ.get("EMBEDDING_RPM_LIMIT", "0"))
+EMBEDDING_TPM_LIMIT = int(os.environ.get("EMBEDDING_TPM_LIMIT", "0"))
+EMBEDDING_MAX_CONCURRENCY = int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", "0"))
+# Azure OpenAI enforces per-minute quotas over short windows, so a bucket holds at most
+# this many seconds' worth of requests or tokens instead of a whole minute's
+SCHEDULER_BURST_SECONDS = float(os.environ.get("SCHEDULER_BURST_SECONDS", "10"))
+# Completion tokens reserved for a call until its actual usage is known
+LLM_OUTPUT_TOKEN_ESTIMATE = int(os.environ.get("LLM_OUTPUT_TOKEN_ESTIMATE", "1024"))
+# Seconds a deployment's queue is held after a 429 that carries no Retry-After header
+RATE_LIMIT_BACKOFF = float(os.environ.get("RATE_LIMIT_BACKOFF", "1.0"))
+
+# Lower values are served first: the answer being written, then the question being planned,
+# then reviews of results already fetched, then queries for further (speculative) retrieval
+PRIORITY_SYNTHESIS = 0
+PRIORITY_PLANNING = 1
+PRIORITY_REVIEW = 2
+PRIORITY_RETRIEVAL = 3
+PRIORITY_NAMES = {PRIORITY_SYNTHESIS: "synthesis", PRIORITY_PLANNING: "planning",
+                  PRIORITY_REVIEW: "review", PRIORITY_RETRIEVAL: "retrieval"}
+CALL_PRIORITIES = {
+    "final_inference": PRIORITY_SYNTHESIS,
+    "taxonomy_extraction": PRIORITY_PLANNING,
+    "review_results": PRIORITY_REVIEW,
+    "generate_search_query": PRIORITY_RETRIEVAL,
+}
+
+SCHEDULER_QUEUE_DEPTH = metrics.gauge("rag_scheduler_queue_depth", "Calls waiting for a slot", ("deployment",))
+SCHEDULER_IN_FLIGHT = metrics.gauge("rag_scheduler_in_flight", "Calls holding a slot", ("deployment",))
+SCHEDULER_WAIT_SECONDS = metrics.histogram("rag_scheduler_wait_seconds", "Time calls waited for a slot",
+                                           ("deployment", "priority"))
+SCHEDULER_RATE_LIMITED = metrics.counter("rag_scheduler_rate_limited_total", "Calls the service rejected with 429",
+                                         ("deployment",))
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units evenly, holding at most ``burst_seconds`` worth of them"""
+
+    def __init__(self, per_minute: float, burst_seconds: float = SCHEDULER_BURST_SECONDS):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.__updated = time.monotonic()
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` units are available (a request larger than the bucket waits for a full one)"""
+        self.__refill()
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        self.__refill()
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        """Charge (or refund, if negative) the difference between a reservation and actual use"""
+        self.__refill()
+        self.level = min(self.capacity, self.level - amount)
+
+    def __refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.__updated) * self.rate)
+        self.__updated = now
+
+
+class Reservation:
+    """Tokens reserved for a call; ``settle`` reports what it actually used, also after the slot was released"""
+
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+        self.actual_tokens = None
+        self.__adjust: Callable[[int], None] | None = None
+
+    def settle(self, tokens: int) -> None:
+        self.actual_tokens = tokens
+        if self.__adjust is not None:
+            self.__adjust(tokens - self.tokens)
+            self.__adjust = None
+
+    def defer(self, adjust: Callable[[int], None]) -> None:
+        """Have a later ``settle`` charge (or refund) the difference through ``adjust``"""
+        self.__adjust = adjust
+
+
+class DeploymentScheduler:
+    """
+    Admission control for one model deployment.
+
+    A call waits in a priority queue until the deployment has a free concurrency slot
+    and both token buckets (requests and estimated tokens per minute) can cover it.
+    The queue is strictly ordered by priority, then arrival, so a synthesis call never
+    waits behind queued retrieval calls. A streamed call may leave its slot once the
+    stream has started and settle its tokens when it ends, so long answers do not hold
+    concurrency slots. After a 429 the whole queue is held for the
+    ``Retry-After`` the service asked for instead of letting every caller retry.
+
+    Parameters
+    ----------
+    deployment : str
+        Deployment name, used as the metrics label
+    rpm, tpm : int
+        Requests and tokens per minute; 0 disables the limit
+    max_concurrency : int
+        Calls in flight at once; 0 disables the limit
+    """
+
+    def __init__(self, deployment: str, rpm: int = 0, tpm: int = 0, max_concurrency: int = 0,
+                 burst_seconds: float = SCHEDULER_BURST_SECONDS):
+        self.deployment = deployment
+        self.max_concurrency = max_concurrency
+        self.__requests = TokenBucket(rpm, burst_seconds) if rpm > 0 else None
+        self.__tokens = TokenBucket(tpm, burst_seconds) if tpm > 0 else None
+        self.__queue: List[list] = []
+        self.__sequence = itertools.count()
+        self.__in_flight = 0
+        self.__paused_until = 0.0
+        self.__timer = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.__requests is not None or self.__tokens is not None or self.max_concurrency > 0
+
+    @property
+    def counts_tokens(self) -> bool:
+        return self.__tokens is not None
+
+    @asynccontextmanager
+    async def slot(self, priority: int, estimate: Callable[[], int] | None = None) -> AsyncIterator[Reservation]:
+        """Hold a slot for one call; ``estimate`` (prompt plus expected completion tokens) is only evaluated under a TPM limit"""
+        reservation = Reservation(estimate() if estimate is not None and self.counts_tokens else 0)
+        if not self.enabled:
+            yield reservation
+            return
+
+        await self.__acquire(priority, reservation.tokens)
+        try:
+            yield reservation
+        except Exception as e:
+            if is_rate_limited(e):
+                self.__back_off(e)
+            raise
+        finally:
+            self.__in_flight -= 1
+            if self.__tokens is not None:
+                if reservation.actual_tokens is not None:
+                    self.__tokens.adjust(reservation.actual_tokens - reservation.tokens)
+                else:
+                    # Released before its usage is known, e.g. a stream that is still running
+                    reservation.defer(self.__tokens.adjust)
+            self.__dispatch()
+
+    async def __acquire(self, priority: int, tokens: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self.__sequence), tokens, future]
+        heapq.heappush(self.__queue, entry)
+        start = time.perf_counter()
+        self.__dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as the caller gave up; hand the slot to the next one
+                self.__in_flight -= 1
+            elif entry in self.__queue:
+                self.__queue.remove(entry)
+                heapq.heapify(self.__queue)
+            self.__dispatch()
+            raise
+        if metrics.enabled:
+            SCHEDULER_WAIT_SECONDS.observe(time.perf_counter() - start, deployment=self.deployment,
+                                           priority=PRIORITY_NAMES.get(priority, str(priority)))
+
+    def __dispatch(self) -> None:
+        """Grant slots to the head of the queue while capacity allows, or wake up when it will"""
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+        while self.__queue:
+            if self.max_concurrency and self.__in_flight >= self.max_concurrency:
+                break  # A finishing call dispatches again
+            _, _, tokens, future = self.__queue[0]
+            if future.done():
+                heapq.heappop(self.__queue)
+                continue
+            wait = max(
+                self.__paused_until - time.monotonic(),
+                self.__requests.wait_time(1) if self.__requests is not None else 0.0,
+                self.__tokens.wait_time(tokens) if self.__tokens is not None else 0.0,
+            )
+            if wait > 0:
+                self.__timer = asyncio.get_running_loop().call_later(wait, self.__dispatch)
+                break
+            heapq.heappop(self.__queue)
+            if self.__requests is not None:
+                self.__requests.take(1)
+            if self.__tokens is not None:
+                self.__tokens.take(tokens)
+            self.__in_flight += 1
+            future.set_result(None)
+        if metrics.enabled:
+            SCHEDULER_QUEUE_DEPTH.set(len(self.__queue), deployment=self.deployment)
+            SCHEDULER_IN_FLIGHT.set(self.__in_flight, deployment=self.deployment)
+
+    def __back_off(self, error: Exception) -> None:
+        SCHEDULER_RATE_LIMITED.inc(deployment=self.deployment)
+        seconds = retry_after(error)
+        self.__paused_until = max(self.__paused_until, time.monotonic() + (seconds if seconds is not None else RATE_LIMIT_BACKOFF))
+        print(f"Rate limited by {self.deployment}; holding its queue for {self.__paused_until - time.monotonic():.1f}s")
+
+    def stats(self) -> Dict[str, int | float]:
+        return {
+            "queued": len(self.__queue),
+            "in_flight": self.__in_flight,
+            "paused_for": max(0.0, self.__paused_until - time.monotonic()),
+        }
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+def retry_after(error: Exception) -> float | None:
+    """Seconds the service asked the caller to wait, from the Retry-After(-ms) headers of the error's response"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+llm_scheduler = DeploymentScheduler(LLM_DEPLOYMENT, LLM_RPM_LIMIT, LLM_TPM_LIMIT, LLM_MAX_CONCURRENCY)
+embedding_scheduler = DeploymentScheduler(EMBEDDINGS_DEPLOYMENT, EMBEDDING_RPM_LIMIT, EMBEDDING_TPM_LIMIT,
+                                          EMBEDDING_MAX_CONCURRENCY)
@@ -0,0 +1,124 @@
+from typing import Any, Dict, Iterable, List
+import os
+
+import numpy as np
+
+from backend.utils.caching import LRUCache, digest
+
+SEARCH_CACHE_ENABLED = os.environ.get("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "300"))
+# Extra results fetched beyond NUM_SEARCH_RESULTS so callers can exclude processed IDs locally
+SEARCH_OVERFETCH = int(os.environ.get("SEARCH_OVERFETCH", "10"))
+# Content vectors of search hits kept for pre-ranking (12 KB each at 3072 dimensions)
+CHUNK_VECTOR_CACHE_SIZE = int(os.environ.get("CHUNK_VECTOR_CACHE_SIZE", "4096"))
+
+
+class SearchResultCache:
+    """TTL cache of ranked search results, shared by every session and taxonomy.
+
+    Entries are keyed by query text, filter, k-nearest-neighbours, the number of
+    results and the truncated vector dimensions, and hold an over-fetched ranked
+    list. Per-caller exclusions (the IDs a research branch already processed) are
+    applied to the cached list rather than being part of the key, so a single
+    entry serves every caller.
+    """
+
+    def __init__(self, max_entries: int = SEARCH_CACHE_SIZE, ttl: float | None = SEARCH_CACHE_TTL,
+                 enabled: bool = SEARCH_CACHE_ENABLED):
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.__entries = LRUCache(max_entries, ttl)
+
+    @staticmethod
+    def key(search_query: str, category_filter: str | None, k_nearest_neighbors: int, num_search_results: int,
+            vector_dimensions: int = 0) -> str:
+        return digest(search_query, category_filter or "", str(k_nearest_neighbors), str(num_search_results), str(vector_dimensions))
+
+    def get(self, key: str, exclude_ids: set, count: int) -> List[Dict[str, Any]] | None:
+        """Top ``count`` cached results not in ``exclude_ids``.
+
+        Returns None on a miss, or when the cached list is too shallow to fill
+        ``count`` after exclusions and the index may hold more results.
+        """
+        entry = self.__entries.get(key)
+        if entry is not None:
+            remaining = [result for result in entry["results"] if result["id"] not in exclude_ids]
+            if len(remaining) >= count or entry["exhausted"]:
+                self.hits += 1
+                return [dict(result) for result in remaining[:count]]
+        self.misses += 1
+        return None
+
+    def set(self, key: str, results: List[Dict[str, Any]], depth: int) -> None:
+        """Cache a ranked list fetched with ``top=depth``"""
+        self.__entries.set(key, {
+            "results": results,
+            "depth": depth,
+            # Fewer results than requested means the index has nothing further to give
+            "exhausted": len(results) < depth,
+        })
+
+    def clear(self) -> None:
+        self.__entries.clear()
+
+    def stats(self) -> Dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.__entries),
+            "evictions": self.__entries.evictions,
+        }
+
+
+class ChunkVectorCache:
+    """LRU cache of chunk content vectors as float32 arrays, by chunk ID.
+
+    Search results never carry their vectors: a 3072-float JSON list is about
+    100 KB of Python objects per hit, which the result cache would multiply by
+    its size. Vectors fetched with a search are kept here instead, compactly,
+    for the pre-ranking of that and later (cached) searches.
+    """
+
+    def __init__(self, max_entries: int = CHUNK_VECTOR_CACHE_SIZE):
+        self.hits = 0
+        self.misses = 0
+        self.__entries = LRUCache(max_entries)
+
+    def put(self, chunk_id: str, vector: Iterable[float] | np.ndarray) -> np.ndarray:
+        """Cache a vector and return the stored float32 array"""
+        vector = np.asarray(vector, dtype=np.float32)
+        self.__entries.set(chunk_id, vector)
+        return vector
+
+    def get_many(self, chunk_ids: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Cached vectors of the given chunks; missing ones are left out"""
+        vectors = {}
+        for chunk_id in chunk_ids:
+            vector = self.__entries.get(chunk_id)
+            if vector is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                vectors[chunk_id] = vector
+        return vectors
+
+    def clear(self) -> None:
+        self.__entries.clear()
+
+    def stats(self) -> Dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.__entries),
+            "evictions": self.__entries.evictions,
+        }
+
+
+search_cache = SearchResultCache()
+chunk_vectors = ChunkVectorCache()
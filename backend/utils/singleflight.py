@@ -0,0 +1,103 @@
+from typing import Any, Awaitable, Callable, Dict, List, TypeVar
+import asyncio
+import json
+import os
+
+from backend.utils.caching import digest
+from backend.utils.metrics import metrics
+
+SINGLEFLIGHT_ENABLED = os.environ.get("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+
+SINGLEFLIGHT_CALLS = metrics.counter("rag_singleflight_calls_total",
+                                     "Coalescable calls, by role: leader (ran the call) or follower (shared it)",
+                                     ("flight", "role"))
+
+T = TypeVar("T")
+
+
+def messages_key(call_name: str, messages: List[Dict[str, str]]) -> str:
+    """Canonical key of an LLM call: its name (hence output schema) and exact messages"""
+    return digest(call_name, json.dumps(messages, sort_keys=True, ensure_ascii=False))
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls into one.
+
+    The first caller of a key (the leader) starts the call as a task; callers
+    arriving with the same key while it runs (followers) await that same task
+    instead of starting their own. A burst of N duplicate calls therefore reaches
+    the service once. The task is cancelled only once every caller has given up.
+    It runs in the leader's context, so the leader's request is the one charged.
+
+    Results are shared, so pass ``copy`` whenever callers may mutate what they get.
+
+    Parameters
+    ----------
+    name : str
+        Label of this flight group in the metrics
+    enabled : bool
+        When False every call runs on its own
+    """
+
+    def __init__(self, name: str, enabled: bool = SINGLEFLIGHT_ENABLED):
+        self.name = name
+        self.enabled = enabled
+        self.leaders = 0
+        self.followers = 0
+        self.__calls: Dict[str, asyncio.Task] = {}
+        self.__waiters: Dict[str, int] = {}
+
+    async def do(self, key: str, function: Callable[[], Awaitable[T]], copy: Callable[[T], T] | None = None) -> T:
+        """Return the result of ``function()``, sharing it with concurrent callers of the same ``key``"""
+        if not self.enabled:
+            return await function()
+
+        task = self.__calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function())
+            self.__calls[key] = task
+            self.__waiters[key] = 0
+            task.add_done_callback(lambda _: self.__forget(key, task))
+            self.leaders += 1
+            role = "leader"
+        else:
+            self.followers += 1
+            role = "follower"
+        if metrics.enabled:
+            SINGLEFLIGHT_CALLS.inc(flight=self.name, role=role)
+
+        self.__waiters[key] += 1
+        try:
+            # Shielded: one caller being cancelled must not cancel the call the others wait for
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self.__calls.get(key) is task and self.__waiters[key] == 1:
+                # Last caller gone; forget the call first so a new caller starts afresh
+                self.__forget(key, task)
+                task.cancel()
+            raise
+        finally:
+            if self.__calls.get(key) is task:
+                self.__waiters[key] -= 1
+        return copy(result) if copy is not None else result
+
+    def __forget(self, key: str, task: asyncio.Task) -> None:
+        # A cancelled task's key may already belong to a newer call
+        if self.__calls.get(key) is task:
+            del self.__calls[key]
+            del self.__waiters[key]
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.leaders + self.followers
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalesced_rate": self.followers / calls if calls else 0.0,
+            "in_flight": len(self.__calls),
+        }
+
+
+llm_flights = SingleFlight("llm")
+embedding_flights = SingleFlight("embeddings")
+search_flights = SingleFlight("search")
@@ -0,0 +1,113 @@
+from typing import Any, Dict, List, Tuple
+import asyncio
+import os
+
+import numpy as np
+
+from backend.utils.caching import digest, normalize_text, unit_vector
+from backend.utils.cache_backends import CacheBackend, MemoryBackend, SQLiteBackend
+
+TAXONOMY_CACHE_ENABLED = os.environ.get("TAXONOMY_CACHE_ENABLED", "true").lower() == "true"
+TAXONOMY_CACHE_BACKEND = os.environ.get("TAXONOMY_CACHE_BACKEND", "memory")  # memory | sqlite
+TAXONOMY_CACHE_PATH = os.environ.get("TAXONOMY_CACHE_PATH", "taxonomy_cache.sqlite3")
+TAXONOMY_CACHE_SIZE = int(os.environ.get("TAXONOMY_CACHE_SIZE", "1024"))
+TAXONOMY_CACHE_TTL = float(os.environ.get("TAXONOMY_CACHE_TTL", "86400"))
+TAXONOMY_CACHE_EVICTION = os.environ.get("TAXONOMY_CACHE_EVICTION", "lru")  # lru | fifo
+TAXONOMY_CACHE_THRESHOLD = float(os.environ.get("TAXONOMY_CACHE_THRESHOLD", "0.97"))
+# Most recently used questions compared against in a nearest-neighbour lookup, per history
+TAXONOMY_CACHE_SCAN_LIMIT = int(os.environ.get("TAXONOMY_CACHE_SCAN_LIMIT", "512"))
+
+
+class TaxonomyCache:
+    """Memoizes taxonomy extraction results.
+
+    Lookups try an exact tier first (normalized question + history) and then a
+    nearest-neighbour tier that reuses the extraction of the most similar earlier
+    question with the same history, if it is at least ``threshold`` cosine-similar.
+    Storage is delegated to a ``CacheBackend``, so results can be shared between
+    worker processes. The nearest-neighbour tier only compares against the
+    ``scan_limit`` most recently used questions, and only loads the value of the
+    best match.
+    """
+
+    def __init__(self, backend: CacheBackend, threshold: float = TAXONOMY_CACHE_THRESHOLD, enabled: bool = TAXONOMY_CACHE_ENABLED,
+                 scan_limit: int | None = TAXONOMY_CACHE_SCAN_LIMIT):
+        self.backend = backend
+        self.threshold = threshold
+        self.scan_limit = scan_limit
+        self.enabled = enabled
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "TaxonomyCache":
+        if TAXONOMY_CACHE_BACKEND == "sqlite":
+            backend = SQLiteBackend(TAXONOMY_CACHE_PATH, "taxonomies", TAXONOMY_CACHE_SIZE, TAXONOMY_CACHE_TTL, TAXONOMY_CACHE_EVICTION)
+        elif TAXONOMY_CACHE_BACKEND == "memory":
+            backend = MemoryBackend(TAXONOMY_CACHE_SIZE, TAXONOMY_CACHE_TTL, TAXONOMY_CACHE_EVICTION)
+        else:
+            raise ValueError(f"Unknown taxonomy cache backend '{TAXONOMY_CACHE_BACKEND}', expected 'memory' or 'sqlite'")
+        return cls(backend)
+
+    async def lookup_exact(self, user_input: str, user_history: str) -> Dict[str, Any] | None:
+        record = await asyncio.to_thread(self.backend.get, self.__key(user_input, user_history))
+        if record is None:
+            return None
+        self.exact_hits += 1
+        return record["value"]
+
+    async def lookup_similar(self, user_history: str, query_vector: List[float]) -> Tuple[Dict[str, Any] | None, float]:
+        """Return the value of the nearest cached question and its similarity, or (None, best similarity)"""
+        best_value, best_similarity = await asyncio.to_thread(self.__nearest, user_history, unit_vector(query_vector))
+        if best_value is None or best_similarity < self.threshold:
+            self.misses += 1
+            return None, best_similarity
+        self.semantic_hits += 1
+        return best_value, best_similarity
+
+    async def store(self, user_input: str, user_history: str, query_vector: List[float] | None, value: Dict[str, Any]) -> None:
+        record = {
+            "partition": self.__partition(user_history),
+            "value": value,
+            "vector": None if query_vector is None else unit_vector(query_vector),
+        }
+        await asyncio.to_thread(self.backend.set, self.__key(user_input, user_history), record)
+
+    def stats(self) -> Dict[str, int | float]:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "evictions": self.backend.evictions,
+        }
+
+    def __nearest(self, user_history: str, query: np.ndarray) -> Tuple[Dict[str, Any] | None, float]:
+        """Value of the most similar cached question above the threshold, and its similarity"""
+        keys, vectors = [], []
+        for key, vector in self.backend.scan(self.__partition(user_history), self.scan_limit):
+            keys.append(key)
+            vectors.append(vector)
+        if not keys:
+            return None, -1.0
+        similarities = np.stack(vectors) @ query
+        best = int(np.argmax(similarities))
+        best_similarity = float(similarities[best])
+        if best_similarity < self.threshold:
+            return None, best_similarity
+        # The record may have expired or been evicted since the scan
+        record = self.backend.get(keys[best])
+        return (None if record is None else record["value"]), best_similarity
+
+    @staticmethod
+    def __key(user_input: str, user_history: str) -> str:
+        return digest(normalize_text(user_input), normalize_text(user_history))
+
+    @staticmethod
+    def __partition(user_history: str) -> str:
+        return digest(normalize_text(user_history))
+
+
+taxonomy_cache = TaxonomyCache.from_env()
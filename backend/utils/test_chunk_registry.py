@@ -0,0 +1,34 @@
+from backend.utils.chunk_registry import ChunkRegistry, pick_reviewed
+
+
+def result(chunk_id: str):
+    return {"id": chunk_id, "content": f"content of {chunk_id}", "source_file": "doc.pdf", "score": 0.0}
+
+
+def test_review_of_a_triaged_batch_ignores_indices_past_its_end():
+    registry = ChunkRegistry("skip_vetted")
+    registry.record_verdict("b", "Deductions", True, 120)
+    registry.record_verdict("d", "Grants", False, 80)
+    batch = [result(chunk_id) for chunk_id in "abcde"]
+
+    triaged = registry.triage(batch, "Grants")
+    reviewed = triaged["review"]
+    # "b" was vetted for another taxonomy and "d" already rejected for this one
+    assert [r["id"] for r in reviewed] == ["a", "c", "e"]
+
+    # A reviewer answering against the full NUM_SEARCH_RESULTS range
+    valid, ignored_valid = pick_reviewed(reviewed, [0, 4])
+    invalid, ignored_invalid = pick_reviewed(reviewed, [2, 3])
+
+    assert [r["id"] for r in valid] == ["a"]
+    assert [r["id"] for r in invalid] == ["e"]
+    assert ignored_valid == [4] and ignored_invalid == [3]
+
+
+def test_results_left_out_of_the_prompt_are_not_picked():
+    batch = [result(chunk_id) for chunk_id in "abc"]
+
+    picked, ignored = pick_reviewed(batch, [0, 1, 2, -1], shown={0, 2})
+
+    assert [r["id"] for r in picked] == ["a", "c"]
+    assert ignored == [1, -1]
@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from backend.utils.local_search import LocalSearchIndex, ODataFilter
+
+DOCUMENTS = [
+    {"id": "a", "category": "tax", "year": 2021, "public": True, "owner": None},
+    {"id": "b", "category": "grants", "year": 2023, "public": False, "owner": "O'Brien"},
+    {"id": "c", "category": "tax law", "year": 2024, "public": True, "owner": "Smith"},
+]
+
+
+def matching(expression: str):
+    predicate = ODataFilter(expression)
+    return [document["id"] for document in DOCUMENTS if predicate(document)]
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("search.in(id, 'a,c')", ["a", "c"]),
+    ("search.in(id, 'a, b')", ["a", "b"]),
+    ("search.in(category, 'tax law|grants', '|')", ["b", "c"]),
+    ("not search.in(id, 'a,b')", ["c"]),
+    ("category eq 'tax'", ["a"]),
+    ("owner eq 'O''Brien'", ["b"]),
+    ("owner eq null", ["a"]),
+    ("owner ne null", ["b", "c"]),
+    ("public eq true", ["a", "c"]),
+    ("year gt 2021 and year le 2023", ["b"]),
+    ("year ge 2023.5", ["c"]),
+    ("owner lt 'T'", ["b", "c"]),
+])
+def test_filter_subset(expression, expected):
+    assert matching(expression) == expected
+
+
+def test_and_binds_tighter_than_or():
+    assert matching("category eq 'grants' or category eq 'tax' and year gt 2022") == ["b"]
+    assert matching("(category eq 'grants' or category eq 'tax') and year gt 2022") == ["b"]
+    assert matching("(category eq 'grants' or category eq 'tax') and not (year gt 2022)") == ["a"]
+
+
+def test_keywords_are_case_insensitive():
+    assert matching("NOT search.in(id, 'a') AND public EQ TRUE") == ["c"]
+
+
+@pytest.mark.parametrize("expression", [
+    "year between 1 and 2",
+    "category eq",
+    "(category eq 'tax'",
+    "category eq 'tax')",
+    "search.in(id 'a')",
+    "year eq 2021 xor",
+    "category eq 'tax' and $",
+])
+def test_unsupported_syntax_is_rejected(expression):
+    with pytest.raises(ValueError):
+        ODataFilter(expression)
+
+
+def test_index_search_applies_the_filter():
+    index = LocalSearchIndex()
+    index.upload_documents([{**document, "content": f"document {document['id']}"} for document in DOCUMENTS])
+
+    results = index.search("document", filter="not search.in(id, 'b') and public eq true", select=["id"])
+
+    assert sorted(result["id"] for result in results) == ["a", "c"]
+
+
+def test_merge_updates_only_the_given_fields():
+    index = LocalSearchIndex()
+    index.upload_documents([{"id": "a", "content": "grant income", "category": "tax", "content_vector": [1.0, 0.0]}])
+
+    index.merge_or_upload_documents([{"id": "a", "category": "grants"}, {"id": "b", "content": "new", "category": "tax"}])
+
+    assert index.get_document("a") == {"id": "a", "content": "grant income", "category": "grants"}
+    assert index.get_document("b")["content"] == "new"
+    assert [r["id"] for r in index.search("grant", select=["id"])] == ["a"]
+    assert "a" in index.get_vectors(["a"])
+
+    index.upload_documents([{"id": "a", "category": "replaced"}])
+    assert index.get_document("a") == {"id": "a", "category": "replaced"}
+
+
+def test_vector_query_leaves_the_callers_vector_alone():
+    index = LocalSearchIndex()
+    index.upload_documents([{"id": "a", "content": "x", "content_vector": [3.0, 4.0]}])
+    vector = np.array([3.0, 4.0], dtype=np.float32)
+
+    index.search(vector_queries=[SimpleNamespace(vector=vector, k_nearest_neighbors=1)])
+
+    assert vector.tolist() == [3.0, 4.0]
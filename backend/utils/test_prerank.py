@@ -0,0 +1,40 @@
+from backend.utils.prerank import BM25PreRanker, CosinePreRanker
+
+
+def candidate(result_id: str, content: str, score: float, vector=None):
+    result = {"id": result_id, "content": content, "source_file": "doc.pdf", "score": score}
+    if vector is not None:
+        result["content_vector"] = vector
+    return result
+
+
+def test_bm25_keeps_everything_without_lexical_overlap():
+    results = [candidate("a", "Gifts and grants received", 0.03),
+               candidate("b", "Payments to subsidiaries", 0.02),
+               candidate("c", "Subsidies for housing", 0.01)]
+
+    kept, dropped = BM25PreRanker().rank("levies on handouts", None, results, 3)
+
+    assert dropped == []
+    assert [result["id"] for result in kept] == ["a", "b", "c"]
+
+
+def test_bm25_keeps_relevant_chunk_missing_the_exact_terms():
+    results = [candidate("grants", "Grants received are part of taxable income", 0.033),
+               candidate("tax", "A grant is a tax matter; tax on the grant is due", 0.030),
+               candidate("noise", "Opening hours of the office", 0.004)]
+
+    kept, dropped = BM25PreRanker().rank("grant tax", None, results, 3)
+
+    assert "grants" in [result["id"] for result in kept]
+    assert [result["id"] for result in dropped] == ["noise"]
+
+
+def test_rank_strips_vectors_and_limits_the_count():
+    results = [candidate(str(i), "text", 0.0, vector=[1.0, float(i)]) for i in range(4)]
+
+    kept, dropped = CosinePreRanker(min_score=0.0).rank("query", [1.0, 0.0], results, 2)
+
+    assert [result["id"] for result in kept] == ["0", "1"]
+    assert dropped == []
+    assert all("content_vector" not in result for result in results)
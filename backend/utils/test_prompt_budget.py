@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from backend.utils import prompt_budget
+from backend.utils.prompt_budget import PromptBuilder
+
+
+class WordEncoder:
+    """One token per whitespace-separated word; counts how many characters it encoded"""
+
+    def __init__(self):
+        self.encoded_chars = 0
+
+    def encode(self, text: str):
+        self.encoded_chars += len(text)
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def encoder(monkeypatch):
+    encoder = WordEncoder()
+    monkeypatch.setattr(prompt_budget, "get_encoder", lambda model="gpt-4o": encoder)
+    monkeypatch.setattr(prompt_budget, "_content_tokens", prompt_budget.LRUCache(16))
+    monkeypatch.setattr(prompt_budget, "PROMPT_MIN_RESULT_TOKENS", 2)
+    return encoder
+
+
+def format_result(index, result):
+    return f"Result {index}: {result['content']}\n"
+
+
+def result(result_id: str, words: int, score: float):
+    return {"id": result_id, "content": " ".join(["word"] * words), "score": score}
+
+
+def test_contents_are_encoded_once_per_chunk(encoder):
+    results = [result("a", 500, 0.9), result("b", 500, 0.8)]
+    PromptBuilder().add_results("current_results", results, 10_000, format_result)
+    first = encoder.encoded_chars
+
+    builder = PromptBuilder()
+    text = builder.add_results("current_results", results, 10_000, format_result)
+
+    assert encoder.encoded_chars - first < 100
+    assert builder.usage["current_results"] == len(text.split())
+    assert builder.result_tokens == {"a": 502, "b": 502}
+
+
+def test_results_over_budget_are_truncated_then_dropped(encoder):
+    results = [result("low", 5, 0.1), result("high", 5, 0.9), result("mid", 5, 0.5)]
+    builder = PromptBuilder()
+
+    text = builder.add_results("current_results", results, 12, format_result)
+
+    assert text.startswith("Result 1:") and "Result 2: word word [...]" in text
+    assert "Result 0" not in text
+    assert builder.usage["truncated_results"] == 1
+    assert builder.usage["dropped_results"] == 1
+    assert builder.usage["current_results"] <= 12
+
+
+def test_long_prompts_are_measured_off_the_event_loop(encoder, monkeypatch):
+    monkeypatch.setattr(prompt_budget, "PROMPT_OFFLOAD_CHARS", 10)
+    threads = []
+    monkeypatch.setattr(asyncio, "to_thread", lambda func, *args: threads.append(func) or asyncio.sleep(0, func(*args)))
+    builder = PromptBuilder()
+
+    total = asyncio.run(builder.ameasure([{"content": "short"}, {"content": "a much longer prompt text"}]))
+
+    assert total == 6
+    assert len(threads) == 1
+    assert builder.usage["instructions"] == 6
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from backend.utils.scheduler import (DeploymentScheduler, PRIORITY_RETRIEVAL, PRIORITY_REVIEW, PRIORITY_SYNTHESIS,
+                                     retry_after)
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, headers):
+        super().__init__("429 Too Many Requests")
+        self.response = SimpleNamespace(headers=headers)
+
+
+async def hold(scheduler: DeploymentScheduler, released: asyncio.Event, priority: int = PRIORITY_REVIEW):
+    async with scheduler.slot(priority):
+        await released.wait()
+
+
+def test_queue_is_served_by_priority_then_arrival():
+    async def main():
+        scheduler = DeploymentScheduler("test", max_concurrency=1)
+        released = asyncio.Event()
+        holder = asyncio.create_task(hold(scheduler, released))
+        await asyncio.sleep(0)
+
+        served = []
+
+        async def call(name: str, priority: int):
+            async with scheduler.slot(priority):
+                served.append(name)
+
+        calls = [asyncio.create_task(call(name, priority)) for name, priority in [
+            ("retrieval", PRIORITY_RETRIEVAL), ("review 1", PRIORITY_REVIEW),
+            ("synthesis", PRIORITY_SYNTHESIS), ("review 2", PRIORITY_REVIEW)]]
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued"] == 4
+
+        released.set()
+        await asyncio.gather(holder, *calls)
+        return served
+
+    assert asyncio.run(main()) == ["synthesis", "review 1", "review 2", "retrieval"]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def main():
+        scheduler = DeploymentScheduler("test", max_concurrency=1)
+        released = asyncio.Event()
+        holder = asyncio.create_task(hold(scheduler, released))
+        await asyncio.sleep(0)
+
+        cancelled = asyncio.create_task(hold(scheduler, asyncio.Event(), PRIORITY_SYNTHESIS))
+        waiting = asyncio.create_task(hold(scheduler, asyncio.Event(), PRIORITY_RETRIEVAL))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        queued = scheduler.stats()["queued"]
+
+        released.set()
+        await holder
+        await asyncio.sleep(0)
+        stats = scheduler.stats()
+        waiting.cancel()
+        return queued, stats
+
+    queued, stats = asyncio.run(main())
+    assert queued == 1
+    assert stats == {"queued": 0, "in_flight": 1, "paused_for": 0.0}
+
+
+def test_rate_limit_holds_the_queue_for_retry_after():
+    async def main():
+        scheduler = DeploymentScheduler("test", rpm=6000)
+        with pytest.raises(RateLimited):
+            async with scheduler.slot(PRIORITY_REVIEW):
+                raise RateLimited({"retry-after-ms": "200"})
+        paused_for = scheduler.stats()["paused_for"]
+
+        start = time.monotonic()
+        async with scheduler.slot(PRIORITY_SYNTHESIS):
+            waited = time.monotonic() - start
+        return paused_for, waited
+
+    paused_for, waited = asyncio.run(main())
+    assert 0.1 < paused_for <= 0.2
+    assert waited >= 0.15
+
+
+def test_retry_after_headers():
+    assert retry_after(RateLimited({"retry-after": "3"})) == 3.0
+    assert retry_after(RateLimited({"retry-after-ms": "250", "retry-after": "3"})) == 0.25
+    assert retry_after(RateLimited({"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"})) is None
+    assert retry_after(ValueError()) is None
+
+
+def test_estimate_is_only_evaluated_under_a_token_limit():
+    async def main():
+        estimates = []
+        async with DeploymentScheduler("test", rpm=60).slot(PRIORITY_REVIEW, lambda: estimates.append(1) or 10):
+            pass
+        async with DeploymentScheduler("test", tpm=600).slot(PRIORITY_REVIEW, lambda: estimates.append(2) or 10) as reservation:
+            pass
+        return estimates, reservation.tokens
+
+    assert asyncio.run(main()) == ([2], 10)
+
+
+def test_settle_after_release_refunds_the_unused_reservation():
+    async def main():
+        scheduler = DeploymentScheduler("test", tpm=6000, burst_seconds=1)
+        bucket = scheduler._DeploymentScheduler__tokens
+        async with scheduler.slot(PRIORITY_SYNTHESIS, lambda: 80) as reservation:
+            pass
+        after_release = bucket.level
+        # A stream that ends after leaving its slot
+        reservation.settle(30)
+        return after_release, bucket.level
+
+    after_release, after_settle = asyncio.run(main())
+    assert after_release == pytest.approx(20, abs=1)
+    assert after_settle == pytest.approx(70, abs=1)
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from backend.utils.singleflight import SingleFlight
+
+
+class Call:
+    """A call that blocks until released, counting how often it started and was cancelled"""
+
+    def __init__(self, result=None, error: Exception | None = None):
+        self.result = result
+        self.error = error
+        self.started = 0
+        self.cancelled = 0
+        self.released = asyncio.Event()
+
+    async def __call__(self):
+        self.started += 1
+        try:
+            await self.released.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_concurrent_callers_share_one_call():
+    async def main():
+        flight = SingleFlight("test")
+        call = Call(result={"answer": 42})
+        callers = [asyncio.create_task(flight.do("key", call, copy=dict)) for _ in range(3)]
+        await asyncio.sleep(0)
+        call.released.set()
+        results = await asyncio.gather(*callers)
+        return flight, call, results
+
+    flight, call, results = asyncio.run(main())
+    assert call.started == 1
+    assert results == [{"answer": 42}] * 3
+    assert results[0] is not results[1]
+    assert flight.stats() == {"leaders": 1, "followers": 2, "coalesced_rate": pytest.approx(2 / 3), "in_flight": 0}
+
+
+def test_error_reaches_every_caller_and_is_not_kept():
+    async def main():
+        flight = SingleFlight("test")
+        failing = Call(error=ValueError("bad request"))
+        callers = [asyncio.create_task(flight.do("key", failing)) for _ in range(3)]
+        await asyncio.sleep(0)
+        failing.released.set()
+        outcomes = await asyncio.gather(*callers, return_exceptions=True)
+
+        retry = Call(result="ok")
+        retry.released.set()
+        return outcomes, await flight.do("key", retry), retry.started
+
+    outcomes, result, started = asyncio.run(main())
+    assert [type(outcome) for outcome in outcomes] == [ValueError] * 3
+    assert result == "ok" and started == 1
+
+
+def test_cancelled_caller_leaves_the_call_to_the_others():
+    async def main():
+        flight = SingleFlight("test")
+        call = Call(result="shared")
+        leader = asyncio.create_task(flight.do("key", call))
+        follower = asyncio.create_task(flight.do("key", call))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        call.released.set()
+        return leader.cancelled(), await follower, call
+
+    leader_cancelled, result, call = asyncio.run(main())
+    assert leader_cancelled
+    assert result == "shared"
+    assert call.started == 1 and call.cancelled == 0
+
+
+def test_call_is_cancelled_once_every_caller_gave_up():
+    async def main():
+        flight = SingleFlight("test")
+        abandoned = Call()
+        callers = [asyncio.create_task(flight.do("key", abandoned)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        in_flight = flight.stats()["in_flight"]
+
+        fresh = Call(result="fresh")
+        fresh.released.set()
+        return abandoned.cancelled, in_flight, await flight.do("key", fresh)
+
+    cancelled, in_flight, result = asyncio.run(main())
+    assert cancelled == 1
+    assert in_flight == 0
+    assert result == "fresh"
+
+
+def test_disabled_flight_runs_every_call():
+    async def main():
+        flight = SingleFlight("test", enabled=False)
+        call = Call(result=1)
+        call.released.set()
+        await asyncio.gather(*(flight.do("key", call) for _ in range(3)))
+        return call.started
+
+    assert asyncio.run(main()) == 3
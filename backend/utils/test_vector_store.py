@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+import pytest
+
+from backend.utils.vector_store import MmapVectorStore
+
+
+def unit_vectors(count: int, dimensions: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_search_finds_stored_vectors(tmp_path, dtype):
+    vectors = unit_vectors(200, 32)
+    store = MmapVectorStore(str(tmp_path), dtype=dtype)
+    store.add([f"id-{i}" for i in range(200)], vectors)
+
+    for i in (0, 57, 199):
+        (key, score), = store.search(vectors[i], k=1)
+        assert key == f"id-{i}"
+        assert score == pytest.approx(1.0, abs=0.02)
+
+
+def test_int8_quantization_error_is_small(tmp_path):
+    vectors = unit_vectors(50, 64)
+    store = MmapVectorStore(str(tmp_path), dtype="int8", rescore=False)
+    store.add([str(i) for i in range(50)], vectors)
+
+    for i in range(50):
+        assert np.abs(store.get(str(i)) - vectors[i]).max() < 0.01
+
+
+def test_reopened_store_keeps_rows_overwrites_and_deletions(tmp_path):
+    vectors = unit_vectors(4, 16)
+    store = MmapVectorStore(str(tmp_path), dtype="int8")
+    store.add(["a", "b", "c"], vectors[:3])
+    store.add(["b"], vectors[3:])
+    store.delete(["c"])
+
+    reopened = MmapVectorStore(str(tmp_path))
+    assert (reopened.dtype, reopened.dimensions, len(reopened), reopened.count) == ("int8", 16, 2, 3)
+    assert "c" not in reopened
+    np.testing.assert_allclose(reopened.get("b"), vectors[3], atol=1e-6)
+    assert [key for key, _ in reopened.search(vectors[2], k=3)] != ["c"]
+
+
+def test_rows_appended_before_a_crash_are_cut_on_load(tmp_path):
+    vectors = unit_vectors(4, 16)
+    store = MmapVectorStore(str(tmp_path), dtype="int8")
+    store.add(["a", "b"], vectors[:2])
+    # A crash after the vector appends, before ids.txt was written: orphan rows in every file
+    for name, size in (("vectors.q", 16), ("scales.f32", 4), ("vectors.f32", 64)):
+        with open(os.path.join(str(tmp_path), name), "ab") as file:
+            file.write(b"\x01" * size)
+
+    reopened = MmapVectorStore(str(tmp_path))
+    reopened.add(["c", "d"], vectors[2:])
+    assert reopened.row("c") == 2
+    for key, vector in zip("abcd", vectors):
+        np.testing.assert_allclose(reopened.get(key), vector, atol=1e-6)
+        (found, score), = reopened.search(vector, k=1)
+        assert found == key
+        assert score <= 1.0 + 1e-5
+    assert os.path.getsize(os.path.join(str(tmp_path), "scales.f32")) == 4 * 4
+
+
+def test_deletions_of_cut_rows_do_not_apply_to_new_rows(tmp_path):
+    vectors = unit_vectors(3, 8)
+    store = MmapVectorStore(str(tmp_path), dtype="float16")
+    store.add(["a", "b"], vectors[:2])
+    store.delete(["b"])
+    # Lose the last row of one matrix file, as an interrupted write would
+    path = os.path.join(str(tmp_path), "vectors.f32")
+    os.truncate(path, os.path.getsize(path) - 4 * 8)
+
+    reopened = MmapVectorStore(str(tmp_path))
+    assert reopened.count == 1
+    reopened.add(["c"], vectors[2:])
+    assert "c" in MmapVectorStore(str(tmp_path))
+
+
+def test_truncated_queries_compare_leading_dimensions(tmp_path):
+    vectors = unit_vectors(100, 64)
+    store = MmapVectorStore(str(tmp_path), dtype="float16")
+    store.add([str(i) for i in range(100)], vectors)
+
+    (key, score), = store.search(vectors[42][:16], k=1)
+    assert key == "42"
+    assert score == pytest.approx(1.0, abs=0.01)
@@ -0,0 +1,287 @@
+from typing import Dict, Iterable, List, Tuple
+import json
+import os
+import threading
+
+import numpy as np
+
+VECTOR_STORE_DTYPES = ("float32", "float16", "int8")
+# Candidates kept from the quantized scan per requested result, for the float32 rescoring pass
+RESCORE_FACTOR = int(os.environ.get("VECTOR_STORE_RESCORE_FACTOR", "4"))
+# Rows are scanned in blocks of about this many bytes once converted to float32
+SCAN_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+class MmapVectorStore:
+    """Append-only, memory-mapped store of unit vectors with scalar quantization.
+
+    A store is a directory holding:
+
+    - ``meta.json``: dimensions, quantization dtype and whether full vectors are kept
+    - ``vectors.q``: the quantized matrix (float16, or int8 with a float32 scale per row in ``scales.f32``)
+    - ``vectors.f32``: the full-precision matrix, when ``rescore`` is on
+    - ``ids.txt``: one ID per line, in row order, and ``deleted.txt``: deleted row numbers
+
+    Searches scan the quantized matrix block by block, so only a bounded slice is
+    ever converted in memory, and then rescore the best candidates against the
+    full-precision rows; the operating system pages in only what is touched.
+    Re-adding an existing ID overwrites its row in place.
+    """
+
+    def __init__(self, path: str, dimensions: int | None = None, dtype: str = "int8", rescore: bool = True):
+        self.path = path
+        self.__lock = threading.RLock()
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as file:
+                meta = json.load(file)
+            self.dimensions, self.dtype, self.rescore = meta["dimensions"], meta["dtype"], meta["rescore"]
+        else:
+            if dtype not in VECTOR_STORE_DTYPES:
+                raise ValueError(f"Unknown vector store dtype '{dtype}', expected one of {VECTOR_STORE_DTYPES}")
+            # Full-precision copies only add something to rescore when the scan is quantized
+            self.dimensions, self.dtype, self.rescore = dimensions, dtype, rescore and dtype != "float32"
+            os.makedirs(path, exist_ok=True)
+            if dimensions is not None:
+                self.__write_meta()
+
+        self.__ids: List[str] = []
+        self.__rows: Dict[str, int] = {}
+        self.__deleted = np.zeros(0, dtype=bool)
+        self.__views: Dict[str, np.ndarray] = {}
+        self.__mapped_count = -1
+        self.evictions = 0
+        self.__load_ids()
+
+    @property
+    def count(self) -> int:
+        """Rows in the store, including deleted ones"""
+        return len(self.__ids)
+
+    def __len__(self) -> int:
+        return len(self.__rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__rows
+
+    def row(self, key: str) -> int | None:
+        return self.__rows.get(key)
+
+    def key(self, row: int) -> str:
+        return self.__ids[row]
+
+    def add(self, keys: Iterable[str], vectors: Iterable[Iterable[float]] | np.ndarray) -> List[int]:
+        """Insert or overwrite vectors by key and return their rows"""
+        keys = list(keys)
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(keys), -1)
+        # The last vector given for a key wins
+        latest = {key: position for position, key in enumerate(keys)}
+        with self.__lock:
+            if self.dimensions is None:
+                self.dimensions = matrix.shape[1]
+                self.__write_meta()
+            if matrix.shape[1] != self.dimensions:
+                raise ValueError(f"Vectors have {matrix.shape[1]} dimensions, the store holds {self.dimensions}")
+            matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            quantized, scales = self.__quantize(matrix)
+
+            assigned, new_keys, new_positions = {}, [], []
+            for key, position in latest.items():
+                row = self.__rows.get(key)
+                if row is None:
+                    assigned[key] = self.count + len(new_keys)
+                    new_keys.append(key)
+                    new_positions.append(position)
+                else:
+                    self.__overwrite(row, quantized[position], scales[position], matrix[position])
+                    assigned[key] = row
+
+            if new_keys:
+                self.__append("vectors.q", quantized[new_positions])
+                if self.dtype == "int8":
+                    self.__append("scales.f32", scales[new_positions])
+                if self.rescore:
+                    self.__append("vectors.f32", matrix[new_positions])
+                # IDs last: a row only exists once its ID is written, which keeps a crashed append invisible
+                with open(os.path.join(self.path, "ids.txt"), "a", encoding="utf-8") as file:
+                    file.write("".join(f"{key}\n" for key in new_keys))
+                for key in new_keys:
+                    self.__rows[key] = len(self.__ids)
+                    self.__ids.append(key)
+                self.__deleted = np.concatenate([self.__deleted, np.zeros(len(new_keys), dtype=bool)])
+        return [assigned[key] for key in keys]
+
+    def delete(self, keys: Iterable[str]) -> int:
+        deleted = []
+        with self.__lock:
+            for key in keys:
+                row = self.__rows.pop(key, None)
+                if row is not None:
+                    self.__deleted[row] = True
+                    deleted.append(row)
+            if deleted:
+                with open(os.path.join(self.path, "deleted.txt"), "a", encoding="utf-8") as file:
+                    file.write("".join(f"{row}\n" for row in deleted))
+        return len(deleted)
+
+    def get(self, key: str) -> np.ndarray | None:
+        """The stored unit vector for a key, at full precision when available"""
+        with self.__lock:
+            row = self.__rows.get(key)
+            if row is None:
+                return None
+            return self.vector(row)
+
+    def put(self, key: str, vector: Iterable[float] | np.ndarray) -> None:
+        """Single-vector ``add``, so the store can back the embedding cache"""
+        self.add([key], [vector])
+
+    def vector(self, row: int) -> np.ndarray:
+        views = self.__map()
+        if self.rescore:
+            return np.array(views["vectors.f32"][row])
+        vector = views["vectors.q"][row].astype(np.float32)
+        return vector * views["scales.f32"][row] if self.dtype == "int8" else vector
+
+    def search(self, query: Iterable[float] | np.ndarray, k: int = 10, mask: np.ndarray | None = None,
+               candidates: int | None = None, rescore: bool | None = None) -> List[Tuple[str, float]]:
+        """Top ``k`` (key, cosine similarity) pairs, optionally restricted to rows where ``mask`` is True.
+
+        ``rescore=False`` skips the full-precision pass for this query and ranks by the quantized scores.
+        A query shorter than the stored vectors is compared with their leading dimensions, renormalized,
+        as for Matryoshka embeddings.
+        """
+        rescore = self.rescore if rescore is None else rescore and self.rescore
+        query = np.asarray(query, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        dimensions = len(query)
+        if self.dimensions is not None and dimensions > self.dimensions:
+            raise ValueError(f"Query has {dimensions} dimensions, the store holds {self.dimensions}")
+        with self.__lock:
+            count = self.count
+            if count == 0 or k <= 0:
+                return []
+            views = self.__map()
+            eligible = ~self.__deleted[:count]
+            if mask is not None:
+                eligible &= mask[:count]
+            shortlist = max(k, candidates or k * RESCORE_FACTOR) if rescore else k
+
+            best_rows = np.zeros(0, dtype=np.int64)
+            best_scores = np.zeros(0, dtype=np.float32)
+            block_rows = max(1, SCAN_BLOCK_BYTES // (4 * self.dimensions))
+            for start in range(0, count, block_rows):
+                end = min(start + block_rows, count)
+                rows = np.flatnonzero(eligible[start:end]) + start
+                if len(rows) == 0:
+                    continue
+                block = views["vectors.q"][start:end, :dimensions].astype(np.float32)
+                scores = block @ query
+                if dimensions < self.dimensions:
+                    # The renormalization also cancels the int8 row scale
+                    scores /= np.maximum(np.linalg.norm(block, axis=1), 1e-12)
+                elif self.dtype == "int8":
+                    scores *= views["scales.f32"][start:end]
+                best_rows = np.concatenate([best_rows, rows])
+                best_scores = np.concatenate([best_scores, scores[rows - start]])
+                if len(best_rows) > shortlist:
+                    keep = np.argpartition(-best_scores, shortlist - 1)[:shortlist]
+                    best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+            if rescore and len(best_rows):
+                order = np.argsort(best_rows)
+                best_rows = best_rows[order]
+                full = views["vectors.f32"][best_rows, :dimensions]
+                best_scores = full @ query
+                if dimensions < self.dimensions:
+                    best_scores /= np.maximum(np.linalg.norm(full, axis=1), 1e-12)
+            top = np.argsort(-best_scores, kind="stable")[:k]
+            return [(self.__ids[best_rows[i]], float(best_scores[i])) for i in top]
+
+    def nbytes(self) -> int:
+        """Size of the store's files on disk"""
+        return sum(os.path.getsize(os.path.join(self.path, name)) for name in os.listdir(self.path))
+
+    def __quantize(self, matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.dtype == "int8":
+            # Symmetric per-row scale; unit vectors keep most of their precision in 8 bits
+            scales = np.maximum(np.abs(matrix).max(axis=1), 1e-12) / 127.0
+            return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return matrix.astype(self.dtype), np.ones(len(matrix), dtype=np.float32)
+
+    def __overwrite(self, row: int, quantized: np.ndarray, scale: float, vector: np.ndarray) -> None:
+        views = self.__map()
+        views["vectors.q"][row] = quantized
+        if self.dtype == "int8":
+            views["scales.f32"][row] = scale
+        if self.rescore:
+            views["vectors.f32"][row] = vector
+        for view in views.values():
+            view.flush()
+
+    def __append(self, name: str, array: np.ndarray) -> None:
+        with open(os.path.join(self.path, name), "ab") as file:
+            file.write(np.ascontiguousarray(array).tobytes())
+
+    def __map(self) -> Dict[str, np.ndarray]:
+        """Memory-map the files, re-mapping after appends changed their length"""
+        if self.__mapped_count != self.count:
+            files = {"vectors.q": (np.dtype(self.dtype), (self.dimensions,))}
+            if self.dtype == "int8":
+                files["scales.f32"] = (np.dtype(np.float32), ())
+            if self.rescore:
+                files["vectors.f32"] = (np.dtype(np.float32), (self.dimensions,))
+            self.__views = {
+                name: np.memmap(os.path.join(self.path, name), dtype=dtype, mode="r+", shape=(self.count,) + shape)
+                for name, (dtype, shape) in files.items()
+            } if self.count else {}
+            self.__mapped_count = self.count
+        return self.__views
+
+    def __load_ids(self) -> None:
+        ids_path = os.path.join(self.path, "ids.txt")
+        if not os.path.exists(ids_path):
+            return
+        with open(ids_path, encoding="utf-8") as file:
+            ids = file.read().splitlines()
+        # A crash between the vector appends and the IDs leaves rows in some files only; cut
+        # every file back to the rows complete everywhere, or the next append would misalign them
+        sizes = self.__row_sizes()
+        paths = {name: os.path.join(self.path, name) for name in sizes}
+        complete = min([len(ids)] + [os.path.getsize(path) // sizes[name] if os.path.exists(path) else 0
+                                     for name, path in paths.items()])
+        for name, path in paths.items():
+            if os.path.exists(path):
+                with open(path, "r+b") as file:
+                    file.truncate(complete * sizes[name])
+        if complete < len(ids):
+            with open(ids_path, "w", encoding="utf-8") as file:
+                file.write("".join(f"{key}\n" for key in ids[:complete]))
+        self.__ids = ids[:complete]
+        self.__deleted = np.zeros(len(self.__ids), dtype=bool)
+        deleted_path = os.path.join(self.path, "deleted.txt")
+        if os.path.exists(deleted_path):
+            with open(deleted_path, encoding="utf-8") as file:
+                rows = [int(line) for line in file.read().splitlines() if line]
+            valid = [row for row in rows if row < len(self.__ids)]
+            if len(valid) < len(rows):
+                # Deletions of cut rows must not apply to the rows appended in their place
+                with open(deleted_path, "w", encoding="utf-8") as file:
+                    file.write("".join(f"{row}\n" for row in valid))
+            self.__deleted[valid] = True
+        for row, key in enumerate(self.__ids):
+            if not self.__deleted[row]:
+                self.__rows[key] = row
+
+    def __row_sizes(self) -> Dict[str, int]:
+        """Bytes per row of each matrix file"""
+        sizes = {"vectors.q": np.dtype(self.dtype).itemsize * self.dimensions}
+        if self.dtype == "int8":
+            sizes["scales.f32"] = 4
+        if self.rescore:
+            sizes["vectors.f32"] = 4 * self.dimensions
+        return sizes
+
+    def __write_meta(self) -> None:
+        with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump({"dimensions": self.dimensions, "dtype": self.dtype, "rescore": self.rescore}, file)
@@ -0,0 +1,80 @@
+"""
+Benchmark the per-request setup cost of the main LangGraph workflow.
+
+Compares building the graph on every request (``build_main_graph()``, the previous
+behaviour of ``/process``) against fetching the graph compiled once by the
+process-wide ``GraphRegistry``. Only client construction and graph compilation are
+measured; no LLM or search calls are made, but the usual environment variables
+(see README) must be set so the clients can be constructed.
+
+Usage:
+    python benchmarks/bench_graph_registry.py --iterations 50
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.agents.main.agent import build_main_graph
+from backend.agents.main.registry import GraphRegistry
+
+
+def time_calls(func, iterations: int) -> list:
+    """
+    Time repeated calls of a function.
+
+    Parameters
+    ----------
+    func : callable
+        The function to call
+    iterations : int
+        How many times to call it
+
+    Returns
+    -------
+    list
+        Durations of the individual calls in milliseconds
+    """
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def report(name: str, durations: list) -> None:
+    """Print summary statistics for a list of durations in milliseconds."""
+    ordered = sorted(durations)
+    p95 = ordered[max(0, int(len(ordered) * 0.95) - 1)]
+    print(f"{name:<28} mean={statistics.mean(ordered):9.3f} ms  "
+          f"median={statistics.median(ordered):9.3f} ms  p95={p95:9.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50, help="Number of simulated requests")
+    args = parser.parse_args()
+
+    per_request = time_calls(build_main_graph, args.iterations)
+
+    registry = GraphRegistry()
+    start = time.perf_counter()
+    registry.get_graph()
+    initial_build = (time.perf_counter() - start) * 1000
+    shared = time_calls(registry.get_graph, args.iterations)
+
+    print(f"Simulated requests: {args.iterations}")
+    report("build_main_graph() per call", per_request)
+    report("GraphRegistry.get_graph()", shared)
+    print(f"One-off registry build: {initial_build:.3f} ms")
+    saved = statistics.mean(per_request) - statistics.mean(shared)
+    print(f"Setup time saved per request: {saved:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmark the cold start of the API process.
+
+Two measurements, each in fresh Python processes so nothing is already imported:
+
+- ``python -X importtime -c "import backend.server"``, summarised as the total import
+  time of the app and the packages that take longest to import (cumulative).
+- For each ``STARTUP_MODE`` (eager, background, lazy): time to import the app,
+  time for its lifespan to start (until uvicorn would accept requests) and time
+  until the graph is built and a first request can run.
+
+Dummy Azure settings are supplied so the clients can be constructed offline; no
+LLM or search calls are made.
+
+Usage:
+    python benchmarks/bench_importtime.py --repeats 5 --top 15
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_MODES = ("eager", "background", "lazy")
+
+# Enough configuration for the agents and their clients to be constructed without a network
+DUMMY_ENV = {
+    "AZURE_OPENAI_ENDPOINT": "https://example.openai.azure.com/",
+    "AZURE_OPENAI_API_KEY": "dummy",
+    "OPENAI_API_VERSION": "2024-08-01-preview",
+    "AZURE_SEARCH_ENDPOINT": "https://example.search.windows.net",
+    "AZURE_SEARCH_INDEX": "dummy",
+    "AZURE_SEARCH_KEY": "dummy",
+    "K_NEAREST_NEIGHBORS": "50",
+    "NUM_SEARCH_RESULTS": "5",
+    "MAX_ATTEMPTS": "3",
+}
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+# Runs in the child process: import the app, run its lifespan, then wait for the graph
+STARTUP_PROBE = """
+import asyncio, json, time
+start = time.perf_counter()
+import backend.server as server
+imported = time.perf_counter()
+
+async def main():
+    async with server.app.router.lifespan_context(server.app):
+        started = time.perf_counter()
+        await server.graph_registry.aget_graph()
+        ready = time.perf_counter()
+    return started, ready
+
+started, ready = asyncio.run(main())
+print(json.dumps({"import": imported - start, "startup": started - imported, "ready": ready - start}))
+"""
+
+
+def child_env(**overrides: str) -> Dict[str, str]:
+    env = {**os.environ, **DUMMY_ENV, **overrides}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    return env
+
+
+def import_times() -> List[Dict[str, float]]:
+    """Import ``backend`` under ``-X importtime`` and parse its report (times in seconds)"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import backend.server"],
+                            cwd=ROOT, env=child_env(), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing backend failed:\n{result.stderr[-2000:]}")
+    modules = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            modules.append({
+                "module": match.group(4),
+                "self": int(match.group(1)) / 1e6,
+                "cumulative": int(match.group(2)) / 1e6,
+                "depth": len(match.group(3)) // 2,
+            })
+    return modules
+
+
+def top_packages(modules: List[Dict[str, float]], top: int) -> List[Dict[str, float]]:
+    """Top-level packages by cumulative import time, each counted where it was first imported"""
+    packages: Dict[str, float] = {}
+    for module in modules:
+        if "." in module["module"]:
+            continue
+        packages[module["module"]] = max(packages.get(module["module"], 0.0), module["cumulative"])
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return [{"package": name, "cumulative": seconds} for name, seconds in ranked[:top]]
+
+
+def startup_times(mode: str) -> Dict[str, float]:
+    result = subprocess.run([sys.executable, "-c", STARTUP_PROBE], cwd=ROOT,
+                            env=child_env(STARTUP_MODE=mode), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Starting the app with STARTUP_MODE={mode} failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def median_of(runs: List[Dict[str, float]], key: str) -> float:
+    return statistics.median(run[key] for run in runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh processes per measurement; medians are reported")
+    parser.add_argument("--top", type=int, default=15, help="Packages listed by import time")
+    parser.add_argument("--modes", nargs="+", choices=STARTUP_MODES, default=list(STARTUP_MODES))
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    reports = [import_times() for _ in range(args.repeats)]
+    totals = [next((m["cumulative"] for m in modules if m["module"] == "backend"), 0.0) for modules in reports]
+    packages: Dict[str, List[float]] = {}
+    for modules in reports:
+        for package in top_packages(modules, len(modules)):
+            packages.setdefault(package["package"], []).append(package["cumulative"])
+    ranked = sorted(((name, statistics.median(times)) for name, times in packages.items()),
+                    key=lambda item: item[1], reverse=True)[:args.top]
+
+    print(f"import backend.server: {statistics.median(totals) * 1000:9.1f} ms (median of {args.repeats})")
+    print(f"{'package':<32}{'cumulative':>14}")
+    for name, seconds in ranked:
+        print(f"{name:<32}{seconds * 1000:11.1f} ms")
+
+    print()
+    print(f"{'STARTUP_MODE':<14}{'import':>12}{'startup':>12}{'graph ready':>14}")
+    startup = {}
+    for mode in args.modes:
+        runs = [startup_times(mode) for _ in range(args.repeats)]
+        startup[mode] = {key: median_of(runs, key) for key in ("import", "startup", "ready")}
+        print(f"{mode:<14}{startup[mode]['import'] * 1000:9.1f} ms{startup[mode]['startup'] * 1000:9.1f} ms"
+              f"{startup[mode]['ready'] * 1000:11.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({
+                "repeats": args.repeats,
+                "import_seconds": statistics.median(totals),
+                "packages": [{"package": name, "cumulative": seconds} for name, seconds in ranked],
+                "startup": startup,
+            }, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark Matryoshka truncation of the embeddings used for retrieval.
+
+For each number of leading dimensions, searches the truncated (renormalized)
+vectors for a shortlist of ``k * SEARCH_VECTOR_RESCORE_FACTOR`` neighbours, rescores
+the shortlist with the full vectors, and reports recall@k against an exact
+full-dimension search before and after rescoring, the size of the vectors the
+index searches and the query latency of both passes.
+
+Vectors come from a local search index built by ``scripts/indexing.py`` with
+``SEARCH_BACKEND=local`` (``--index``), i.e. real text-embedding-3-large
+embeddings, with sampled chunks as queries. Without an index, synthetic vectors
+whose variance decays along the dimensions stand in; they exercise the code path
+but only real embeddings give meaningful recall numbers.
+
+Usage:
+    python benchmarks/bench_matryoshka.py --index local_search_index --dimensions 256 512 1024 3072
+    python benchmarks/bench_matryoshka.py --count 100000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.utils.embeddings import truncate_embedding, EMBEDDING_DIMENSIONS, VECTOR_RESCORE_FACTOR
+
+
+def load_vectors(index: str | None, count: int, dimensions: int, seed: int) -> np.ndarray:
+    """
+    Unit vectors to search: those of a saved local index, or synthetic ones.
+
+    Parameters
+    ----------
+    index : str | None
+        Directory of a saved local search index (with ``vectors.npy``)
+    count : int
+        Number of synthetic vectors, when no index is given
+    dimensions : int
+        Dimensions of the synthetic vectors
+    seed : int
+        Seed of the synthetic vectors
+
+    Returns
+    -------
+    np.ndarray
+        A (count, dimensions) float32 matrix of unit rows
+    """
+    if index:
+        vectors = np.load(os.path.join(index, "vectors.npy"))
+        vectors = vectors[np.linalg.norm(vectors, axis=1) > 0]
+    else:
+        rng = np.random.default_rng(seed)
+        # Clusters plus noise, with most of the variance in the leading dimensions as in Matryoshka embeddings
+        decay = (1.0 + np.arange(dimensions, dtype=np.float32)) ** -0.5
+        centers = rng.standard_normal((max(count // 100, 1), dimensions), dtype=np.float32) * decay
+        vectors = centers[rng.integers(0, len(centers), size=count)]
+        vectors += rng.standard_normal((count, dimensions), dtype=np.float32) * decay * 0.5
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def top_k(scores: np.ndarray, k: int, exclude: int) -> np.ndarray:
+    """Indices of the ``k`` best scores, best first, leaving out the query's own row"""
+    scores = scores.copy()
+    scores[exclude] = -np.inf
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", help="Saved local search index to take the vectors from")
+    parser.add_argument("--count", type=int, default=50_000, help="Synthetic vectors, when no index is given")
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[256, 512, 1024, EMBEDDING_DIMENSIONS],
+                        help="Leading dimensions searched in the first pass")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.index, args.count, EMBEDDING_DIMENSIONS, args.seed)
+    queries = np.random.default_rng(args.seed + 1).choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    truth = {query: set(top_k(vectors @ vectors[query], args.k, query)) for query in queries}
+    shortlist = args.k * VECTOR_RESCORE_FACTOR
+
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, "
+          f"shortlist {shortlist}, recall@{args.k}")
+    print(f"{'dims':>6} {'index MB':>9} {'recall':>7} {'rescored':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for dimensions in args.dimensions:
+        dimensions = min(dimensions, vectors.shape[1])
+        truncated = vectors[:, :dimensions] / np.maximum(np.linalg.norm(vectors[:, :dimensions], axis=1, keepdims=True), 1e-12)
+        first_pass, rescored, latencies = [], [], []
+        for query in queries:
+            start = time.perf_counter()
+            candidates = top_k(truncated @ np.asarray(truncate_embedding(vectors[query], dimensions)), shortlist, query)
+            best = candidates[np.argsort(-(vectors[candidates] @ vectors[query]), kind="stable")[:args.k]]
+            latencies.append((time.perf_counter() - start) * 1000)
+            first_pass.append(len(set(candidates[:args.k]) & truth[query]) / args.k)
+            rescored.append(len(set(best) & truth[query]) / args.k)
+        print(f"{dimensions:>6} {truncated.nbytes / 1e6:>9.1f} {statistics.mean(first_pass):>7.3f} "
+              f"{statistics.mean(rescored):>9.3f} {np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 95):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Benchmark the full multi-agent graph offline, with deterministic fake services.
+
+Builds the real main graph (planner, research subgraph, consolidation) on top of
+the fakes in ``benchmarks/fakes.py``: a chat model answering from the prompt with
+scripted review decisions, bag-of-words embeddings and a local search index over
+a synthetic corpus, each with a configurable latency. It then runs the graph for
+every combination of taxonomy count and ``MAX_ATTEMPTS`` and reports:
+
+- wall time per request;
+- time per graph node;
+- event-loop lag, i.e. how long synchronous work blocked the loop;
+- peak traced memory, from one extra run under ``tracemalloc``.
+
+The review script decides retry or finalize per attempt, so with
+``--review-script retry`` every branch runs up to ``MAX_ATTEMPTS`` attempts.
+
+Usage:
+    python benchmarks/bench_pipeline.py --taxonomies 1 5 10 20 --max-attempts 1 3 5 \
+        --llm-latency 0.2 --output-tps 80 --search-latency 0.05 --review-script retry
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("K_NEAREST_NEIGHBORS", "30")
+os.environ.setdefault("NUM_SEARCH_RESULTS", "5")
+os.environ.setdefault("MAX_ATTEMPTS", "3")
+
+from fakes import FakeChatModel, FakeEmbeddings, FakeLatency, FakeSearchClient, install_fakes, synthetic_corpus
+from harness import LoopLagMonitor, NodeTimer, percentile
+
+from backend.utils.chunk_registry import chunk_registries
+from backend.utils.classes import MainState
+from backend.utils.embedding_cache import embedding_cache
+from backend.utils.search_cache import search_cache
+from backend.utils.taxonomy_cache import taxonomy_cache
+
+NODES = ("identify_taxonomies", "research_agent", "generate_search_query", "review_results",
+         "consolidate_results", "final_inference")
+
+
+def build_graph(args, taxonomies: int, max_attempts: int, corpus):
+    """
+    Build the main graph on fresh fakes for one configuration.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Latency and behaviour settings of the fakes
+    taxonomies : int
+        Taxonomies returned by the fake planner
+    max_attempts : int
+        ``MAX_ATTEMPTS`` of the research agent
+    corpus : LocalSearchIndex
+        Synthetic index served by the fake search client
+
+    Returns
+    -------
+    tuple
+        The compiled graph, the fake chat model and the fake search client
+    """
+    from backend.agents.consolidation.agent import Consolidate
+    from backend.agents.main.agent import build_main_graph
+    from backend.agents.planner.agent import TaxonomyLLM
+    from backend.agents.research.agent import ReviewLLM
+
+    # The agents read their settings when they are constructed
+    os.environ["MAX_ATTEMPTS"] = str(max_attempts)
+    chat_model = FakeChatModel(
+        taxonomies=taxonomies,
+        review_script=args.review_script.split(","),
+        valid_per_review=args.valid_per_review,
+        answer_tokens=args.answer_tokens,
+        latency=FakeLatency(args.llm_latency, args.input_tps, args.output_tps),
+    )
+    install_fakes(chat_model, FakeEmbeddings(args.dimensions, FakeLatency(args.embedding_latency)))
+    search_client = FakeSearchClient(corpus, FakeLatency(args.search_latency))
+    graph = build_main_graph(
+        consolidate_agent=Consolidate(),
+        review_agent=ReviewLLM(search_client=search_client),
+        taxonomy_agent=TaxonomyLLM(),
+    )
+    return graph, chat_model, search_client
+
+
+async def run_request(graph, question: str, timer: NodeTimer | None = None) -> float:
+    """Run one question through the graph and return its wall time in seconds"""
+    request_id = uuid.uuid4().hex
+    state = MainState(
+        request_id=request_id,
+        session_id=None,
+        user_input=question,
+        user_history="",
+        taxonomies=[],
+        research_results=[],
+        research_outputs=[],
+        final_answer=None,
+        thought_process=[],
+    )
+    # Every run starts cold, as a new question would
+    search_cache.clear()
+    embedding_cache.clear()
+    start = time.perf_counter()
+    try:
+        await graph.ainvoke(state, config={"callbacks": [timer] if timer else []})
+    finally:
+        chunk_registries.release(request_id)
+    return time.perf_counter() - start
+
+
+async def run_configuration(args, taxonomies: int, max_attempts: int, corpus) -> dict:
+    """Time ``args.repeats`` requests for one configuration, then trace the memory of one more"""
+    graph, chat_model, search_client = build_graph(args, taxonomies, max_attempts, corpus)
+    timer = NodeTimer()
+    wall_times = []
+    async with LoopLagMonitor() as monitor:
+        for repeat in range(args.repeats):
+            wall_times.append(await run_request(graph, f"{args.question} (run {repeat})", timer))
+
+    tracemalloc.start()
+    await run_request(graph, f"{args.question} (traced)")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "taxonomies": taxonomies,
+        "max_attempts": max_attempts,
+        "wall": wall_times,
+        "nodes": timer.durations,
+        "lag": monitor.stats(),
+        "peak_mb": peak / 1e6,
+        "llm_calls": sum(chat_model.calls.values()) / (args.repeats + 1),
+        "search_calls": search_client.calls / (args.repeats + 1),
+    }
+
+
+async def run(args) -> list:
+    corpus = synthetic_corpus(args.documents, max(args.taxonomies), FakeEmbeddings(args.dimensions))
+    # Every run asks a new question; the semantic taxonomy tier would otherwise answer them all
+    taxonomy_cache.enabled = False
+    results = []
+    with open(os.devnull, "w") as devnull:
+        for taxonomies in args.taxonomies:
+            for max_attempts in args.max_attempts:
+                # The agents log every update and LLM call; keep that out of the report unless asked for
+                with contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+                    results.append(await run_configuration(args, taxonomies, max_attempts, corpus))
+    return results
+
+
+def report(results: list) -> None:
+    print(f"{'taxonomies':>10} {'attempts':>8} {'mean s':>7} {'p95 s':>7} {'llm calls':>9} {'searches':>8} "
+          f"{'lag p99 ms':>10} {'lag max ms':>10} {'blocked ms':>10} {'peak MB':>8}")
+    for result in results:
+        print(f"{result['taxonomies']:>10} {result['max_attempts']:>8} {statistics.mean(result['wall']):>7.2f} "
+              f"{percentile(result['wall'], 95):>7.2f} {result['llm_calls']:>9.0f} {result['search_calls']:>8.0f} "
+              f"{result['lag']['p99_ms']:>10.1f} {result['lag']['max_ms']:>10.1f} "
+              f"{result['lag']['total_ms'] / len(result['wall']):>10.1f} {result['peak_mb']:>8.1f}")
+
+    print("\nMean ms per node run (runs per request)")
+    print(f"{'taxonomies':>10} {'attempts':>8} " + " ".join(f"{node:>24}" for node in NODES))
+    for result in results:
+        cells = []
+        for node in NODES:
+            durations = result["nodes"].get(node, [])
+            runs = len(durations) / len(result["wall"])
+            cells.append(f"{statistics.mean(durations) * 1000 if durations else 0:>15.1f} ({runs:>5.1f})")
+        print(f"{result['taxonomies']:>10} {result['max_attempts']:>8} " + " ".join(f"{cell:>24}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--taxonomies", type=int, nargs="+", default=[1, 2, 5, 10, 20])
+    parser.add_argument("--max-attempts", type=int, nargs="+", default=[1, 2, 3, 4, 5])
+    parser.add_argument("--repeats", type=int, default=3, help="Timed requests per configuration")
+    parser.add_argument("--question", default="Can a UK group claim relief for losses of an EU subsidiary?")
+    parser.add_argument("--review-script", default="retry,retry,finalize",
+                        help="Review decisions by attempt, comma separated; the last one repeats")
+    parser.add_argument("--valid-per-review", type=int, default=2, help="Results each review marks valid")
+    parser.add_argument("--answer-tokens", type=int, default=300)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per LLM call")
+    parser.add_argument("--input-tps", type=float, default=None, help="Prompt tokens per second (default: free)")
+    parser.add_argument("--output-tps", type=float, default=None, help="Generated tokens per second (default: free)")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="Seconds per embeddings request")
+    parser.add_argument("--search-latency", type=float, default=0.03, help="Seconds per search")
+    parser.add_argument("--documents", type=int, default=200, help="Synthetic chunks per taxonomy")
+    parser.add_argument("--dimensions", type=int, default=256, help="Fake embedding dimensions")
+    parser.add_argument("--verbose", action="store_true", help="Show the agents' own logging")
+    args = parser.parse_args()
+
+    report(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
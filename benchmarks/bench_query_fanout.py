@@ -0,0 +1,104 @@
+"""
+Benchmark multi-query retrieval in the research loop.
+
+Runs the research subgraph for each taxonomy with different values of
+``SEARCH_QUERY_FANOUT`` (the number of diverse searches generated per attempt and
+fused with reciprocal rank fusion) and reports the average number of attempts per
+taxonomy, the number of vetted results and the wall-clock latency of a branch.
+
+This calls the configured Azure OpenAI deployment and Azure AI Search index, so
+the usual environment variables (see README) must be set. The search and embedding
+caches are cleared before every run so each fan-out value starts cold.
+
+Usage:
+    python benchmarks/bench_query_fanout.py --fanout 1 3 5 \
+        --question "Can a UK group claim relief for losses of an EU subsidiary?" \
+        --taxonomy "Group and consortium relief" --taxonomy "Controlled Foreign Companies (CFCs)"
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.utils.classes import new_research_state
+from backend.utils.embedding_cache import embedding_cache
+from backend.utils.search_cache import search_cache
+
+
+async def run_branch(agent, question: str, taxonomy: str) -> dict:
+    """
+    Run one research branch to completion.
+
+    Parameters
+    ----------
+    agent : ReviewLLM
+        The research agent to run
+    question : str
+        The user question
+    taxonomy : str
+        The taxonomy researched by the branch
+
+    Returns
+    -------
+    dict
+        The branch's taxonomy result, with its latency in seconds under "seconds"
+    """
+    state = new_research_state(str(uuid.uuid4()), None, taxonomy, question, "")
+    start = time.perf_counter()
+    output = await agent.get_research_graph().ainvoke(state)
+    result = output["research_outputs"][0]
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+async def run_fanout(fanout: int, question: str, taxonomies: list, repeats: int) -> list:
+    """Run every taxonomy ``repeats`` times with the given fan-out, starting from cold caches."""
+    from backend.agents.research.agent import ReviewLLM
+
+    # The agent reads its settings when it is constructed
+    os.environ["SEARCH_QUERY_FANOUT"] = str(fanout)
+    agent = ReviewLLM()
+    results = []
+    try:
+        for _ in range(repeats):
+            search_cache.clear()
+            embedding_cache.clear()
+            results.extend(await asyncio.gather(*(run_branch(agent, question, taxonomy) for taxonomy in taxonomies)))
+    finally:
+        await agent.aclose()
+    return results
+
+
+async def compare(fanouts: list, question: str, taxonomies: list, repeats: int) -> None:
+    """Print one row of averages per fan-out value; all runs share one event loop and model client."""
+    print(f"{'fanout':>6} {'branches':>8} {'attempts':>9} {'vetted':>7} {'mean s':>8} {'max s':>8} {'prompt tokens':>14}")
+    for fanout in fanouts:
+        results = await run_fanout(fanout, question, taxonomies, repeats)
+        print(f"{fanout:>6} {len(results):>8} "
+              f"{statistics.mean(result['attempts'] for result in results):>9.2f} "
+              f"{statistics.mean(len(result['vetted_results']) for result in results):>7.2f} "
+              f"{statistics.mean(result['seconds'] for result in results):>8.2f} "
+              f"{max(result['seconds'] for result in results):>8.2f} "
+              f"{statistics.mean(result['prompt_tokens'] for result in results):>14.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fanout", type=int, nargs="+", default=[1, 3], help="SEARCH_QUERY_FANOUT values to compare")
+    parser.add_argument("--question", default="Can a UK group claim relief for losses of an EU subsidiary?")
+    parser.add_argument("--taxonomy", action="append", help="Taxonomy to research (repeatable)")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per fan-out value")
+    args = parser.parse_args()
+    taxonomies = args.taxonomy or ["Group and consortium relief", "Controlled Foreign Companies (CFCs)"]
+
+    asyncio.run(compare(args.fanout, args.question, taxonomies, args.repeats))
+
+
+if __name__ == "__main__":
+    main()
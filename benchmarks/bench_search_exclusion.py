@@ -0,0 +1,107 @@
+"""
+Benchmark excluding already-processed chunks from research searches.
+
+Compares the two ways a research attempt keeps previously seen chunks out of its
+results as the number of attempts grows:
+
+- filter:    a ``not search.in(id, '...')`` clause listing every processed ID, so
+             the OData filter grows linearly with the attempts
+- overfetch: ``top = NUM_SEARCH_RESULTS + len(processed_ids)`` with the processed
+             IDs removed client-side through a hash set
+
+Without ``--live`` only the filter sizes are reported (using synthetic chunk IDs).
+With ``--live`` both approaches are run against the configured Azure AI Search
+index, using the index's own top-ranked IDs as the processed set.
+
+Usage:
+    python benchmarks/bench_search_exclusion.py --max-attempts 10
+    python benchmarks/bench_search_exclusion.py --live --query "group relief for stamp duty land tax"
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.agents.research.agent import build_search_filter, exclude_processed
+
+
+def synthetic_ids(count: int) -> list:
+    """Chunk IDs shaped like the ones produced by scripts/indexing.py (md5 hex digests)."""
+    return [hashlib.md5(f"document.pdf{i}".encode()).hexdigest() for i in range(count)]
+
+
+def report_filter_sizes(max_attempts: int, num_results: int) -> None:
+    """Print the OData filter size each approach sends per attempt."""
+    ids = synthetic_ids(max_attempts * num_results)
+    print(f"{'attempt':>7} {'processed':>9} {'filter chars':>13} {'overfetch chars':>16} {'overfetch top':>14}")
+    for attempt in range(1, max_attempts + 1):
+        processed = set(ids[:(attempt - 1) * num_results])
+        filter_size = len(build_search_filter(None, processed) or "")
+        overfetch_size = len(build_search_filter(None) or "")
+        print(f"{attempt:>7} {len(processed):>9} {filter_size:>13} {overfetch_size:>16} {num_results + len(processed):>14}")
+
+
+async def time_search(client, query: str, vector_query, filter_str: str | None, top: int, repeats: int) -> tuple:
+    """Median latency in milliseconds of a search, and the IDs it returned."""
+    durations = []
+    ids = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        results = await client.search(search_text=query, vector_queries=[vector_query], filter=filter_str,
+                                      select=["id"], top=top)
+        ids = [result["id"] async for result in results]
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations), ids
+
+
+async def run_live(query: str, max_attempts: int, num_results: int, k_nearest_neighbors: int, repeats: int) -> None:
+    """Time both exclusion approaches against the live index."""
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents.aio import SearchClient
+    from azure.search.documents.models import VectorizedQuery
+    from langchain_openai import AzureOpenAIEmbeddings
+    from backend.utils.llm import EMBEDDINGS_DEPLOYMENT
+
+    embeddings = AzureOpenAIEmbeddings(azure_deployment=EMBEDDINGS_DEPLOYMENT)
+    vector_query = VectorizedQuery(vector=await embeddings.aembed_query(query),
+                                   k_nearest_neighbors=k_nearest_neighbors, fields="content_vector")
+
+    async with SearchClient(os.environ["AZURE_SEARCH_ENDPOINT"], os.environ["AZURE_SEARCH_INDEX"],
+                            AzureKeyCredential(os.environ["AZURE_SEARCH_KEY"])) as client:
+        _, ranked_ids = await time_search(client, query, vector_query, None, max_attempts * num_results, 1)
+
+        print(f"{'attempt':>7} {'processed':>9} {'filter ms':>10} {'overfetch ms':>13} {'same results':>13}")
+        for attempt in range(1, max_attempts + 1):
+            processed = set(ranked_ids[:(attempt - 1) * num_results])
+            filter_ms, filter_ids = await time_search(
+                client, query, vector_query, build_search_filter(None, processed), num_results, repeats)
+            overfetch_ms, overfetch_ids = await time_search(
+                client, query, vector_query, None, num_results + len(processed), repeats)
+            kept = [result["id"] for result in exclude_processed([{"id": i} for i in overfetch_ids], processed, num_results)]
+            print(f"{attempt:>7} {len(processed):>9} {filter_ms:>10.1f} {overfetch_ms:>13.1f} {str(kept == filter_ids):>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-attempts", type=int, default=10, help="Number of research attempts to simulate")
+    parser.add_argument("--num-results", type=int, default=int(os.environ.get("NUM_SEARCH_RESULTS", "5")))
+    parser.add_argument("--k-nearest-neighbors", type=int, default=int(os.environ.get("K_NEAREST_NEIGHBORS", "30")))
+    parser.add_argument("--repeats", type=int, default=5, help="Searches per measurement (median is reported)")
+    parser.add_argument("--live", action="store_true", help="Measure latency against the configured index")
+    parser.add_argument("--query", default="corporate interest restriction filing process")
+    args = parser.parse_args()
+
+    report_filter_sizes(args.max_attempts, args.num_results)
+    if args.live:
+        print()
+        asyncio.run(run_live(args.query, args.max_attempts, args.num_results, args.k_nearest_neighbors, args.repeats))
+
+
+if __name__ == "__main__":
+    main()
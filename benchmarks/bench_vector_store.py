@@ -0,0 +1,136 @@
+"""
+Benchmark recall, latency and disk size of the memory-mapped vector store.
+
+Builds one ``MmapVectorStore`` per quantization dtype from the same synthetic,
+clustered unit vectors (written in blocks, so the corpus never has to fit in
+memory) and searches them with queries drawn near stored vectors. The float32
+store is an exact scan and provides the ground truth; int8 and float16 stores are
+measured with and without the float32 rescoring pass.
+
+At the defaults (1M chunks of 3072 dimensions, like ``content_vector``) the
+stores take about 45 GB under ``--path``; use ``--count`` and ``--dimensions`` for
+a quicker run. Existing stores under ``--path`` are reused when their size matches.
+
+Usage:
+    python benchmarks/bench_vector_store.py --count 1000000 --dimensions 3072 --queries 50 \
+        --path /mnt/scratch/vector_store_bench
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.utils.vector_store import MmapVectorStore
+
+BLOCK_ROWS = 10_000
+CLUSTERS = 1_000
+
+
+def generate_block(seed: int, block: int, rows: int, dimensions: int, centers: np.ndarray) -> np.ndarray:
+    """
+    Generate one block of clustered vectors, identical for every store built with the same seed.
+
+    Parameters
+    ----------
+    seed : int
+        Seed of the corpus
+    block : int
+        Index of the block, so any block can be regenerated on its own
+    rows : int
+        Number of vectors in the block
+    dimensions : int
+        Vector dimensions
+    centers : np.ndarray
+        Cluster centers the vectors are scattered around
+
+    Returns
+    -------
+    np.ndarray
+        A (rows, dimensions) float32 matrix
+    """
+    rng = np.random.default_rng((seed, block))
+    assigned = rng.integers(0, len(centers), size=rows)
+    noise = rng.standard_normal((rows, dimensions), dtype=np.float32) * 0.7
+    return centers[assigned] + noise / np.sqrt(dimensions)
+
+
+def build_store(path: str, dtype: str, count: int, dimensions: int, seed: int) -> MmapVectorStore:
+    """Create (or reuse) the store for a dtype, appending the corpus block by block"""
+    store = MmapVectorStore(path, dimensions=dimensions, dtype=dtype)
+    if store.count == count:
+        return store
+    if store.count:
+        raise SystemExit(f"{path} holds {store.count} vectors, expected {count}; remove it first")
+    centers = np.random.default_rng(seed).standard_normal((CLUSTERS, dimensions), dtype=np.float32) / np.sqrt(dimensions)
+    start = time.perf_counter()
+    for block, offset in enumerate(range(0, count, BLOCK_ROWS)):
+        rows = min(BLOCK_ROWS, count - offset)
+        store.add((f"chunk-{offset + row}" for row in range(rows)), generate_block(seed, block, rows, dimensions, centers))
+    print(f"built {dtype} store: {count} vectors in {time.perf_counter() - start:.1f}s")
+    return store
+
+
+def make_queries(count: int, dimensions: int, queries: int, seed: int) -> np.ndarray:
+    """Queries near random stored vectors, so each has a meaningful neighbourhood"""
+    rng = np.random.default_rng(seed + 1)
+    centers = np.random.default_rng(seed).standard_normal((CLUSTERS, dimensions), dtype=np.float32) / np.sqrt(dimensions)
+    targets = rng.integers(0, count, size=queries)
+    result = np.empty((queries, dimensions), dtype=np.float32)
+    for position, target in enumerate(targets):
+        block, row = divmod(int(target), BLOCK_ROWS)
+        rows = min(BLOCK_ROWS, count - block * BLOCK_ROWS)
+        result[position] = generate_block(seed, block, rows, dimensions, centers)[row]
+    return result + rng.standard_normal(result.shape, dtype=np.float32) * 0.3 / np.sqrt(dimensions)
+
+
+def measure(store: MmapVectorStore, queries: np.ndarray, k: int, rescore: bool) -> tuple:
+    """Results and per-query latencies (ms) of searching every query"""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append([key for key, _ in store.search(query, k, rescore=rescore)])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=1_000_000, help="Vectors in the corpus")
+    parser.add_argument("--dimensions", type=int, default=3072)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dtypes", nargs="+", default=["int8", "float16"], help="Quantized dtypes to compare with float32")
+    parser.add_argument("--path", default="vector_store_bench", help="Directory for the stores")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    queries = make_queries(args.count, args.dimensions, args.queries, args.seed)
+    exact = build_store(os.path.join(args.path, "float32"), "float32", args.count, args.dimensions, args.seed)
+    truth, latencies = measure(exact, queries, args.k, rescore=False)
+    rows = [("float32 (exact)", 1.0, latencies, exact.nbytes())]
+
+    for dtype in args.dtypes:
+        store = build_store(os.path.join(args.path, dtype), dtype, args.count, args.dimensions, args.seed)
+        # The float32 copy only serves rescoring, so the quantized-only size excludes it
+        quantized_bytes = store.nbytes() - os.path.getsize(os.path.join(store.path, "vectors.f32"))
+        for rescore in (False, True):
+            results, latencies = measure(store, queries, args.k, rescore)
+            recall = statistics.mean(len(set(found) & set(expected)) / args.k for found, expected in zip(results, truth))
+            label = f"{dtype} + rescore" if rescore else dtype
+            rows.append((label, recall, latencies, store.nbytes() if rescore else quantized_bytes))
+
+    print(f"\n{args.count} vectors x {args.dimensions} dims, {args.queries} queries, recall@{args.k}")
+    print(f"{'store':<18} {'recall':>7} {'p50 ms':>9} {'p95 ms':>9} {'disk MB':>10}")
+    for label, recall, latencies, size in rows:
+        print(f"{label:<18} {recall:>7.3f} {np.percentile(latencies, 50):>9.1f} "
+              f"{np.percentile(latencies, 95):>9.1f} {size / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
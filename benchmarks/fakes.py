@@ -0,0 +1,320 @@
+"""
+Deterministic local stand-ins for Azure OpenAI and Azure AI Search.
+
+Used by the offline benchmarks: ``install_fakes`` puts a ``FakeChatModel`` and
+``FakeEmbeddings`` in the shared ``LLM`` model slots before any agent is built,
+and ``FakeSearchClient`` serves a synthetic corpus from a ``LocalSearchIndex``.
+Every call sleeps for a configurable latency (a fixed overhead plus time per
+input and output token), so a run measures the graph's own overhead on top of a
+known, repeatable service time.
+
+The fakes are stateless per call: the chat model answers from the prompt alone
+(the taxonomy, the ``<Attempt n>`` entries of the search history and the result
+labels), so concurrent requests and research branches cannot disturb each other.
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, List, Sequence
+import asyncio
+import hashlib
+import json
+import re
+
+import numpy as np
+
+from backend.utils.local_search import AsyncLocalSearchClient, AsyncSearchResults, LocalSearchIndex
+from backend.utils.ranking import tokenize
+
+TAXONOMY_PATTERN = re.compile(r"^Taxonomy: (.*)$", re.MULTILINE)
+ATTEMPT_PATTERN = re.compile(r"<Attempt (\d+)>")
+RESULT_PATTERN = re.compile(r"Result #(\d+)")
+FANOUT_PATTERN = re.compile(r"return (\d+) searches")
+CURRENT_RESULTS_HEADER = "Current Search Results:"
+
+# Filler vocabulary of the synthetic documents
+VOCABULARY = (
+    "relief loss group subsidiary company claim period profit allowance capital interest deduction "
+    "election return payment liability rate threshold income expense asset transfer partnership trust "
+    "residence treaty withholding dividend distribution charge exemption scheme credit adjustment"
+).split()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token), cheap enough to run on every fake call"""
+    return max(1, len(text) // 4)
+
+
+def messages_text(messages: List[Dict[str, str]]) -> str:
+    return "\n".join(message["content"] for message in messages)
+
+
+class FakeLatency:
+    """
+    Simulated service time of a call.
+
+    Parameters
+    ----------
+    base : float
+        Fixed seconds per call (network round trip, queueing)
+    input_tokens_per_second : float | None
+        Prompt processing rate; None makes input free
+    output_tokens_per_second : float | None
+        Generation rate; None makes output free
+    """
+
+    def __init__(self, base: float = 0.0, input_tokens_per_second: float | None = None,
+                 output_tokens_per_second: float | None = None):
+        self.base = base
+        self.input_tokens_per_second = input_tokens_per_second
+        self.output_tokens_per_second = output_tokens_per_second
+
+    def seconds(self, input_tokens: int = 0, output_tokens: int = 0) -> float:
+        seconds = self.base
+        if self.input_tokens_per_second:
+            seconds += input_tokens / self.input_tokens_per_second
+        if self.output_tokens_per_second:
+            seconds += output_tokens / self.output_tokens_per_second
+        return seconds
+
+
+class FakeMessage:
+    """The parts of a LangChain ``AIMessage``/``AIMessageChunk`` the agents read"""
+
+    def __init__(self, content: str = "", input_tokens: int = 0, output_tokens: int = 0, usage: bool = True):
+        self.content = content
+        self.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_token_details": {"cache_read": 0},
+        } if usage else None
+        self.response_metadata = {}
+
+
+class FakeChatModel:
+    """
+    Deterministic chat model answering the repo's structured-output schemas.
+
+    Parameters
+    ----------
+    taxonomies : int
+        Number of taxonomies returned by the taxonomy extraction
+    review_script : Sequence[str]
+        Review decisions by attempt ("retry" or "finalize"); the last one repeats
+    valid_per_review : int
+        Number of current results each review marks valid; the rest are invalid
+    answer_tokens : int
+        Length of the streamed final answer
+    latency : FakeLatency
+        Service time of every call
+    stream_chunk_tokens : int
+        Tokens per streamed answer chunk
+    """
+
+    def __init__(self, taxonomies: int = 3, review_script: Sequence[str] = ("retry", "finalize"),
+                 valid_per_review: int = 2, answer_tokens: int = 300, latency: FakeLatency | None = None,
+                 stream_chunk_tokens: int = 5):
+        self.taxonomies = taxonomies
+        self.review_script = tuple(review_script)
+        self.valid_per_review = valid_per_review
+        self.answer_tokens = answer_tokens
+        self.latency = latency or FakeLatency()
+        self.stream_chunk_tokens = stream_chunk_tokens
+        self.calls: Dict[str, int] = {}
+
+    def with_structured_output(self, schema, include_raw: bool = False) -> "FakeStructuredModel":
+        return FakeStructuredModel(self, schema, include_raw)
+
+    async def ainvoke(self, messages: List[Dict[str, str]]) -> FakeMessage:
+        prompt_tokens = estimate_tokens(messages_text(messages))
+        await asyncio.sleep(self.latency.seconds(prompt_tokens, self.answer_tokens))
+        self.__count("answer")
+        return FakeMessage(self.__answer(self.answer_tokens), prompt_tokens, self.answer_tokens)
+
+    async def astream(self, messages: List[Dict[str, str]]):
+        """Stream the answer in chunks, paced by the output rate, then a usage-only chunk"""
+        prompt_tokens = estimate_tokens(messages_text(messages))
+        self.__count("answer")
+        await asyncio.sleep(self.latency.seconds(prompt_tokens, 0))
+        words = self.__answer(self.answer_tokens).split(" ")
+        for start in range(0, len(words), self.stream_chunk_tokens):
+            chunk = words[start:start + self.stream_chunk_tokens]
+            await asyncio.sleep(self.latency.seconds(0, len(chunk)) - self.latency.base)
+            yield FakeMessage(" ".join(chunk) + " ", usage=False)
+        yield FakeMessage("", prompt_tokens, self.answer_tokens)
+
+    def respond(self, schema_name: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Field values of the structured response for a schema, derived from the prompt"""
+        self.__count(schema_name)
+        text = messages_text(messages)
+        taxonomy_match = TAXONOMY_PATTERN.search(text)
+        taxonomy = taxonomy_match.group(1).strip() if taxonomy_match else ""
+        attempt = max((int(number) for number in ATTEMPT_PATTERN.findall(text)), default=0)
+
+        if schema_name == "TaxonomyExtraction":
+            return {
+                "taxonomies": [synthetic_taxonomy(index) for index in range(self.taxonomies)],
+                "reasoning": f"The question spans {self.taxonomies} areas.",
+            }
+        if schema_name == "SearchPromptResponse":
+            return {"search_query": f"{taxonomy} {VOCABULARY[attempt % len(VOCABULARY)]}", "filter": None}
+        if schema_name == "MultiSearchPromptResponse":
+            fanout = int(FANOUT_PATTERN.search(text).group(1)) if FANOUT_PATTERN.search(text) else 1
+            return {"searches": [
+                {"search_query": f"{taxonomy} {VOCABULARY[(attempt * fanout + index) % len(VOCABULARY)]}", "filter": None}
+                for index in range(fanout)
+            ]}
+        if schema_name == "ReviewDecision":
+            current = text.split(CURRENT_RESULTS_HEADER, 1)[-1]
+            indices = sorted({int(index) for index in RESULT_PATTERN.findall(current)})
+            return {
+                "thought_process": f"Attempt {attempt + 1}: {len(indices)} results reviewed for {taxonomy}.",
+                "valid_results": indices[:self.valid_per_review],
+                "invalid_results": indices[self.valid_per_review:],
+                "decision": self.review_script[min(attempt, len(self.review_script) - 1)],
+            }
+        raise ValueError(f"FakeChatModel has no response for schema '{schema_name}'")
+
+    def __count(self, call_name: str) -> None:
+        self.calls[call_name] = self.calls.get(call_name, 0) + 1
+
+    @staticmethod
+    def __answer(tokens: int) -> str:
+        return " ".join(VOCABULARY[index % len(VOCABULARY)] for index in range(tokens))
+
+
+class FakeStructuredModel:
+    """What ``FakeChatModel.with_structured_output`` returns"""
+
+    def __init__(self, parent: FakeChatModel, schema, include_raw: bool):
+        self.__parent = parent
+        self.__schema = schema
+        self.__include_raw = include_raw
+
+    async def ainvoke(self, messages: List[Dict[str, str]]):
+        parsed = self.__schema(**self.__parent.respond(self.__schema.__name__, messages))
+        prompt_tokens = estimate_tokens(messages_text(messages))
+        completion_tokens = estimate_tokens(json.dumps(parsed.model_dump()))
+        await asyncio.sleep(self.__parent.latency.seconds(prompt_tokens, completion_tokens))
+        if not self.__include_raw:
+            return parsed
+        return {"raw": FakeMessage("", prompt_tokens, completion_tokens), "parsed": parsed, "parsing_error": None}
+
+
+class FakeEmbeddings:
+    """
+    Bag-of-words embeddings: the normalized sum of a fixed random vector per token.
+
+    Texts sharing words get similar vectors, which is enough for the vector side
+    of the synthetic search to behave like a real one.
+
+    Parameters
+    ----------
+    dimensions : int
+        Vector dimensions
+    latency : FakeLatency
+        Service time of every embeddings request
+    """
+
+    def __init__(self, dimensions: int = 256, latency: FakeLatency | None = None):
+        self.dimensions = dimensions
+        self.latency = latency or FakeLatency()
+        self.calls = 0
+
+    def embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in tokenize(text) or [text]:
+            vector += token_vector(token, self.dimensions)
+        return (vector / max(float(np.linalg.norm(vector)), 1e-12)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        await asyncio.sleep(self.latency.seconds(estimate_tokens(text)))
+        return self.embed(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        await asyncio.sleep(self.latency.seconds(sum(estimate_tokens(text) for text in texts)))
+        return self.embed_documents(texts)
+
+
+@lru_cache(maxsize=None)
+def token_vector(token: str, dimensions: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(token.encode()).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+
+
+class FakeSearchClient(AsyncLocalSearchClient):
+    """Async local search client that adds a fixed latency per query and counts the queries"""
+
+    def __init__(self, index: LocalSearchIndex, latency: FakeLatency | None = None):
+        super().__init__(index)
+        self.latency = latency or FakeLatency()
+        self.calls = 0
+
+    async def search(self, search_text: str | None = None, **kwargs) -> AsyncSearchResults:
+        self.calls += 1
+        await asyncio.sleep(self.latency.seconds())
+        return await super().search(search_text, **kwargs)
+
+
+def synthetic_taxonomy(index: int) -> str:
+    return f"Taxonomy {index + 1}"
+
+
+def synthetic_corpus(documents_per_taxonomy: int, taxonomies: int, embeddings: FakeEmbeddings,
+                     words: int = 120, seed: int = 0) -> LocalSearchIndex:
+    """
+    In-memory index of synthetic chunks, each about one taxonomy.
+
+    Parameters
+    ----------
+    documents_per_taxonomy : int
+        Chunks written for every taxonomy
+    taxonomies : int
+        Number of taxonomies covered, matching ``synthetic_taxonomy`` names
+    embeddings : FakeEmbeddings
+        Embeddings used for the chunk vectors (and later for the queries)
+    words : int
+        Approximate length of a chunk in words
+    seed : int
+        Seed of the filler text
+
+    Returns
+    -------
+    LocalSearchIndex
+        The populated index
+    """
+    rng = np.random.default_rng(seed)
+    index = LocalSearchIndex()
+    documents = []
+    for taxonomy_index in range(taxonomies):
+        taxonomy = synthetic_taxonomy(taxonomy_index)
+        for document_index in range(documents_per_taxonomy):
+            content = f"{taxonomy}. " + " ".join(rng.choice(VOCABULARY, size=words))
+            documents.append({
+                "id": f"t{taxonomy_index}-d{document_index}",
+                "content": content,
+                "source_file": f"{taxonomy.lower().replace(' ', '_')}.pdf",
+                "taxonomy": taxonomy,
+                "created_date": "2025-01-01T00:00:00+00:00",
+                "content_vector": embeddings.embed(content),
+            })
+    index.upload_documents(documents)
+    return index
+
+
+def install_fakes(chat_model: FakeChatModel, embeddings: FakeEmbeddings) -> None:
+    """Have agents built afterwards, directly or by the graph registry, use the fakes"""
+    from backend.agents.main.registry import graph_registry
+    from backend.utils.llm import LLM, ModelClients
+
+    clients = ModelClients(chat=chat_model, embeddings=embeddings)
+    LLM._default_clients = clients
+    graph_registry.model_clients_factory = lambda: clients
@@ -0,0 +1,101 @@
+"""
+Measurement helpers shared by the offline benchmarks.
+
+- ``LoopLagMonitor`` measures how late a periodic timer fires on the running
+  event loop, i.e. how long synchronous work blocked it.
+- ``NodeTimer`` is a LangChain callback handler that records the duration of
+  every LangGraph node run, including nodes of subgraphs.
+"""
+
+from typing import Dict, List
+from uuid import UUID
+import asyncio
+import time
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+class LoopLagMonitor:
+    """
+    Async context manager sampling event-loop lag while it is active.
+
+    Parameters
+    ----------
+    interval : float
+        Seconds between samples; a sample's lag is how much later than
+        ``interval`` the loop got back to it
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self.__task = None
+
+    async def __aenter__(self) -> "LoopLagMonitor":
+        self.__task = asyncio.create_task(self.__run())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.__task.cancel()
+        try:
+            await self.__task
+        except asyncio.CancelledError:
+            pass
+
+    async def __run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - expected))
+
+    def stats(self) -> Dict[str, float]:
+        """Lag percentiles and the total lag, in milliseconds"""
+        return {
+            "p50_ms": percentile(self.lags, 50) * 1000,
+            "p99_ms": percentile(self.lags, 99) * 1000,
+            "max_ms": max(self.lags, default=0.0) * 1000,
+            "total_ms": sum(self.lags) * 1000,
+        }
+
+
+class NodeTimer(BaseCallbackHandler):
+    """Callback handler collecting wall time per LangGraph node.
+
+    Pass it in the run config (``{"callbacks": [timer]}``). A node run is the
+    chain whose run name equals its ``langgraph_node`` metadata; the callable it
+    wraps often carries the same name and is not counted again.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = {}
+        self.__active: Dict[UUID, tuple] = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: UUID | None = None,
+                       metadata: Dict | None = None, **kwargs) -> None:
+        node = (metadata or {}).get("langgraph_node")
+        if node is None or kwargs.get("name") != node:
+            return
+        parent = self.__active.get(parent_run_id)
+        if parent is not None and parent[0] == node:
+            return
+        self.__active[run_id] = (node, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs) -> None:
+        self.__finish(run_id)
+
+    def on_chain_error(self, error, *, run_id: UUID, **kwargs) -> None:
+        self.__finish(run_id)
+
+    def __finish(self, run_id: UUID) -> None:
+        started = self.__active.pop(run_id, None)
+        if started is not None:
+            node, start = started
+            self.durations.setdefault(node, []).append(time.perf_counter() - start)
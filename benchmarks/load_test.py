@@ -0,0 +1,479 @@
+"""
+Load-test the FastAPI app with concurrent conversations against deterministic fakes.
+
+Starts the real app (``backend:app``) under uvicorn in a child process with one
+worker. Before the graph is built, the child installs the fakes from
+``benchmarks/fakes.py``: the chat model, the embeddings and a search client over a
+synthetic corpus. The parent then drives one endpoint per stage:
+
+- ``process``: ``POST /process``, timed until the JSON answer arrives;
+- ``stream``: ``POST /process/stream``, timed until the ``result`` event, with
+  the time to the first answer token;
+- ``ws``: a conversation as the UI runs it. It opens ``/ws/results`` for a new
+  session, posts the question to ``/process`` with that session, and is timed
+  until the ``final_answer`` message arrives on the socket, with the time to the
+  first update.
+
+Requests arrive either from ``--concurrency`` clients that send their next
+question as soon as they get an answer (closed loop), or at ``--rate`` requests
+per second with exponential inter-arrival times, regardless of how many are still
+in flight (open loop). Every stage lasts ``--duration`` seconds and then waits
+for its requests to finish.
+
+For every stage the test reports throughput, p50/p95/p99 latency, errors, the
+server's event-loop lag, its peak open sockets and its resident memory growth.
+The server-side numbers come from a sampler running inside the child. The
+``--max-*`` / ``--min-*`` thresholds make the process exit with status 1 when a
+stage misses them, so the test can gate CI.
+
+The answer, taxonomy and search caches are disabled unless ``--warm-caches`` is
+given. The synthetic questions are near-duplicates and would otherwise be
+answered from cache.
+
+Usage:
+    python benchmarks/load_test.py --endpoint process stream ws --concurrency 1 8 32 64 \
+        --duration 20 --llm-latency 0.2 --output-tps 80 --max-p95 10 --max-lag-p99 100
+    python benchmarks/load_test.py --endpoint stream --rate 2 5 10 --duration 30 --json load.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import itertools
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from harness import LoopLagMonitor, percentile
+
+STATS_PATH = "/_load_test/stats"
+STAGE_PATH = "/_load_test/stage"
+
+
+def resident_mb() -> float:
+    """Current resident set size of this process, or its peak where /proc is not available"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def open_sockets() -> int | None:
+    """Sockets currently open in this process (Linux only)"""
+    try:
+        descriptors = os.listdir("/proc/self/fd")
+    except OSError:
+        return None
+    count = 0
+    for descriptor in descriptors:
+        with contextlib.suppress(OSError):
+            if os.readlink(f"/proc/self/fd/{descriptor}").startswith("socket:"):
+                count += 1
+    return count
+
+
+class ServerSampler:
+    """
+    Samples the server process during a stage: event-loop lag, open sockets and memory.
+
+    Parameters
+    ----------
+    interval : float
+        Seconds between socket and memory samples
+    """
+
+    def __init__(self, interval: float = 0.25):
+        self.interval = interval
+        self.monitor = LoopLagMonitor()
+        self.rss_start = resident_mb()
+        self.rss_peak = self.rss_start
+        self.sockets_peak = open_sockets()
+        self.__task = None
+
+    async def start(self) -> None:
+        await self.monitor.__aenter__()
+        self.__task = asyncio.create_task(self.__run())
+
+    async def stop(self) -> None:
+        self.__task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self.__task
+        await self.monitor.__aexit__(None, None, None)
+
+    async def __run(self) -> None:
+        while True:
+            self.__sample()
+            await asyncio.sleep(self.interval)
+
+    def __sample(self) -> None:
+        self.rss_peak = max(self.rss_peak, resident_mb())
+        sockets = open_sockets()
+        if sockets is not None:
+            self.sockets_peak = max(self.sockets_peak or 0, sockets)
+
+    def stats(self) -> dict:
+        self.__sample()
+        # Collect first so memory still held after the stage is what the requests left behind
+        gc.collect()
+        return {
+            "lag": self.monitor.stats(),
+            "sockets_peak": self.sockets_peak,
+            "sockets_now": open_sockets(),
+            "rss_start_mb": self.rss_start,
+            "rss_peak_mb": self.rss_peak,
+            "rss_end_mb": resident_mb(),
+            "tasks": len(asyncio.all_tasks()),
+        }
+
+
+def serve(args) -> None:
+    """Run the app with the fakes installed; this is the child process"""
+    os.environ.setdefault("K_NEAREST_NEIGHBORS", "30")
+    os.environ.setdefault("NUM_SEARCH_RESULTS", "5")
+    os.environ["MAX_ATTEMPTS"] = str(args.max_attempts)
+    # Build the graph before serving so the first stage does not pay for it
+    os.environ["STARTUP_MODE"] = "eager"
+    if not args.warm_caches:
+        os.environ["ANSWER_CACHE_ENABLED"] = "false"
+        os.environ["TAXONOMY_CACHE_ENABLED"] = "false"
+        os.environ["SEARCH_CACHE_ENABLED"] = "false"
+
+    import uvicorn
+    from fakes import FakeChatModel, FakeEmbeddings, FakeLatency, FakeSearchClient, install_fakes, synthetic_corpus
+
+    from backend import app
+    from backend.agents.main.registry import graph_registry
+
+    embeddings = FakeEmbeddings(args.dimensions, FakeLatency(args.embedding_latency))
+    install_fakes(
+        FakeChatModel(
+            taxonomies=args.taxonomies,
+            review_script=args.review_script.split(","),
+            valid_per_review=args.valid_per_review,
+            answer_tokens=args.answer_tokens,
+            latency=FakeLatency(args.llm_latency, args.input_tps, args.output_tps),
+        ),
+        embeddings,
+    )
+    corpus = synthetic_corpus(args.documents, args.taxonomies, embeddings)
+    # The registry builds the agents at startup; their searches go to the synthetic corpus
+    graph_registry.search_client_factory = lambda: FakeSearchClient(corpus, FakeLatency(args.search_latency))
+
+    sampler = None
+
+    @app.post(STAGE_PATH)
+    async def start_stage():
+        nonlocal sampler
+        if sampler is not None:
+            await sampler.stop()
+        gc.collect()
+        sampler = ServerSampler()
+        await sampler.start()
+        return {"rss_mb": sampler.rss_start}
+
+    @app.get(STATS_PATH)
+    async def stage_stats():
+        return sampler.stats() if sampler is not None else {}
+
+    uvicorn.run(app, host="127.0.0.1", port=args.port, workers=1, log_level="warning", access_log=False)
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@contextlib.contextmanager
+def server_process(args):
+    """Start the child server and yield its base URL once it answers"""
+    port = free_port()
+    command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--serve", "--port", str(port)]
+    # The agents log every update and LLM call; keep that out of the report unless asked for
+    process = subprocess.Popen(command, stdout=None if args.verbose else subprocess.DEVNULL)
+    try:
+        yield f"127.0.0.1:{port}", process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def wait_until_ready(client, base_url: str, process, timeout: float = 120.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        with contextlib.suppress(Exception):
+            response = await client.get(f"http://{base_url}{STATS_PATH}")
+            if response.status_code == 200:
+                return
+        await asyncio.sleep(0.25)
+    raise TimeoutError(f"Server did not start within {timeout:.0f}s")
+
+
+async def ask_process(client, base_url: str, question: str, session_id: str | None = None) -> None:
+    response = await client.post(f"http://{base_url}/process",
+                                 json={"user_input": question, "history": "", "session_id": session_id})
+    response.raise_for_status()
+
+
+async def ask_stream(client, base_url: str, question: str) -> float | None:
+    """Stream one answer; returns the seconds until its first token"""
+    start = time.perf_counter()
+    first_token = None
+    event = None
+    async with client.stream("POST", f"http://{base_url}/process/stream",
+                             json={"user_input": question, "history": ""}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                if event == "token" and first_token is None:
+                    first_token = time.perf_counter() - start
+            elif line.startswith("data: ") and event == "error":
+                raise RuntimeError(json.loads(line[len("data: "):])["error"])
+            elif line.startswith("data: ") and event == "result":
+                return first_token
+    raise RuntimeError("Stream ended without a result event")
+
+
+async def ask_websocket(client, base_url: str, question: str) -> float | None:
+    """Run one conversation over /ws/results; returns the seconds until its first update"""
+    import websockets
+
+    session_id = uuid.uuid4().hex
+    start = time.perf_counter()
+    first_update = None
+
+    async with websockets.connect(f"ws://{base_url}/ws/results?session_id={session_id}") as updates:
+        async def final_answer():
+            nonlocal first_update
+            async for message in updates:
+                if first_update is None:
+                    first_update = time.perf_counter() - start
+                if json.loads(message).get("message_type") == "final_answer":
+                    return
+            raise RuntimeError("Socket closed before the final answer")
+
+        waiter = asyncio.create_task(final_answer())
+        try:
+            await ask_process(client, base_url, question, session_id)
+            await waiter
+        finally:
+            waiter.cancel()
+    return first_update
+
+
+SCENARIOS = {
+    "process": lambda client, base_url, question: ask_process(client, base_url, question),
+    "stream": ask_stream,
+    "ws": ask_websocket,
+}
+
+
+async def run_stage(args, client, base_url: str, endpoint: str, concurrency: int | None, rate: float | None) -> dict:
+    """
+    Drive one endpoint for ``args.duration`` seconds and collect client and server statistics.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Test settings
+    client : httpx.AsyncClient
+        Shared HTTP client
+    base_url : str
+        Host and port of the server
+    endpoint : str
+        Scenario name, a key of ``SCENARIOS``
+    concurrency : int | None
+        Closed-loop clients; used when ``rate`` is None
+    rate : float | None
+        Open-loop arrivals per second
+
+    Returns
+    -------
+    dict
+        Latencies, first-event times, error count and the server's stage statistics
+    """
+    scenario = SCENARIOS[endpoint]
+    numbers = itertools.count()
+    latencies, first_events, errors = [], [], []
+    loop = asyncio.get_running_loop()
+
+    async def one_request():
+        question = f"{args.question} (request {next(numbers)})"
+        start = time.perf_counter()
+        try:
+            first_event = await asyncio.wait_for(scenario(client, base_url, question), args.timeout)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+            return
+        latencies.append(time.perf_counter() - start)
+        if first_event is not None:
+            first_events.append(first_event)
+
+    await client.post(f"http://{base_url}{STAGE_PATH}")
+    start = time.perf_counter()
+    deadline = loop.time() + args.duration
+    if rate is not None:
+        generator = random.Random(args.seed)
+        in_flight = set()
+        while loop.time() < deadline:
+            task = asyncio.create_task(one_request())
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            await asyncio.sleep(generator.expovariate(rate))
+        await asyncio.gather(*in_flight)
+    else:
+        async def client_loop():
+            while loop.time() < deadline:
+                await one_request()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    server = (await client.get(f"http://{base_url}{STATS_PATH}")).json()
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "rate": rate,
+        "elapsed": elapsed,
+        "completed": len(latencies),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "throughput": len(latencies) / elapsed,
+        "latency": {f"p{q}": percentile(latencies, q) for q in (50, 95, 99)},
+        "first_event_p50": percentile(first_events, 50) if first_events else None,
+        "server": server,
+    }
+
+
+async def run(args) -> list:
+    import httpx
+
+    loads = [(None, rate) for rate in args.rate] if args.rate else [(concurrency, None) for concurrency in args.concurrency]
+    results = []
+    with server_process(args) as (base_url, process):
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+            await wait_until_ready(client, base_url, process)
+            for endpoint in args.endpoint:
+                for concurrency, rate in loads:
+                    result = await run_stage(args, client, base_url, endpoint, concurrency, rate)
+                    results.append(result)
+                    print_result(result)
+    return results
+
+
+def print_header() -> None:
+    print(f"{'endpoint':>8} {'load':>8} {'done':>6} {'errors':>6} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+          f"{'first s':>7} {'lag p99 ms':>10} {'lag max ms':>10} {'sockets':>7} {'rss +MB':>8}")
+
+
+def print_result(result: dict) -> None:
+    server = result["server"]
+    load = f"{result['rate']:g}/s" if result["rate"] is not None else f"{result['concurrency']}c"
+    first_event = f"{result['first_event_p50']:.2f}" if result["first_event_p50"] is not None else "-"
+    sockets = server["sockets_peak"] if server["sockets_peak"] is not None else "-"
+    print(f"{result['endpoint']:>8} {load:>8} {result['completed']:>6} {result['errors']:>6} {result['throughput']:>7.2f} "
+          f"{result['latency']['p50']:>7.2f} {result['latency']['p95']:>7.2f} {result['latency']['p99']:>7.2f} "
+          f"{first_event:>7} {server['lag']['p99_ms']:>10.1f} {server['lag']['max_ms']:>10.1f} {sockets:>7} "
+          f"{server['rss_end_mb'] - server['rss_start_mb']:>8.1f}")
+    for sample in result["error_samples"]:
+        print(f"{'':>8} error: {sample}")
+
+
+def check_thresholds(args, results: list) -> list:
+    """Threshold violations of every stage, as messages"""
+    failures = []
+    for result in results:
+        stage = f"{result['endpoint']} at {result['rate']}/s" if result["rate"] is not None else f"{result['endpoint']} x{result['concurrency']}"
+        total = result["completed"] + result["errors"]
+        checks = [
+            (args.max_p95, result["latency"]["p95"], "p95 latency", "s", False),
+            (args.max_p99, result["latency"]["p99"], "p99 latency", "s", False),
+            (args.min_throughput, result["throughput"], "throughput", " req/s", True),
+            (args.max_error_rate, result["errors"] / total if total else 1.0, "error rate", "", False),
+            (args.max_lag_p99, result["server"]["lag"]["p99_ms"], "event-loop lag p99", " ms", False),
+        ]
+        for limit, value, name, unit, minimum in checks:
+            if limit is not None and (value < limit if minimum else value > limit):
+                failures.append(f"{stage}: {name} {value:.3f}{unit} {'below' if minimum else 'above'} {limit}{unit}")
+    if args.max_memory_growth is not None and results:
+        growth = results[-1]["server"]["rss_end_mb"] - results[0]["server"]["rss_start_mb"]
+        if growth > args.max_memory_growth:
+            failures.append(f"server memory grew {growth:.1f} MB over the run, above {args.max_memory_growth} MB")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", nargs="+", choices=sorted(SCENARIOS), default=["process", "stream", "ws"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32], help="Closed-loop clients per stage")
+    parser.add_argument("--rate", type=float, nargs="+", default=None,
+                        help="Open-loop arrivals per second per stage (replaces --concurrency)")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds of arrivals per stage")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds before a request counts as an error")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the open-loop arrival times")
+    parser.add_argument("--question", default="Can a UK group claim relief for losses of an EU subsidiary?")
+    parser.add_argument("--warm-caches", action="store_true", help="Keep the answer, taxonomy and search caches enabled")
+    parser.add_argument("--json", help="Also write the results to this file")
+
+    fakes = parser.add_argument_group("fakes")
+    fakes.add_argument("--taxonomies", type=int, default=3)
+    fakes.add_argument("--max-attempts", type=int, default=3)
+    fakes.add_argument("--review-script", default="retry,finalize",
+                       help="Review decisions by attempt, comma separated; the last one repeats")
+    fakes.add_argument("--valid-per-review", type=int, default=2)
+    fakes.add_argument("--answer-tokens", type=int, default=300)
+    fakes.add_argument("--llm-latency", type=float, default=0.1, help="Seconds per LLM call")
+    fakes.add_argument("--input-tps", type=float, default=None, help="Prompt tokens per second (default: free)")
+    fakes.add_argument("--output-tps", type=float, default=None, help="Generated tokens per second (default: free)")
+    fakes.add_argument("--embedding-latency", type=float, default=0.02)
+    fakes.add_argument("--search-latency", type=float, default=0.03)
+    fakes.add_argument("--documents", type=int, default=200, help="Synthetic chunks per taxonomy")
+    fakes.add_argument("--dimensions", type=int, default=256, help="Fake embedding dimensions")
+
+    thresholds = parser.add_argument_group("thresholds (exit status 1 when a stage misses one)")
+    thresholds.add_argument("--max-p95", type=float, help="Seconds")
+    thresholds.add_argument("--max-p99", type=float, help="Seconds")
+    thresholds.add_argument("--min-throughput", type=float, help="Completed requests per second")
+    thresholds.add_argument("--max-error-rate", type=float, help="Fraction of requests")
+    thresholds.add_argument("--max-lag-p99", type=float, help="Server event-loop lag, milliseconds")
+    thresholds.add_argument("--max-memory-growth", type=float, help="Server RSS growth over the whole run, MB")
+
+    parser.add_argument("--verbose", action="store_true", help="Show the server's own logging")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    print_header()
+    results = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+    failures = check_thresholds(args, results)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -42,9 +42,15 @@ from azure.core.credentials import AzureKeyCredential
 import tiktoken
 from dotenv import load_dotenv 
 import requests
+import sys
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Before importing backend, whose modules read settings (and fill gaps from example.env) on import
 load_dotenv()
 
+from backend.utils.embeddings import EMBEDDING_DIMENSIONS, SHORT_VECTOR_FIELD, search_vector_dimensions
+
 
 ai_search_endpoint = os.environ["AZURE_SEARCH_ENDPOINT"]
 ai_search_key = os.environ["AZURE_SEARCH_KEY"]
@@ -85,10 +91,20 @@ def create_index():
             name="content_vector",
             type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
             searchable=True,
-            vector_search_dimensions=3072,
+            vector_search_dimensions=EMBEDDING_DIMENSIONS,
             vector_search_profile_name="myHnswProfile"
         ),
     ]
+    vector_dimensions = search_vector_dimensions()
+    if vector_dimensions:
+        # Truncated copy of content_vector searched first; content_vector rescores the shortlist
+        fields.append(SearchField(
+            name=SHORT_VECTOR_FIELD,
+            type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
+            searchable=True,
+            vector_search_dimensions=vector_dimensions,
+            vector_search_profile_name="myHnswProfile"
+        ))
 
     vector_search = VectorSearch(
         algorithms=[
@@ -5,6 +5,7 @@ chunks them while maintaining page context, and uploads to Azure Cognitive Searc
 """
 
 import os
+import sys
 import hashlib
 from typing import List, Dict, Any
 from dotenv import load_dotenv
@@ -21,15 +22,23 @@ import json
 from datetime import datetime, timezone
 from langchain_openai import AzureOpenAIEmbeddings
 
-# Load environment variables
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Load environment variables, before importing backend, whose modules read settings (and fill
+# gaps from example.env) on import
 load_dotenv()
 
+from backend.utils.embeddings import search_vector_dimensions, truncate_embedding, SHORT_VECTOR_FIELD
+from backend.utils.local_search import LocalSearchClient, get_local_index, LOCAL_SEARCH_PATH
+
 # Azure Configuration
 STORAGE_ACCOUNT_NAME = os.environ.get("STORAGE_ACCOUNT_NAME")
 STORAGE_ACCOUNT_CONTAINER = os.environ.get("STORAGE_ACCOUNT_CONTAINER")
 AI_SEARCH_ENDPOINT = os.environ.get("AZURE_SEARCH_ENDPOINT")
 AI_SEARCH_KEY = os.environ.get("AZURE_SEARCH_KEY")
 AI_SEARCH_INDEX = os.environ.get("AZURE_SEARCH_INDEX")
+# "local" indexes into the in-process search index saved under LOCAL_SEARCH_PATH instead of Azure AI Search
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "azure")
 
 aoai_endpoint = os.environ.get("AOAI_ENDPOINT")
 aoai_key = os.environ.get("AOAI_KEY")
@@ -71,11 +80,14 @@ class DocumentProcessor:
         """
         self.doc_intelligence_client = get_document_intelligence_client()
         self.blob_service_client = get_blob_service_client()
-        self.search_client = SearchClient(
-            AI_SEARCH_ENDPOINT,
-            AI_SEARCH_INDEX,
-            AzureKeyCredential(AI_SEARCH_KEY)
-        )
+        if SEARCH_BACKEND == "local":
+            self.search_client = LocalSearchClient(get_local_index(LOCAL_SEARCH_PATH))
+        else:
+            self.search_client = SearchClient(
+                AI_SEARCH_ENDPOINT,
+                AI_SEARCH_INDEX,
+                AzureKeyCredential(AI_SEARCH_KEY)
+            )
         
         print("\nDocument processor initialized")
         print("Using dynamic metadata assignment for each document")
@@ -265,6 +277,10 @@ class DocumentProcessor:
                 "sensitivity_label": sensitivity_label,
                 "created_date": datetime.now(timezone.utc).isoformat()
             }
+            # The local index searches the leading dimensions of content_vector itself
+            vector_dimensions = search_vector_dimensions()
+            if vector_dimensions and SEARCH_BACKEND != "local":
+                document[SHORT_VECTOR_FIELD] = truncate_embedding(content_vector, vector_dimensions)
             documents.append(document)
 
         # Upload chunks to search index
@@ -274,6 +290,8 @@ class DocumentProcessor:
         for i in range(0, len(documents), batch_size):
             batch = documents[i:i+batch_size]
             self.search_client.upload_documents(batch)
+        if SEARCH_BACKEND == "local":
+            self.search_client.index.save()
         print(f"Successfully processed and indexed document: {source_id}")
 
     def process_all_documents(self) -> None: